@@ -16,4 +16,7 @@ from . import (
     tutor,
     bookmarks,
     notifications,
+    jobs,
+    avatars,
+    search,
 )
@@ -0,0 +1,44 @@
+"""Avatar image routes"""
+import re
+from flask import request, current_app
+from flask_login import login_required
+from app.services import avatar_service, blob_store
+from app.utils.response_utils import error_response, not_found_response
+
+from . import api_v1
+
+bp = api_v1
+
+_HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+# The URL names the content, so it can never change: let browsers keep it for a year
+IMMUTABLE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+
+@bp.route('/avatars/<avatar_hash>')
+@login_required
+def get_avatar(avatar_hash: str):
+    """Serve an avatar (or its nearest thumbnail with ?size=) from the blob store"""
+    try:
+        if not _HASH_RE.match(avatar_hash):
+            return not_found_response('Avatar')
+        
+        resolved = avatar_service.resolve(avatar_hash, request.args.get('size', type=int))
+        if not resolved:
+            return not_found_response('Avatar')
+        blob_hash, info = resolved
+        
+        # Strong ETag: the hash of the bytes being served
+        if blob_hash in request.if_none_match:
+            response = current_app.response_class(status=304)
+        else:
+            data = blob_store.get(blob_hash)
+            if data is None:
+                return not_found_response('Avatar')
+            response = current_app.response_class(data, mimetype=info.get('content_type') or 'application/octet-stream')
+        
+        response.set_etag(blob_hash)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+    except Exception as e:
+        current_app.logger.error(f"Failed to serve avatar: {str(e)}", exc_info=True)
+        return error_response('Failed to load avatar. Please try again.', 500)
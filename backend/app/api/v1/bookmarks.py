@@ -1,11 +1,13 @@
 """Bookmark API routes"""
 from flask import request, current_app
 from flask_login import login_required, current_user
-from typing import Dict, Any, Optional
-from mongoengine.errors import DoesNotExist
+from typing import Dict, Any, List, Optional
 
-from app.models import Bookmark, Submission, Resource, Flashcard
-from app.utils.response_utils import success_response, error_response, not_found_response
+from app.models import Bookmark, Submission, Course, Resource, Flashcard
+from app.utils.response_utils import success_response, paginated_response, error_response, not_found_response
+from app.utils.model_utils import ref_id
+from app.utils.pagination import paginate
+from app.exceptions.api_exceptions import ValidationError
 from . import api_v1
 
 bp = api_v1  # reuse blueprint namespace
@@ -15,8 +17,63 @@ MAX_NOTES_LENGTH = 1000
 MAX_EXTRA_DATA_SIZE = 10000
 
 
-def _serialize_bookmark(bookmark: Bookmark) -> Dict[str, Any]:
-    """Convert bookmark document to dict with related info."""
+def _prefetch_references(bookmarks: List[Bookmark]) -> Dict[str, Dict]:
+    """
+    Load everything the bookmarks point at with one projected id__in query per collection.
+
+    Returns {'submission': {id: doc}, 'course': {...}, 'resource': {...}, 'flashcard': {...}}
+    of raw documents; dangling references are simply absent from the maps.
+    """
+    ids = {'submission': set(), 'resource': set(), 'flashcard': set()}
+    for bookmark in bookmarks:
+        for kind in ids:
+            ref = ref_id(bookmark._data.get(f'{kind}_id'))
+            if ref:
+                ids[kind].add(ref)
+
+    def fetch(model, kind_ids, *fields):
+        if not kind_ids:
+            return {}
+        return {doc['_id']: doc for doc in model.objects(id__in=list(kind_ids)).only(*fields).as_pymongo()}
+
+    submissions = fetch(Submission, ids['submission'], 'assignment_title', 'course_id', 'status', 'submission_type')
+    course_ids = {doc['course_id'] for doc in submissions.values() if doc.get('course_id')}
+    return {
+        'submission': submissions,
+        'course': fetch(Course, course_ids, 'name'),
+        'resource': fetch(Resource, ids['resource'], 'title', 'category', 'resource_type', 'tags', 'url'),
+        'flashcard': fetch(Flashcard, ids['flashcard'], 'front', 'back'),
+    }
+
+
+def _serialize_bookmarks(bookmarks: List[Bookmark]) -> List[Dict[str, Any]]:
+    """Serialize bookmarks with their related info in a constant number of queries"""
+    refs = _prefetch_references(bookmarks)
+    data = []
+    for bookmark in bookmarks:
+        try:
+            data.append(_serialize_bookmark(bookmark, refs))
+        except Exception as e:
+            # Log error for individual bookmark but continue processing others
+            current_app.logger.error(f"Error serializing bookmark {bookmark.id}: {str(e)}", exc_info=True)
+            data.append({
+                'id': str(bookmark.id),
+                'type': bookmark.bookmark_type or 'unknown',
+                'title': 'Error loading bookmark',
+                'subtitle': '',
+                'link': '',
+                'notes': bookmark.notes or '',
+                'created_at': bookmark.created_at.isoformat() if bookmark.created_at else None,
+                'metadata': {},
+            })
+    return data
+
+
+def _serialize_bookmark(bookmark: Bookmark, refs: Optional[Dict[str, Dict]] = None) -> Dict[str, Any]:
+    """Convert bookmark document to dict with related info (refs from _prefetch_references)."""
+    if refs is None:
+        refs = _prefetch_references([bookmark])
+
     item = {
         'id': str(bookmark.id),
         'type': bookmark.bookmark_type,
@@ -24,150 +81,81 @@ def _serialize_bookmark(bookmark: Bookmark) -> Dict[str, Any]:
         'created_at': bookmark.created_at.isoformat() if bookmark.created_at else None,
     }
 
-    if bookmark.submission_id:
-        try:
-            try:
-                submission = bookmark.submission_id
-            except (DoesNotExist, AttributeError, TypeError):
-                submission = None
-            
-            if submission:
-                course_title = 'Submission'
-                try:
-                    if submission.course_id:
-                        course_title = getattr(submission.course_id, 'name', 'Submission')
-                except (DoesNotExist, AttributeError):
-                    pass
-                
-                item.update({
-                    'title': getattr(submission, 'assignment_title', 'Submission') or 'Submission',
-                    'subtitle': course_title,
-                    'link': f"/submissions/{submission.id}" if hasattr(submission, 'id') else '',
-                    'metadata': {
-                        'status': getattr(submission, 'status', 'unknown') or 'unknown',
-                        'submission_type': getattr(submission, 'submission_type', 'unknown') or 'unknown',
-                    },
-                })
-            else:
-                item.update({
-                    'title': 'Deleted Submission',
-                    'subtitle': 'Submission',
-                    'link': '',
-                    'metadata': {},
-                })
-        except Exception as e:
-            current_app.logger.error(f"Error serializing submission bookmark: {str(e)}", exc_info=True)
+    submission_ref = ref_id(bookmark._data.get('submission_id'))
+    resource_ref = ref_id(bookmark._data.get('resource_id'))
+    flashcard_ref = ref_id(bookmark._data.get('flashcard_id'))
+
+    if submission_ref:
+        submission = refs['submission'].get(submission_ref)
+        if submission:
+            course = refs['course'].get(submission.get('course_id')) or {}
             item.update({
-                'title': 'Submission (Error loading)',
+                'title': submission.get('assignment_title') or 'Submission',
+                'subtitle': course.get('name', 'Submission'),
+                'link': f"/submissions/{submission['_id']}",
+                'metadata': {
+                    'status': submission.get('status') or 'unknown',
+                    'submission_type': submission.get('submission_type') or 'unknown',
+                },
+            })
+        else:
+            item.update({
+                'title': 'Deleted Submission',
                 'subtitle': 'Submission',
                 'link': '',
                 'metadata': {},
             })
-    elif bookmark.resource_id:
-        try:
-            try:
-                resource = bookmark.resource_id
-            except (DoesNotExist, AttributeError, TypeError):
-                resource = None
-            
-            if resource:
-                item.update({
-                    'title': getattr(resource, 'title', 'Resource') or 'Resource',
-                    'subtitle': (getattr(resource, 'category', None) or getattr(resource, 'resource_type', None) or 'Resource'),
-                    'link': getattr(resource, 'url', '') or '',
-                    'metadata': {
-                        'resource_type': getattr(resource, 'resource_type', 'unknown') or 'unknown',
-                        'tags': getattr(resource, 'tags', []) or [],
-                    },
-                })
-            else:
-                item.update({
-                    'title': 'Deleted Resource',
-                    'subtitle': 'Resource',
-                    'link': '',
-                    'metadata': {},
-                })
-        except Exception as e:
-            current_app.logger.error(f"Error serializing resource bookmark: {str(e)}", exc_info=True)
+    elif resource_ref:
+        resource = refs['resource'].get(resource_ref)
+        if resource:
+            item.update({
+                'title': resource.get('title') or 'Resource',
+                'subtitle': resource.get('category') or resource.get('resource_type') or 'Resource',
+                'link': resource.get('url') or '',
+                'metadata': {
+                    'resource_type': resource.get('resource_type') or 'unknown',
+                    'tags': resource.get('tags') or [],
+                },
+            })
+        else:
             item.update({
-                'title': 'Resource (Error loading)',
+                'title': 'Deleted Resource',
                 'subtitle': 'Resource',
                 'link': '',
                 'metadata': {},
             })
-    elif bookmark.flashcard_id:
-        try:
-            # Safely get flashcard reference - it might be deleted
-            # Accessing a deleted reference can raise DoesNotExist
-            try:
-                flashcard = bookmark.flashcard_id
-            except (DoesNotExist, AttributeError, TypeError):
-                flashcard = None
-            
-            if flashcard is None:
-                # Reference exists but flashcard was deleted
-                item.update({
-                    'title': 'Deleted Flashcard',
-                    'subtitle': 'Flashcard',
-                    'link': '',
-                    'flashcard_id': None,
-                    'metadata': {},
-                })
-            else:
-                try:
-                    # Try to access flashcard properties
-                    flashcard_id = str(flashcard.id) if hasattr(flashcard, 'id') and flashcard.id else None
-                    front_text = getattr(flashcard, 'front', None)
-                    back_text = getattr(flashcard, 'back', None)
-                    
-                    # Safely process front text
-                    if front_text and isinstance(front_text, str):
-                        front_display = front_text.strip()[:120] if front_text.strip() else 'Flashcard'
-                        front_meta = front_text[:80]
-                    else:
-                        front_display = 'Flashcard'
-                        front_meta = ''
-                    
-                    # Safely process back text
-                    if back_text and isinstance(back_text, str):
-                        back_meta = back_text[:80]
-                    else:
-                        back_meta = ''
-                    
-                    item.update({
-                        'title': front_display,
-                        'subtitle': 'Flashcard',
-                        'link': '',
-                        'flashcard_id': flashcard_id,
-                        'metadata': {
-                            'front': front_meta,
-                            'back': back_meta,
-                        },
-                    })
-                except (AttributeError, TypeError, ValueError) as e:
-                    # Flashcard exists but properties are inaccessible
-                    current_app.logger.warning(f"Could not access flashcard properties: {str(e)}")
-                    try:
-                        flashcard_id = str(flashcard.id) if hasattr(flashcard, 'id') else None
-                    except:
-                        flashcard_id = None
-                    item.update({
-                        'title': 'Flashcard (Inaccessible)',
-                        'subtitle': 'Flashcard',
-                        'link': '',
-                        'flashcard_id': flashcard_id,
-                        'metadata': {},
-                    })
-        except Exception as e:
-            # Handle any other errors accessing flashcard reference
-            current_app.logger.error(f"Error serializing flashcard bookmark: {str(e)}", exc_info=True)
+    elif flashcard_ref:
+        flashcard = refs['flashcard'].get(flashcard_ref)
+        if flashcard is None:
+            # Reference exists but flashcard was deleted
             item.update({
-                'title': 'Flashcard (Error loading)',
+                'title': 'Deleted Flashcard',
                 'subtitle': 'Flashcard',
                 'link': '',
                 'flashcard_id': None,
                 'metadata': {},
             })
+        else:
+            front_text = flashcard.get('front')
+            back_text = flashcard.get('back')
+            if front_text and isinstance(front_text, str):
+                front_display = front_text.strip()[:120] if front_text.strip() else 'Flashcard'
+                front_meta = front_text[:80]
+            else:
+                front_display = 'Flashcard'
+                front_meta = ''
+            back_meta = back_text[:80] if back_text and isinstance(back_text, str) else ''
+
+            item.update({
+                'title': front_display,
+                'subtitle': 'Flashcard',
+                'link': '',
+                'flashcard_id': str(flashcard['_id']),
+                'metadata': {
+                    'front': front_meta,
+                    'back': back_meta,
+                },
+            })
     elif bookmark.extra_data:
         item.update({
             'title': bookmark.extra_data.get('title') or 'Saved conversation',
@@ -188,27 +176,16 @@ def _serialize_bookmark(bookmark: Bookmark) -> Dict[str, Any]:
 def list_bookmarks() -> Dict[str, Any]:
     """Return current user's bookmarks."""
     try:
-        bookmarks = Bookmark.objects(user_id=current_user).order_by('-created_at').limit(100)
-        data = []
-        for bookmark in bookmarks:
-            try:
-                serialized = _serialize_bookmark(bookmark)
-                data.append(serialized)
-            except Exception as e:
-                # Log error for individual bookmark but continue processing others
-                current_app.logger.error(f"Error serializing bookmark {bookmark.id}: {str(e)}", exc_info=True)
-                # Add a fallback entry for this bookmark
-                data.append({
-                    'id': str(bookmark.id),
-                    'type': bookmark.bookmark_type or 'unknown',
-                    'title': 'Error loading bookmark',
-                    'subtitle': '',
-                    'link': '',
-                    'notes': bookmark.notes or '',
-                    'created_at': bookmark.created_at.isoformat() if bookmark.created_at else None,
-                    'metadata': {},
-                })
-        return success_response({'data': data})
+        bookmarks, next_cursor = paginate(
+            Bookmark.objects(user_id=current_user).no_dereference(),
+            request.args.get('cursor'),
+            request.args.get('limit', type=int),
+            default_limit=100,
+        )
+        data = _serialize_bookmarks(bookmarks)
+        return paginated_response(data, next_cursor)
+    except ValidationError as e:
+        return error_response(e.message, 400)
     except Exception as e:
         current_app.logger.error(f"Failed to list bookmarks: {str(e)}", exc_info=True)
         return error_response('Failed to load bookmarks. Please try again.', 500)
@@ -1,12 +1,15 @@
 """Feedback generation routes"""
-from flask import request, current_app
+import json
+from flask import request, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
 from typing import Dict, Any
-from app.models import Submission, Feedback, PeerReview, Notification, User
-from app.utils.model_utils import get_submission_by_id, get_user_by_id
+from app.models import Submission, Feedback, PeerReview, User
+from app.utils.model_utils import get_submission_by_id
 from app.utils.response_utils import success_response, error_response, not_found_response, forbidden_response
 from app.utils.validation import validate_required_fields
-from app.services import ai_service, peer_matching_service
+from app.services import ai_service, peer_matching_service, feedback_job_service, notification_inbox
+from app.services.feedback_job_service import generate_and_store_feedback
+from app.services.submission_storage import submission_files_data, submission_content
 from app.exceptions.api_exceptions import ValidationError
 
 from . import api_v1
@@ -41,19 +44,7 @@ def generate_feedback() -> Dict[str, Any]:
         if current_user.role != 'teacher' and (not submission.user_id or str(submission.user_id.id) != str(current_user.id)):
             return forbidden_response('You do not have permission to generate feedback for this submission')
         
-        files = submission.files or []
-        files_data = [{
-            'filename': f.filename,
-            'content': f.file_content,
-            'file_type': f.file_type
-        } for f in files]
-        
-        feedback_text = ai_service.generate_feedback(
-            content=submission.content,
-            task_description=submission.task_description or '',
-            submission_type=submission.submission_type,
-            files=files_data
-        )
+        files_data = submission_files_data(submission)
         
         existing_feedback = Feedback.objects(
             submission_id=submission,
@@ -61,24 +52,34 @@ def generate_feedback() -> Dict[str, Any]:
             reviewer_id=None
         ).first()
         
-        if existing_feedback:
-            existing_feedback.delete()
+        # Unchanged submission: the cached response is what we already stored, so keep it
+        cached_text = ai_service.get_cached_feedback(
+            content=submission_content(submission),
+            task_description=submission.task_description or '',
+            submission_type=submission.submission_type,
+            files=files_data
+        )
+        if existing_feedback and cached_text is not None and existing_feedback.feedback_text == cached_text:
+            return success_response({
+                'feedback': cached_text,
+                'fresh': False,
+                'cached': True,
+                'job_id': None,
+                'status': 'completed',
+                'from_gemini': ai_service.use_gemini,
+                'peers_assigned': 0
+            })
         
         existing_peer_reviews = PeerReview.objects(submission_id=submission).count()
         
-        scores_dict = {
-            'correctness': ai_service.score_correctness(submission.content),
-            'quality': ai_service.score_quality(submission.content),
-            'completeness': ai_service.score_completeness(submission.content)
-        }
-        ai_feedback = Feedback(
-            submission_id=submission,
-            reviewer_id=None,
-            feedback_text=feedback_text,
-            feedback_type='ai'
-        )
-        ai_feedback.set_scores(scores_dict)
-        ai_feedback.save()
+        # A cache hit is cheap enough to store inline; anything else goes through the job queue
+        feedback_text = None
+        feedback_job = None
+        if cached_text is not None:
+            feedback_text = generate_and_store_feedback(submission).feedback_text
+        else:
+            feedback_job = feedback_job_service.enqueue(submission, requested_by=current_user)
+            feedback_job_service.ensure_workers(current_app._get_current_object())
         
         peers_assigned = 0
         if existing_peer_reviews == 0:
@@ -86,52 +87,42 @@ def generate_feedback() -> Dict[str, Any]:
                 submitter = submission.user_id
                 submitter_department = submitter.department if submitter else None
                 
-                # Ensure required IDs exist before calling match_peers
+                # Ensure required IDs exist before matching peers
                 peers = []
                 if not submission.user_id or not submission.course_id:
                     current_app.logger.warning(f"Submission {submission.id} missing user_id or course_id, skipping peer matching")
                 else:
-                    peers = peer_matching_service.match_peers(
-                        str(submission.id), str(submission.user_id.id),
-                        str(submission.course_id.id), submitter_department
-                    )
+                    peers = peer_matching_service.assign_reviewers(
+                        [submission], department=submitter_department
+                    ).get(str(submission.id), [])
+                peers_assigned = len(peers)
                 
                 # If no peers matched and self-review is enabled, create self-review
                 from app.config import ALLOW_SELF_REVIEW
-                if not peers:
-                    if ALLOW_SELF_REVIEW and submission.user_id:
-                        peers = [str(submission.user_id.id)]
-                
-                for peer_id in peers:
-                    reviewer = get_user_by_id(peer_id)
-                    if reviewer:
-                        # Skip if this would be a self-review and it's not allowed
-                        if not ALLOW_SELF_REVIEW and str(reviewer.id) == str(submission.user_id.id):
-                            continue
-                            
-                        peer_review = PeerReview(
-                            submission_id=submission,
-                            reviewer_id=reviewer,
-                            status='pending'
-                        )
-                        peer_review.save()
-                        
-                        notification = Notification(
-                            user_id=reviewer,
-                            title='New Peer Review Assigned',
-                            message=f'You have been assigned to review: {submission.assignment_title}',
-                            notification_type='review',
-                            related_id=str(submission.id)
-                        )
-                        notification.save()
-                        peers_assigned += 1
+                if not peers and ALLOW_SELF_REVIEW and submission.user_id:
+                    PeerReview(
+                        submission_id=submission,
+                        reviewer_id=submission.user_id,
+                        status='pending'
+                    ).save()
+                    notification_inbox.notify_many(
+                        [submission.user_id],
+                        title='New Peer Review Assigned',
+                        message=f'You have been assigned to review: {submission.assignment_title}',
+                        notification_type='review',
+                        related_id=str(submission.id)
+                    )
+                    peers_assigned = 1
             except Exception as e:
                 from flask import current_app
                 current_app.logger.warning(f"Failed to assign peers for submission {submission.id}: {e}")
         
         return success_response({
             'feedback': feedback_text,
-            'fresh': True,
+            'fresh': feedback_text is not None,  # False while the job is queued
+            'cached': cached_text is not None,
+            'job_id': str(feedback_job.id) if feedback_job else None,
+            'status': feedback_job.status if feedback_job else 'completed',
             'from_gemini': ai_service.use_gemini,
             'peers_assigned': peers_assigned
         })
@@ -140,3 +131,69 @@ def generate_feedback() -> Dict[str, Any]:
     except Exception as e:
         current_app.logger.error(f"Failed to generate feedback: {str(e)}", exc_info=True)
         return error_response('Failed to generate feedback. Please try again.', 500)
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format a Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@bp.route('/generate-feedback/stream', methods=['GET', 'POST'])
+@login_required
+@limiter.limit("10 per hour")  # Same budget as /generate-feedback
+def generate_feedback_stream() -> Any:
+    """
+    Stream fresh AI feedback for a submission as Server-Sent Events.
+    
+    Emits 'chunk' events with formatted text as Gemini produces it, then a 'done'
+    event with the stored feedback and scores (or an 'error' event).
+    GET is supported so the endpoint can be consumed with EventSource.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        submission_id = data.get('submission_id') or request.args.get('submission_id')
+        
+        if not submission_id:
+            return error_response('submission_id is required', 400)
+        
+        submission = get_submission_by_id(submission_id)
+        if not submission:
+            return not_found_response('Submission')
+        
+        if current_user.role != 'teacher' and (not submission.user_id or str(submission.user_id.id) != str(current_user.id)):
+            return forbidden_response('You do not have permission to generate feedback for this submission')
+        
+        files_data = submission_files_data(submission)
+    except Exception as e:
+        current_app.logger.error(f"Failed to start feedback stream: {str(e)}", exc_info=True)
+        return error_response('Failed to generate feedback. Please try again.', 500)
+    
+    def event_stream():
+        parts = []
+        try:
+            for chunk in ai_service.generate_feedback_stream(
+                content=submission_content(submission),
+                task_description=submission.task_description or '',
+                submission_type=submission.submission_type,
+                files=files_data
+            ):
+                parts.append(chunk)
+                yield _sse_event('chunk', {'text': chunk})
+            
+            ai_feedback = generate_and_store_feedback(submission, feedback_text=''.join(parts).strip())
+            yield _sse_event('done', {
+                'feedback': ai_feedback.feedback_text,
+                'scores': ai_feedback.get_scores(),
+                'from_gemini': ai_service.use_gemini
+            })
+        except Exception as e:
+            current_app.logger.error(f"Failed to stream feedback: {str(e)}", exc_info=True)
+            yield _sse_event('error', {'error': 'Failed to generate feedback. Please try again.'})
+    
+    response = Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
@@ -1,36 +1,66 @@
 """Flashcard API routes"""
+import io
+import json
 from flask import request, current_app
 from flask_login import login_required, current_user
-from typing import Dict, Any
+from typing import Dict, Any, Iterable
 from app.models import Flashcard
-from app.utils.response_utils import success_response, error_response
+from app.utils.response_utils import success_response, paginated_response, error_response, not_found_response
+from app.utils.pagination import paginate, page_size
+from app.exceptions.api_exceptions import ValidationError
+from app.services import flashcard_service
 from app.services.ai_service import ai_service
-from app.config import DEFAULT_FLASHCARD_COUNT
+from app.services.flashcard_service import front_hash
+from app.config import DEFAULT_FLASHCARD_COUNT, FLASHCARD_IMPORT_MAX_JSON_BYTES
 from . import api_v1
 
 bp = api_v1  # Use the v1 API blueprint
 
+def _serialize_flashcard(f: Flashcard) -> Dict[str, Any]:
+    return {
+        'id': str(f.id),
+        'front': f.front,
+        'back': f.back,
+        'category': f.category or 'general',
+        'difficulty': f.difficulty,
+        'mastery_level': f.mastery_level,
+        'review_count': f.review_count,
+        'last_reviewed': f.last_reviewed.isoformat() if f.last_reviewed else None,
+        'due_at': f.due_at.isoformat() if f.due_at else None,
+        'interval': f.interval,
+        'created_at': f.created_at.isoformat() if f.created_at else None,
+    }
+
 @bp.route('/flashcards', methods=['GET'])
 @login_required
 def get_flashcards() -> Dict[str, Any]:
     """Get user's flashcards"""
     try:
-        flashcards = Flashcard.objects(user_id=current_user).limit(100)
-        return success_response([{
-            'id': str(f.id),
-            'front': f.front,
-            'back': f.back,
-            'category': f.category or 'general',
-            'difficulty': f.difficulty,
-            'mastery_level': f.mastery_level,
-            'review_count': f.review_count,
-            'last_reviewed': f.last_reviewed.isoformat() if f.last_reviewed else None,
-            'created_at': f.created_at.isoformat() if f.created_at else None,
-        } for f in flashcards])
+        flashcards, next_cursor = paginate(
+            Flashcard.objects(user_id=current_user),
+            request.args.get('cursor'),
+            request.args.get('limit', type=int),
+            default_limit=100,
+        )
+        return paginated_response([_serialize_flashcard(f) for f in flashcards], next_cursor)
+    except ValidationError as e:
+        return error_response(e.message, 400)
     except Exception as e:
         current_app.logger.error(f"Failed to fetch flashcards: {str(e)}", exc_info=True)
         return error_response('Failed to fetch flashcards. Please try again.', 500)
 
+@bp.route('/flashcards/due', methods=['GET'])
+@login_required
+def get_due_flashcards() -> Dict[str, Any]:
+    """Get the cards due for review now, most overdue first"""
+    try:
+        limit = page_size(request.args.get('limit', type=int))
+        flashcards = flashcard_service.due(current_user.id, limit)
+        return success_response([_serialize_flashcard(f) for f in flashcards])
+    except Exception as e:
+        current_app.logger.error(f"Failed to fetch due flashcards: {str(e)}", exc_info=True)
+        return error_response('Failed to fetch due flashcards. Please try again.', 500)
+
 @bp.route('/flashcards', methods=['POST'])
 @login_required
 def create_flashcard() -> Dict[str, Any]:
@@ -50,6 +80,7 @@ def create_flashcard() -> Dict[str, Any]:
             front=front,
             back=back,
             category=category,
+            front_hash=front_hash(front),
             mastery_level=0.0,
             review_count=0
         )
@@ -88,32 +119,24 @@ def generate_flashcards_endpoint() -> Dict[str, Any]:
         if len(generated_flashcards) < DEFAULT_FLASHCARD_COUNT:
             current_app.logger.warning(f"Only {len(generated_flashcards)} flashcards generated, expected {DEFAULT_FLASHCARD_COUNT}")
         
-        # Create flashcards in database
-        created_flashcards = []
-        for card_data in generated_flashcards:
-            if not card_data.get('front') or not card_data.get('back'):
-                continue  # Skip invalid flashcards
-            flashcard = Flashcard(
-                user_id=current_user,
-                front=card_data.get('front', ''),
-                back=card_data.get('back', ''),
-                category=card_data.get('category', topic.lower()),
-                mastery_level=0.0,
-                review_count=0
-            )
-            flashcard.save()
-            created_flashcards.append({
-                'id': str(flashcard.id),
-                'front': flashcard.front,
-                'back': flashcard.back,
-                'category': flashcard.category,
-            })
-        
-        current_app.logger.info(f"Successfully created {len(created_flashcards)} flashcards in database")
+        # Validate and deduplicate in memory, then insert the set in one round trip
+        result = flashcard_service.bulk_create(current_user.id, generated_flashcards, default_category=topic.lower())
+        created_flashcards = [{
+            'id': str(flashcard.id),
+            'front': flashcard.front,
+            'back': flashcard.back,
+            'category': flashcard.category,
+        } for flashcard in result['created']]
+        
+        current_app.logger.info(
+            f"Created {len(created_flashcards)} flashcards in database "
+            f"({result['duplicates']} duplicates, {result['invalid']} invalid skipped)"
+        )
         
         return success_response({
             'count': len(created_flashcards),
             'expected_count': DEFAULT_FLASHCARD_COUNT,
+            'duplicates': result['duplicates'],
             'flashcards': created_flashcards,
             'topic': topic
         })
@@ -123,6 +146,71 @@ def generate_flashcards_endpoint() -> Dict[str, Any]:
         current_app.logger.error(f"Error generating flashcards: {error_details}")
         return error_response('Failed to generate flashcards. Please try again.', 500)
 
+def _import_rows() -> Iterable:
+    """
+    Cards from an uploaded deck (.csv, .jsonl/.ndjson, .json) or a JSON body {cards: [...]}.
+
+    CSV and JSON Lines decks are streamed; a JSON document has to be parsed whole, so
+    .json files and bodies are limited to FLASHCARD_IMPORT_MAX_JSON_BYTES.
+    """
+    if 'file' in request.files:
+        file = request.files['file']
+        name = (file.filename or '').lower()
+        if name.endswith('.json'):
+            return _card_list(_read_json(file.stream, 'Deck file is not valid JSON'))
+        # Text is decoded as it is read, so large decks are never held in memory whole
+        text = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+        if name.endswith('.csv'):
+            return flashcard_service.iter_csv(text)
+        if name.endswith(('.jsonl', '.ndjson')):
+            return flashcard_service.iter_json_lines(text)
+        raise ValidationError('Unsupported deck file. Use .csv, .json or .jsonl')
+
+    if not request.is_json:
+        raise ValidationError('Upload a deck file or send {"cards": [...]}')
+    return _card_list(_read_json(request.stream, 'Request body is not valid JSON'))
+
+def _read_json(stream, invalid_message: str):
+    """Parse a JSON document of at most FLASHCARD_IMPORT_MAX_JSON_BYTES from stream"""
+    raw = stream.read(FLASHCARD_IMPORT_MAX_JSON_BYTES + 1)
+    if len(raw) > FLASHCARD_IMPORT_MAX_JSON_BYTES:
+        limit_mb = FLASHCARD_IMPORT_MAX_JSON_BYTES / (1024 * 1024)
+        raise ValidationError(f'JSON decks are limited to {limit_mb:g}MB. Upload larger decks as .csv or .jsonl')
+    text = raw.decode('utf-8-sig')
+    try:
+        return json.loads(text)
+    except ValueError:
+        raise ValidationError(invalid_message)
+
+def _card_list(data) -> list:
+    cards = data.get('cards') if isinstance(data, dict) else data
+    if not isinstance(cards, list):
+        raise ValidationError('Expected a list of cards')
+    return cards
+
+@bp.route('/flashcards/bulk', methods=['POST'])
+@login_required
+def bulk_import_flashcards() -> Dict[str, Any]:
+    """Import a deck of flashcards, skipping cards the user already has"""
+    try:
+        category = (request.form.get('category') or request.args.get('category') or 'general').strip() or 'general'
+        result = flashcard_service.bulk_create(current_user.id, _import_rows(), default_category=category)
+        
+        return success_response({
+            'created': len(result['created']),
+            'duplicates': result['duplicates'],
+            'invalid': result['invalid'],
+            'errors': result['errors'],
+            'truncated': result['truncated'],
+        })
+    except UnicodeDecodeError:
+        return error_response('Deck file must be UTF-8 encoded', 400)
+    except ValidationError as e:
+        return error_response(e.message, 400)
+    except Exception as e:
+        current_app.logger.error(f"Failed to import flashcards: {str(e)}", exc_info=True)
+        return error_response('Failed to import flashcards. Please try again.', 500)
+
 @bp.route('/flashcard/<flashcard_id>/review', methods=['POST'])
 @login_required
 def review_flashcard(flashcard_id: str) -> Dict[str, Any]:
@@ -133,24 +221,30 @@ def review_flashcard(flashcard_id: str) -> Dict[str, Any]:
             return error_response('Flashcard not found', 404)
         
         data = request.json if request.is_json else request.form.to_dict()
-        correct = data.get('correct', False)
-        
-        # Update mastery level based on review
-        # Simple algorithm: increase by 0.1 if correct, decrease by 0.1 if incorrect
-        if correct:
-            flashcard.mastery_level = min(1.0, flashcard.mastery_level + 0.1)
-        else:
-            flashcard.mastery_level = max(0.0, flashcard.mastery_level - 0.1)
-        
-        flashcard.review_count = (flashcard.review_count or 0) + 1
-        from datetime import datetime
-        flashcard.last_reviewed = datetime.utcnow()
-        flashcard.save()
+        
+        # SM-2 grade 0-5; clients that only send correct/incorrect map to 4 / 1
+        quality = data.get('quality')
+        if quality is None:
+            correct = data.get('correct', False)
+            if isinstance(correct, str):
+                correct = correct.lower() == 'true'
+            quality = 4 if correct else 1
+        try:
+            quality = int(quality)
+        except (TypeError, ValueError):
+            return error_response('quality must be an integer from 0 to 5', 400)
+        if not 0 <= quality <= 5:
+            return error_response('quality must be an integer from 0 to 5', 400)
+        
+        flashcard_service.review(flashcard, quality)
         
         return success_response({
             'id': str(flashcard.id),
             'mastery_level': flashcard.mastery_level,
             'review_count': flashcard.review_count,
+            'ease': flashcard.ease,
+            'interval': flashcard.interval,
+            'due_at': flashcard.due_at.isoformat(),
         })
     except Exception as e:
         current_app.logger.error(f"Failed to update flashcard: {str(e)}", exc_info=True)
@@ -159,7 +253,7 @@ def review_flashcard(flashcard_id: str) -> Dict[str, Any]:
 @bp.route('/flashcard/<flashcard_id>/verify-answer', methods=['POST'])
 @login_required
 def verify_flashcard_answer(flashcard_id: str) -> Dict[str, Any]:
-    """Verify user's answer against flashcard using AI"""
+    """Verify user's answer against flashcard, using AI only when a local check is not conclusive"""
     try:
         flashcard = Flashcard.objects(id=flashcard_id, user_id=current_user).first()
         if not flashcard:
@@ -173,13 +267,9 @@ def verify_flashcard_answer(flashcard_id: str) -> Dict[str, Any]:
         
         current_app.logger.debug(f"Verifying answer for flashcard {flashcard_id}")
         
-        # Use AI service to verify answer
+        # Exact match, then local embedding similarity; Gemini only for ambiguous answers
         try:
-            verification_result = ai_service.verify_flashcard_answer(
-                correct_answer=flashcard.back or '',
-                user_answer=user_answer,
-                question=flashcard.front or ''
-            )
+            verification_result = flashcard_service.verify_answer(flashcard, user_answer)
             
             current_app.logger.debug(f"Verification result: {verification_result}")
             return success_response(verification_result)
@@ -0,0 +1,52 @@
+"""Background job status routes"""
+from typing import Dict, Any
+from flask import current_app
+from flask_login import login_required, current_user
+from app.models import FeedbackJob
+from app.utils.model_utils import to_object_id
+from app.utils.response_utils import success_response, error_response, not_found_response, forbidden_response
+
+from . import api_v1
+
+bp = api_v1
+
+
+def serialize_job(job: FeedbackJob) -> Dict[str, Any]:
+    """Serialize a feedback job for status polling"""
+    feedback = job.feedback_id if job.status == 'completed' else None
+    return {
+        'id': str(job.id),
+        'type': 'feedback',
+        'status': job.status,
+        'submission_id': str(job.submission_id.id) if job.submission_id else None,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'error': job.error if job.status == 'failed' else None,
+        'feedback': feedback.feedback_text if feedback else None,
+        'scores': feedback.get_scores() if feedback else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job(job_id: str) -> Dict[str, Any]:
+    """Get the status of a background feedback job"""
+    try:
+        obj_id = to_object_id(job_id)
+        job = FeedbackJob.objects(id=obj_id).first() if obj_id else None
+        if not job:
+            return not_found_response('Job')
+        
+        submission = job.submission_id
+        is_requester = job.requested_by and str(job.requested_by.id) == str(current_user.id)
+        is_owner = submission and submission.user_id and str(submission.user_id.id) == str(current_user.id)
+        if current_user.role != 'teacher' and not (is_requester or is_owner):
+            return forbidden_response('You do not have permission to view this job')
+        
+        return success_response({'job': serialize_job(job)})
+    except Exception as e:
+        current_app.logger.error(f"Failed to get job: {str(e)}", exc_info=True)
+        return error_response('Failed to get job status', 500)
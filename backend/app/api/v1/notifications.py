@@ -1,12 +1,16 @@
 """Notification API routes"""
-from flask import Response, stream_with_context, current_app
+from flask import Response, request, stream_with_context, current_app
 from flask_login import login_required, current_user
 from app.models import Notification
-from app.utils.response_utils import success_response, error_response, not_found_response
+from app.services import notification_hub, notification_inbox
+from app.utils.model_utils import to_object_id
+from app.config import NOTIFICATION_STREAM_QUEUE_SIZE, NOTIFICATION_STREAM_HEARTBEAT_SECONDS
+from app.utils.response_utils import success_response, paginated_response, error_response, not_found_response
+from app.utils.pagination import paginate
+from app.exceptions.api_exceptions import ValidationError
 from typing import Dict, Any
 from . import api_v1
 import json
-import time
 
 bp = api_v1
 
@@ -29,31 +33,41 @@ def serialize_notification(notification: Notification) -> Dict[str, Any]:
 def get_notifications() -> Dict[str, Any]:
     """Fetch the current user's notifications"""
     try:
-        notifications = (
-            Notification.objects(user_id=current_user)
-            .order_by('-created_at')
-            .limit(50)
+        notifications, next_cursor = paginate(
+            Notification.objects(user_id=current_user),
+            request.args.get('cursor'),
+            request.args.get('limit', type=int),
+            default_limit=50,
         )
-        return success_response([serialize_notification(n) for n in notifications])
+        return paginated_response([serialize_notification(n) for n in notifications], next_cursor)
+    except ValidationError as exc:
+        return error_response(exc.message, 400)
     except Exception as exc:
         current_app.logger.error(f"Failed to load notifications: {exc}", exc_info=True)
         return error_response('Failed to load notifications. Please try again.', 500)
 
 
+@bp.route('/notifications/unread-count', methods=['GET'])
+@login_required
+def get_unread_notification_count() -> Dict[str, Any]:
+    """Unread badge count, read from the user's counter document"""
+    try:
+        return success_response({'unread_count': notification_inbox.unread_count(current_user.id)})
+    except Exception as exc:
+        current_app.logger.error(f"Failed to load unread count: {exc}", exc_info=True)
+        return error_response('Failed to load unread count. Please try again.', 500)
+
+
 @bp.route('/notification/<notification_id>/read', methods=['POST'])
 @login_required
 def mark_notification_read(notification_id: str) -> Dict[str, Any]:
     """Mark a single notification as read"""
     try:
-        notification = Notification.objects(id=notification_id, user_id=current_user).first()
-        if not notification:
+        obj_id = to_object_id(notification_id)
+        if not obj_id or notification_inbox.mark_read(current_user.id, obj_id) is None:
             return not_found_response('Notification')
 
-        if not notification.is_read:
-            notification.is_read = True
-            notification.save()
-
-        return success_response({'id': str(notification.id), 'is_read': True})
+        return success_response({'id': str(obj_id), 'is_read': True})
     except Exception as e:
         current_app.logger.error(f"Failed to mark notification as read: {str(e)}", exc_info=True)
         return error_response('Failed to mark notification as read. Please try again.', 500)
@@ -64,30 +78,65 @@ def mark_notification_read(notification_id: str) -> Dict[str, Any]:
 def mark_all_notifications_read() -> Dict[str, Any]:
     """Mark all notifications as read"""
     try:
-        Notification.objects(user_id=current_user, is_read=False).update(set__is_read=True)
+        notification_inbox.mark_all_read(current_user.id)
         return success_response({'updated': True})
     except Exception as exc:
         current_app.logger.error(f"Failed to mark notifications as read: {exc}", exc_info=True)
         return error_response('Failed to mark notifications as read. Please try again.', 500)
 
 
+def _sse_notification(notification: Notification) -> str:
+    return f"id: {notification.id}\nevent: notification\ndata: {json.dumps(serialize_notification(notification))}\n\n"
+
+
 @bp.route('/notifications/stream', methods=['GET'])
 @login_required
 def notifications_stream() -> Response:
-    """Simple Server-Sent Events endpoint for future live updates."""
+    """
+    Server-Sent Events feed of the current user's new notifications.
+
+    Notifications are pushed by the notification hub as they are created; a reconnecting
+    client sending Last-Event-ID first receives what it missed. A 'resync' event means the
+    connection fell too far behind and the client should reload /notifications.
+    """
+    user_id = str(current_user.id)
+    last_event_id = to_object_id(request.headers.get('Last-Event-ID', ''))
 
     def event_stream():
-        # Inform client to retry after disconnects
-        yield 'retry: 10000\n\n'
-        while True:
-            # Heartbeat comment to keep connection alive
-            yield ': keep-alive\n\n'
-            time.sleep(25)
+        # Subscribe before replaying, so nothing created in between is missed
+        with notification_hub.subscribe(user_id) as subscription:
+            # Inform client to retry after disconnects
+            yield 'retry: 10000\n\n'
+            last_id = last_event_id
+            if last_id:
+                missed = (
+                    Notification.objects(user_id=user_id, id__gt=last_id)
+                    .order_by('id')
+                    .limit(NOTIFICATION_STREAM_QUEUE_SIZE)
+                )
+                for notification in missed:
+                    yield _sse_notification(notification)
+                    last_id = notification.id
+
+            while True:
+                notifications = subscription.get(NOTIFICATION_STREAM_HEARTBEAT_SECONDS)
+                if not notifications:
+                    # Heartbeat comment to keep connection alive
+                    yield ': keep-alive\n\n'
+                    continue
+                if subscription.take_dropped():
+                    yield 'event: resync\ndata: {}\n\n'
+                for notification in notifications:
+                    if last_id and notification.id <= last_id:
+                        continue  # Already sent by the replay
+                    yield _sse_notification(notification)
+                    last_id = notification.id
 
     response = Response(
         stream_with_context(event_stream()),
         mimetype='text/event-stream'
     )
     response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let a proxy hold pushes back
     return response
 
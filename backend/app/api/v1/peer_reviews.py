@@ -5,8 +5,11 @@ from datetime import datetime
 from typing import Dict, Any, List
 from app.models import PeerReview, Feedback, Submission, User
 from app.utils.model_utils import get_peer_review_by_id, get_submission_by_id
-from app.utils.response_utils import success_response, error_response, not_found_response, forbidden_response
+from app.utils.response_utils import success_response, paginated_response, error_response, not_found_response, forbidden_response
+from app.utils.pagination import paginate
+from app.exceptions.api_exceptions import ValidationError
 from app.config import MAX_FILE_SIZE
+from app.services.submission_storage import preload_files, submission_content
 
 from . import api_v1
 
@@ -19,11 +22,18 @@ def get_peer_reviews() -> Dict[str, Any]:
     try:
         # Only return reviews explicitly assigned to current user
         # Security: Removed global fallback that exposed all peer reviews
-        reviews = list(PeerReview.objects(reviewer_id=current_user).order_by('-assigned_at').limit(50))
+        reviews, next_cursor = paginate(
+            PeerReview.objects(reviewer_id=current_user),
+            request.args.get('cursor'),
+            request.args.get('limit', type=int),
+            field='assigned_at',
+            default_limit=50,
+        )
         
         # Pre-fetch related submissions to avoid N+1 queries
         submission_ids = [r.submission_id.id for r in reviews if r.submission_id]
-        submissions = {str(s.id): s for s in Submission.objects(id__in=submission_ids).only('id', 'assignment_title', 'content', 'submission_type', 'user_id')}
+        submissions = {str(s.id): s for s in Submission.objects(id__in=submission_ids).only('id', 'assignment_title', 'content', 'files', 'submission_type', 'user_id')}
+        preload_files([s for s in submissions.values() if not s.content])
         
         # Pre-fetch users to avoid N+1 queries
         user_ids = [s.user_id.id for s in submissions.values() if s.user_id]
@@ -38,7 +48,7 @@ def get_peer_reviews() -> Dict[str, Any]:
                 'id': str(r.id),
                 'submission_id': str(r.submission_id.id) if r.submission_id else None,
                 'submission_title': submission.assignment_title if submission else 'Unknown',
-                'submission_content': submission.content[:500] if submission and submission.content else '',
+                'submission_content': submission_content(submission)[:500] if submission else '',
                 'submission_type': submission.submission_type if submission else 'unknown',
                 'status': r.status,
                 'submitted_by': user.name if user else 'Unknown',
@@ -46,7 +56,9 @@ def get_peer_reviews() -> Dict[str, Any]:
                 'completed_at': r.completed_at.isoformat() if r.completed_at else None
             })
         
-        return success_response(result)
+        return paginated_response(result, next_cursor)
+    except ValidationError as e:
+        return error_response(e.message, 400)
     except Exception as e:
         current_app.logger.error(f"Failed to fetch peer reviews: {str(e)}", exc_info=True)
         return error_response('Failed to fetch peer reviews. Please try again.', 500)
@@ -0,0 +1,184 @@
+"""Search API routes"""
+from flask import request, current_app
+from flask_login import login_required, current_user
+from typing import Dict, Any, List, Optional
+
+from app.models import Submission, Resource, Flashcard, User
+from app.services import embedding_service, search_service
+from app.services.search_service import SOURCES as TEXT_SOURCES
+from app.services.ai_service import ai_service
+from app.utils.model_utils import get_course_by_id, to_object_id
+from app.utils.pagination import page_size
+from app.utils.response_utils import success_response, paginated_response, error_response
+from app.exceptions.api_exceptions import ValidationError, NotFoundError
+from app.config import DEPARTMENT_OPTIONS, EMBEDDING_MAX_CHARS
+from . import api_v1
+
+bp = api_v1
+
+SIMILAR_SOURCES = ('submissions', 'resources', 'flashcards')
+
+
+def _department_arg() -> Optional[str]:
+    department = request.args.get('department')
+    if department and department not in {opt['value'] for opt in DEPARTMENT_OPTIONS}:
+        raise ValidationError('Invalid department')
+    return department
+
+
+def _similar_scope(source: str) -> Optional[Dict]:
+    """
+    MongoDB filter on source's collection for the documents the current user may see,
+    narrowed by ?course_id= and ?department=; None means every document is in scope.
+
+    Students only see their own submissions and flashcards; teachers see submissions of
+    their department's students (or ?department=), as on /submissions.
+    """
+    department = _department_arg()
+    if source == 'flashcards':
+        return {'user_id': current_user.id}
+    if source == 'resources':
+        if not department:
+            return None
+        return {'department': {'$in': [department, 'All Departments']}}
+
+    query = {}
+    course_id = request.args.get('course_id')
+    if course_id:
+        course = get_course_by_id(course_id)
+        if not course:
+            raise NotFoundError('Course not found')
+        query['course_id'] = course.id
+    if current_user.role == 'teacher':
+        department = department or current_user.department
+        if department:
+            query['user_id'] = {'$in': list(User.objects(department=department, role='student').scalar('id'))}
+    else:
+        query['user_id'] = current_user.id
+    return query
+
+
+def _submission_summaries(ids: List) -> Dict:
+    docs = list(Submission.objects(id__in=ids).only(
+        'assignment_title', 'user_id', 'course_id', 'status', 'created_at'
+    ).as_pymongo())
+    names = dict(User.objects(id__in=[doc['user_id'] for doc in docs]).scalar('id', 'name'))
+    return {doc['_id']: {
+        'assignment_title': doc.get('assignment_title'),
+        'student_name': names.get(doc['user_id']),
+        'course_id': str(doc['course_id']) if doc.get('course_id') else None,
+        'status': doc.get('status'),
+        'created_at': doc['created_at'].isoformat() if doc.get('created_at') else None,
+    } for doc in docs}
+
+
+def _resource_summaries(ids: List) -> Dict:
+    fields = ('title', 'description', 'resource_type', 'url', 'category', 'department')
+    return {
+        doc['_id']: {field: doc.get(field) for field in fields}
+        for doc in Resource.objects(id__in=ids).only(*fields).as_pymongo()
+    }
+
+
+def _flashcard_summaries(ids: List) -> Dict:
+    fields = ('front', 'back', 'category')
+    return {
+        doc['_id']: {field: doc.get(field) for field in fields}
+        for doc in Flashcard.objects(id__in=ids).only(*fields).as_pymongo()
+    }
+
+
+SUMMARIES = {
+    'submissions': _submission_summaries,
+    'resources': _resource_summaries,
+    'flashcards': _flashcard_summaries,
+}
+
+
+def _hydrate(source: str, matches: List) -> List[Dict[str, Any]]:
+    """Summaries of the matched documents, in match order"""
+    ids = [to_object_id(doc_id) for doc_id, _ in matches]
+    summaries = SUMMARIES[source](ids)
+    return [
+        {'id': str(doc_id), 'type': source[:-1], 'score': round(score, 4), **summaries[doc_id]}
+        for doc_id, (_, score) in zip(ids, matches)
+        if doc_id in summaries  # Skip documents deleted since they were embedded
+    ]
+
+
+@bp.route('/search', methods=['GET'])
+@login_required
+def search() -> Dict[str, Any]:
+    """
+    Full-text search over resources, the current user's flashcards and their own submissions.
+
+    ?q= is a text search string ("quoted phrases" and -excluded words work); ?type= takes a
+    comma-separated subset of resources, flashcards and submissions; ?department= narrows
+    resources. Results are ordered by relevance with a highlighted snippet each, and paged
+    with ?cursor= / ?limit= like the other lists.
+    """
+    try:
+        types = request.args.get('type')
+        sources = None
+        if types:
+            sources = [name.strip() for name in types.split(',') if name.strip()]
+            unknown = [name for name in sources if name not in TEXT_SOURCES]
+            if unknown or not sources:
+                raise ValidationError(f"type must be one of: {', '.join(TEXT_SOURCES)}")
+        results, next_cursor = search_service.search(
+            current_user,
+            request.args.get('q', ''),
+            sources=sources,
+            department=_department_arg(),
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', type=int)
+        )
+        return paginated_response(results, next_cursor)
+    except ValidationError as e:
+        return error_response(e.message, 400)
+    except Exception as e:
+        current_app.logger.error(f"Failed to search: {str(e)}", exc_info=True)
+        return error_response('Failed to search. Please try again.', 500)
+
+
+@bp.route('/search/similar', methods=['GET'])
+@login_required
+def search_similar() -> Dict[str, Any]:
+    """
+    Semantically similar submissions, resources or flashcards.
+
+    ?type= picks the collection; the query is either ?id= (a document of that type) or ?q=
+    (free text). ?course_id= and ?department= narrow the scope; ?limit= caps the results.
+    """
+    try:
+        source = request.args.get('type', 'submissions')
+        if source not in SIMILAR_SOURCES:
+            raise ValidationError(f"type must be one of: {', '.join(SIMILAR_SOURCES)}")
+        doc_id = request.args.get('id')
+        text = (request.args.get('q') or '').strip()
+        if not doc_id and not text:
+            raise ValidationError('Pass id or q')
+        limit = page_size(request.args.get('limit', type=int))
+
+        scope = _similar_scope(source)
+        if doc_id:
+            object_id = to_object_id(doc_id)
+            if not object_id or (scope is not None and not embedding_service.matching(source, [object_id], scope)):
+                raise NotFoundError(f'{source[:-1].capitalize()} not found')
+            query = embedding_service.vector_for(source, object_id)
+        else:
+            encoded = ai_service.encode([text[:EMBEDDING_MAX_CHARS]])
+            query = encoded[0] if encoded is not None else None
+        if query is None:
+            return error_response('Semantic search is not available right now.', 503)
+
+        matches = embedding_service.search(source, query, limit + 1 if doc_id else limit, scope)
+        matches = [(match_id, score) for match_id, score in matches if match_id != doc_id][:limit]
+        return success_response(_hydrate(source, matches))
+    except ValidationError as e:
+        return error_response(e.message, 400)
+    except NotFoundError as e:
+        return error_response(e.message, 404)
+    except Exception as e:
+        current_app.logger.error(f"Failed to search similar documents: {str(e)}", exc_info=True)
+        return error_response('Failed to search. Please try again.', 500)
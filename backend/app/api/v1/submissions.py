@@ -1,24 +1,30 @@
 """Submission routes"""
 from typing import Dict, Any
-from flask import request, current_app
+from flask import request, current_app, stream_with_context
 from flask_login import login_required, current_user
 import os
 from app.models import (
     Submission,
     Feedback,
     Course,
-    SubmissionFile,
-    Notification,
     User,
     PeerReview,
     SubmissionVersion,
 )
 from app.utils.dept_utils import get_current_department, get_or_create_department_course
-from app.utils.model_utils import get_course_by_id, get_submission_by_id, get_user_by_id
-from app.utils.response_utils import success_response, error_response, not_found_response, forbidden_response
+from app.utils.model_utils import get_course_by_id, get_submission_by_id
+from app.utils.response_utils import success_response, paginated_response, error_response, not_found_response, forbidden_response
+from app.utils.pagination import paginate
 from app.utils.validation import validate_required_fields
 from app.config import DEFAULT_DEPARTMENT, MAX_FILE_SIZE
-from app.services import ai_service, peer_matching_service
+from app.services import peer_matching_service, feedback_job_service, blob_store
+from app.services.submission_storage import (
+    combine_files,
+    preload_files,
+    store_submission_files,
+    submission_files_data,
+    submission_content,
+)
 from app.exceptions.api_exceptions import ValidationError
 
 from . import api_v1
@@ -54,10 +60,7 @@ def submit_assignment() -> Dict[str, Any]:
             return error_response(f'Content exceeds maximum size of {MAX_FILE_SIZE // (1024*1024)}MB', 400)
         
         if files_data:
-            combined_content = "\n\n".join([
-                f"=== FILE: {f.get('filename', 'unnamed')} ===\n{f.get('content', '')}"
-                for f in files_data
-            ])
+            combined_content = combine_files(files_data)
         else:
             combined_content = content
         
@@ -71,22 +74,8 @@ def submit_assignment() -> Dict[str, Any]:
         if not course_obj:
             return not_found_response('Course')
         
-        saved_files = []
-        submission_files = []
-        for file_data in files_data:
-            filename = file_data.get('filename', 'unnamed')
-            file_ext = os.path.splitext(filename)[1][1:] if '.' in filename else ''
-            submission_file = SubmissionFile(
-                filename=filename,
-                file_content=file_data.get('content', ''),
-                file_type=file_ext
-            )
-            submission_files.append(submission_file)
-            saved_files.append({
-                'filename': filename,
-                'content': file_data.get('content', ''),
-                'file_type': file_ext
-            })
+        # File bodies go to the blob store (deduplicated by hash); the submission keeps metadata
+        submission_files = store_submission_files(files_data)
         
         # Validate and sanitize assignment title
         from app.utils.security_utils import sanitize_input
@@ -106,47 +95,28 @@ def submit_assignment() -> Dict[str, Any]:
             user_id=current_user,
             course_id=course_obj,
             assignment_title=assignment_title,
-            content=combined_content or 'No content provided',
+            content=None if submission_files else (combined_content or 'No content provided'),
             task_description=task_description,
             submission_type=data.get('type', 'code') or 'code',
             status='submitted',
             files=submission_files
         )
+        submission._resolved_content = combined_content  # Already in memory; spares the plagiarism indexer a blob read
         submission.save()
         
-        # Ensure course_id is valid before matching peers
+        # Balanced, capacity-limited reviewer assignment (bulk-inserts reviews and notifications)
         peers = []
         peers_info = []
         if course_obj:
-            peers = peer_matching_service.match_peers(
-                str(submission.id), str(current_user.id), str(course_obj.id), submission_department
-            )
-
-        # Create peer reviews for matched peers
-        for peer_id in peers:
-            reviewer = get_user_by_id(peer_id)
-            if reviewer:
-                peer_review = PeerReview(
-                    submission_id=submission,
-                    reviewer_id=reviewer,
-                    status='pending'
-                )
-                peer_review.save()
-
-                peers_info.append({
-                    'id': str(reviewer.id),
-                    'name': reviewer.name,
-                    'email': reviewer.email,
-                })
-                
-                notification = Notification(
-                    user_id=reviewer,
-                    title='New Peer Review Assigned',
-                    message=f'You have been assigned to review: {submission.assignment_title}',
-                    notification_type='review',
-                    related_id=str(submission.id)
-                )
-                notification.save()
+            peers = peer_matching_service.assign_reviewers(
+                [submission], department=submission_department
+            ).get(str(submission.id), [])
+        if peers:
+            peers_info = [{
+                'id': str(reviewer.id),
+                'name': reviewer.name,
+                'email': reviewer.email,
+            } for reviewer in User.objects(id__in=peers).only('name', 'email')]
 
         # Fallback: if matching didn't find any peers (e.g., only one student in the system),
         # optionally assign self-review if enabled in config
@@ -171,41 +141,17 @@ def submit_assignment() -> Dict[str, Any]:
                         'email': current_user.email,
                     })
         
-        feedback_text = None
+        feedback_job = None
         if data.get('generate_feedback', False):
-            feedback_text = ai_service.generate_feedback(
-                content=submission.content,
-                task_description=submission.task_description,
-                submission_type=submission.submission_type,
-                files=saved_files
-            )
-            
-            scores_dict = {
-                'correctness': ai_service.score_correctness(submission.content),
-                'quality': ai_service.score_quality(submission.content),
-                'completeness': ai_service.score_completeness(submission.content)
-            }
-            ai_feedback = Feedback(
-                submission_id=submission,
-                reviewer_id=None,
-                feedback_text=feedback_text,
-                feedback_type='ai'
-            )
-            ai_feedback.set_scores(scores_dict)
-            ai_feedback.save()
-            
-            notification = Notification(
-                user_id=current_user,
-                title='Feedback Generated',
-                message=f'AI feedback has been generated for your submission: {submission.assignment_title}',
-                notification_type='feedback',
-                related_id=str(submission.id)
+            feedback_job = feedback_job_service.enqueue(
+                submission, requested_by=current_user, notify_user=True
             )
-            notification.save()
+            feedback_job_service.ensure_workers(current_app._get_current_object())
         
         return success_response({
             'submission_id': str(submission.id),
-            'feedback': feedback_text,
+            'feedback': None,
+            'job_id': str(feedback_job.id) if feedback_job else None,
             'peers_assigned': len(peers),
             'peers': peers_info,
         })
@@ -215,40 +161,100 @@ def submit_assignment() -> Dict[str, Any]:
         current_app.logger.error(f"Failed to submit assignment: {str(e)}", exc_info=True)
         return error_response('Failed to submit assignment. Please try again.', 500)
 
+# List field -> Submission fields it is read from
+SUBMISSION_LIST_FIELDS = {
+    'title': ('assignment_title',),
+    'type': ('submission_type',),
+    'status': ('status',),
+    'created_at': ('created_at',),
+    'user_name': ('user_id',),
+    'department': ('user_id',),
+    'content': ('content', 'files'),
+}
+DEFAULT_SUBMISSION_LIST_FIELDS = ('title', 'type', 'status', 'created_at', 'user_name', 'department')
+
+
+def _submission_list_fields() -> tuple:
+    """Fields requested with ?fields=a,b (content is only added through include_content)"""
+    requested = request.args.get('fields')
+    if not requested:
+        return DEFAULT_SUBMISSION_LIST_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in requested.split(',') if f.strip() and f.strip() != 'id'))
+    unknown = [f for f in fields if f not in DEFAULT_SUBMISSION_LIST_FIELDS]
+    if unknown:
+        raise ValidationError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
 @bp.route('/submissions')
 @login_required
 def get_submissions() -> Dict[str, Any]:
-    """Get user's submissions"""
+    """
+    Get user's submissions (cursor-paginated).
+
+    Rows carry DEFAULT_SUBMISSION_LIST_FIELDS unless ?fields= narrows them; teachers can
+    add each submission's full text with ?include_content=true.
+    """
     try:
         if current_user.role == 'teacher':
             department_filter = request.args.get('department')
             if department_filter:
                 users_in_dept = User.objects(department=department_filter, role='student').only('id')
                 user_ids = [u.id for u in users_in_dept]
-                submissions = Submission.objects(user_id__in=user_ids).limit(500)
+                submissions = Submission.objects(user_id__in=user_ids)
             else:
                 teacher_department = current_user.department
                 if teacher_department:
                     users_in_dept = User.objects(department=teacher_department, role='student').only('id')
                     user_ids = [u.id for u in users_in_dept]
-                    submissions = Submission.objects(user_id__in=user_ids).limit(500)
+                    submissions = Submission.objects(user_id__in=user_ids)
                 else:
                     student_users = User.objects(role='student').only('id')
                     user_ids = [u.id for u in student_users]
-                    submissions = Submission.objects(user_id__in=user_ids).limit(500)
+                    submissions = Submission.objects(user_id__in=user_ids)
         else:
-            submissions = Submission.objects(user_id=current_user).limit(100)
+            submissions = Submission.objects(user_id=current_user)
+        
+        fields = _submission_list_fields()
+        include_content = current_user.role == 'teacher' and request.args.get('include_content', 'false').lower() == 'true'
+        if include_content:
+            fields = fields + ('content',)
+        
+        # Only the columns the requested fields need; owners are batch-loaded below instead of per row
+        db_fields = {'id', 'created_at'}
+        for field in fields:
+            db_fields.update(SUBMISSION_LIST_FIELDS[field])
+        submissions, next_cursor = paginate(
+            submissions.only(*db_fields).no_dereference(),
+            request.args.get('cursor'),
+            request.args.get('limit', type=int),
+            default_limit=500 if current_user.role == 'teacher' else 100,
+        )
         
-        return success_response([{
-            'id': str(s.id),
-            'title': s.assignment_title,
-            'type': s.submission_type,
-            'status': s.status,
-            'created_at': s.created_at.isoformat() if s.created_at else None,
-            'user_name': s.user_id.name if s.user_id else 'Unknown',
-            'department': getattr(s.user_id, 'department', DEFAULT_DEPARTMENT) if s.user_id else DEFAULT_DEPARTMENT,
-            'content': s.content if current_user.role == 'teacher' else ''
-        } for s in submissions])
+        users = {}
+        if 'user_name' in fields or 'department' in fields:
+            owner_ids = {s.user_id.id for s in submissions if s.user_id}
+            users = {u.id: u for u in User.objects(id__in=list(owner_ids)).only('name', 'department')}
+        if include_content:
+            preload_files([s for s in submissions if not s.content])
+        
+        result = []
+        for s in submissions:
+            owner = users.get(s.user_id.id) if s.user_id else None
+            row = {
+                'id': str(s.id),
+                'title': s.assignment_title,
+                'type': s.submission_type,
+                'status': s.status,
+                'created_at': s.created_at.isoformat() if s.created_at else None,
+                'user_name': owner.name if owner else 'Unknown',
+                'department': (owner.department or DEFAULT_DEPARTMENT) if owner else DEFAULT_DEPARTMENT,
+                'content': submission_content(s) if include_content else None,
+            }
+            result.append({field: row[field] for field in ('id',) + fields})
+        return paginated_response(result, next_cursor)
+    except ValidationError as e:
+        return error_response(e.message, 400)
     except Exception as e:
         current_app.logger.error(f"Failed to fetch submissions: {str(e)}", exc_info=True)
         return error_response('Failed to fetch submissions. Please try again.', 500)
@@ -268,13 +274,13 @@ def get_submission(submission_id: str) -> Dict[str, Any]:
         
         feedbacks = Feedback.objects(submission_id=submission).limit(20)
         peer_reviews = PeerReview.objects(submission_id=submission).limit(20)
-        files = submission.files or []
+        files = submission_files_data(submission)  # Loads file bodies from the blob store
         
         return success_response({
             'submission': {
                 'id': str(submission.id),
                 'title': submission.assignment_title,
-                'content': submission.content,
+                'content': submission_content(submission),
                 'task_description': submission.task_description or '',
                 'type': submission.submission_type,
                 'status': submission.status,
@@ -282,9 +288,9 @@ def get_submission(submission_id: str) -> Dict[str, Any]:
                 'user_name': submission.user_id.name if submission.user_id else 'Unknown',
                 'files': [{
                     'id': str(i),
-                    'filename': f.filename,
-                    'content': f.file_content,
-                    'file_type': f.file_type
+                    'filename': f['filename'],
+                    'content': f['content'],
+                    'file_type': f['file_type']
                 } for i, f in enumerate(files)]
             },
             'feedbacks': [{
@@ -305,6 +311,43 @@ def get_submission(submission_id: str) -> Dict[str, Any]:
         return error_response('Failed to fetch submission. Please try again.', 500)
 
 
+@bp.route('/submission/<submission_id>/files/<int:file_index>')
+@login_required
+def get_submission_file(submission_id: str, file_index: int):
+    """Stream one submission file's body from the blob store"""
+    try:
+        submission = get_submission_by_id(submission_id)
+        if not submission:
+            return not_found_response('Submission')
+        
+        if current_user.role != 'teacher' and (not submission.user_id or str(submission.user_id.id) != str(current_user.id)):
+            return forbidden_response('You do not have permission to view this submission')
+        
+        files = submission.files or []
+        if file_index < 0 or file_index >= len(files):
+            return not_found_response('File')
+        submission_file = files[file_index]
+        
+        if submission_file.file_content is not None:
+            body = submission_file.file_content  # Not yet migrated to the blob store
+        elif submission_file.content_hash and blob_store.info(submission_file.content_hash):
+            if submission_file.content_hash in request.if_none_match:
+                response = current_app.response_class(status=304)
+                response.set_etag(submission_file.content_hash)
+                return response
+            body = stream_with_context(blob_store.iter_chunks(submission_file.content_hash))
+        else:
+            return not_found_response('File')
+        
+        response = current_app.response_class(body, mimetype='text/plain')
+        if submission_file.content_hash:
+            response.set_etag(submission_file.content_hash)
+        return response
+    except Exception as e:
+        current_app.logger.error(f"Failed to fetch submission file: {str(e)}", exc_info=True)
+        return error_response('Failed to fetch file. Please try again.', 500)
+
+
 @bp.route('/submission/<submission_id>/versions')
 @login_required
 def get_submission_versions(submission_id: str) -> Dict[str, Any]:
@@ -372,7 +415,7 @@ def save_submission_version(submission_id: str) -> Dict[str, Any]:
         # Create new version
         version = SubmissionVersion(
             submission_id=submission,
-            content=submission.content or '',
+            content=submission_content(submission),
             version_number=next_version,
             note=note
         )
@@ -1,17 +1,25 @@
 """Teacher-specific routes"""
+from datetime import datetime, timezone
 from flask import request, current_app
 from flask_login import login_required, current_user
-from datetime import datetime, timedelta
 from typing import Dict, Any
-from app.models import User, Submission, Feedback, PeerReview
-from app.services import performance_predictor_service, ai_service
-from app.utils.response_utils import success_response, error_response, forbidden_response
-from app.config import DEPARTMENT_OPTIONS
+from app.models import Submission, PlagiarismReport, Announcement, Deadline, User
+from app.services import (
+    performance_predictor_service, ai_service, plagiarism_service, peer_matching_service,
+    department_progress_service, notification_inbox
+)
+from app.utils.dept_utils import get_or_create_department_course
+from app.utils.model_utils import get_submission_by_id, get_course_by_id, to_object_id
+from app.utils.response_utils import success_response, error_response, not_found_response, forbidden_response
+from app.config import DEPARTMENT_OPTIONS, DEFAULT_DEPARTMENT
+from app.exceptions.api_exceptions import ValidationError
 
 from . import api_v1
 
 bp = api_v1
 
+ANNOUNCEMENT_PRIORITIES = ('low', 'normal', 'high', 'urgent')
+
 
 @bp.route('/teacher/progress/<department>')
 @login_required
@@ -26,52 +34,7 @@ def get_department_progress(department: str) -> Dict[str, Any]:
         if department not in valid_departments:
             return error_response('Invalid department', 400)
         
-        # Optimize query - use only() to limit fields fetched
-        users_in_dept = User.objects(department=department, role='student').only('id')
-        user_ids = [u.id for u in users_in_dept]
-        # Limit submissions to avoid loading too many
-        submissions = list(Submission.objects(user_id__in=user_ids).limit(1000))
-        
-        total_submissions = len(submissions)
-        # Filter out None user_ids before counting unique students
-        unique_students = len(set(str(s.user_id.id) for s in submissions if s.user_id))
-        
-        submission_ids = [s.id for s in submissions]
-        # Limit feedbacks and peer reviews to avoid loading too much data
-        feedbacks = list(Feedback.objects(submission_id__in=submission_ids).limit(500))
-        peer_reviews = list(PeerReview.objects(submission_id__in=submission_ids).limit(500))
-        
-        total_score = 0
-        score_count = 0
-        for fb in feedbacks:
-            scores = fb.get_scores()
-            if scores:
-                values = list(scores.values())
-                if values:
-                    total_score += sum(values) / len(values)
-                    score_count += 1
-        
-        avg_score = (total_score / score_count * 100) if score_count > 0 else 0
-        
-        status_counts = {}
-        for sub in submissions:
-            status_counts[sub.status] = status_counts.get(sub.status, 0) + 1
-        
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        recent_submissions = [s for s in submissions if s.created_at >= week_ago]
-        
-        return success_response({
-            'department': department,
-            'total_submissions': total_submissions,
-            'unique_students': unique_students,
-            'total_feedbacks': len(feedbacks),
-            'total_peer_reviews': len(peer_reviews),
-            'completed_peer_reviews': len([pr for pr in peer_reviews if pr.status == 'completed']),
-            'pending_peer_reviews': len([pr for pr in peer_reviews if pr.status == 'pending']),
-            'average_score': round(avg_score, 2),
-            'status_breakdown': status_counts,
-            'recent_submissions': len(recent_submissions),
-        })
+        return success_response(department_progress_service.progress(department))
     except Exception as e:
         current_app.logger.error(f"Failed to fetch department progress: {str(e)}", exc_info=True)
         return error_response('Failed to fetch department progress. Please try again.', 500)
@@ -101,9 +64,17 @@ def check_plagiarism() -> Dict[str, Any]:
             return forbidden_response('Only teachers can check for plagiarism')
         
         data = request.json or {}
+        submission_id = data.get('submission_id')
         content = data.get('content', '')
         
-        if not content:
+        # Prefer checking a stored submission: it is scoped to its course/assignment and
+        # compared with earlier submissions only
+        submission = None
+        if submission_id:
+            submission = get_submission_by_id(submission_id)
+            if not submission:
+                return not_found_response('Submission')
+        elif not content:
             return error_response('Content is required', 400)
         
         # Validate content size
@@ -111,8 +82,271 @@ def check_plagiarism() -> Dict[str, Any]:
         if len(content) > MAX_FILE_SIZE:
             return error_response(f'Content too large. Maximum size is {MAX_FILE_SIZE // (1024*1024)}MB', 400)
         
-        result = ai_service.check_plagiarism(content)
+        result = ai_service.check_plagiarism(
+            content,
+            submission=submission,
+            submission_type=data.get('type')
+        )
         return success_response(result)
     except Exception as e:
         current_app.logger.error(f"Failed to check plagiarism: {str(e)}", exc_info=True)
         return error_response('Failed to check plagiarism. Please try again.', 500)
+
+
+def serialize_plagiarism_report(report: PlagiarismReport, include_pairs: bool = True) -> Dict[str, Any]:
+    """Serialize a cohort plagiarism report"""
+    data = {
+        'id': str(report.id),
+        'course_id': str(report.course_id.id) if report.course_id else None,
+        'assignment_title': report.assignment_title,
+        'status': report.status,
+        'threshold': report.threshold,
+        'min_similarity': report.min_similarity,
+        'submission_count': report.submission_count,
+        'pair_count': report.pair_count,
+        'suspicious_count': report.suspicious_count,
+        'duration_ms': report.duration_ms,
+        'error': report.error,
+        'created_at': report.created_at.isoformat() if report.created_at else None,
+        'finished_at': report.finished_at.isoformat() if report.finished_at else None,
+    }
+    if include_pairs:
+        data['pairs'] = report.pairs or []
+    return data
+
+
+@bp.route('/teacher/plagiarism-reports', methods=['POST'])
+@login_required
+def create_plagiarism_report() -> Dict[str, Any]:
+    """Queue a report comparing every submission of a course and/or assignment with each other"""
+    try:
+        if current_user.role != 'teacher':
+            return forbidden_response('Only teachers can run plagiarism reports')
+        
+        data = request.json or {}
+        course_id = data.get('course_id')
+        assignment_title = (data.get('assignment_title') or '').strip() or None
+        if not course_id and not assignment_title:
+            return error_response('course_id or assignment_title is required', 400)
+        
+        course = None
+        if course_id:
+            course = get_course_by_id(course_id)
+            if not course:
+                return not_found_response('Course')
+        
+        from app.config import PLAGIARISM_THRESHOLD, PLAGIARISM_REPORT_MIN_SIMILARITY
+        try:
+            threshold = float(data.get('threshold', PLAGIARISM_THRESHOLD))
+            min_similarity = float(data.get('min_similarity', PLAGIARISM_REPORT_MIN_SIMILARITY))
+        except (TypeError, ValueError):
+            return error_response('threshold and min_similarity must be numbers', 400)
+        if not 0 < threshold <= 1:
+            return error_response('threshold must be between 0 and 1', 400)
+        
+        # Built by the plagiarism worker; poll GET /teacher/plagiarism-reports/<id> for the pairs
+        report = plagiarism_service.enqueue_report(
+            course=course,
+            assignment_title=assignment_title,
+            requested_by=current_user,
+            threshold=threshold,
+            min_similarity=min(threshold, min_similarity)
+        )
+        return success_response({'report': serialize_plagiarism_report(report)}), 202
+    except Exception as e:
+        current_app.logger.error(f"Failed to queue plagiarism report: {str(e)}", exc_info=True)
+        return error_response('Failed to queue plagiarism report. Please try again.', 500)
+
+
+@bp.route('/teacher/plagiarism-reports', methods=['GET'])
+@login_required
+def list_plagiarism_reports() -> Dict[str, Any]:
+    """List recent plagiarism reports, optionally filtered by course or assignment"""
+    try:
+        if current_user.role != 'teacher':
+            return forbidden_response('Only teachers can view plagiarism reports')
+        
+        query = {}
+        course_id = to_object_id(request.args.get('course_id', ''))
+        if course_id:
+            query['course_id'] = course_id
+        if request.args.get('assignment_title'):
+            query['assignment_title'] = request.args['assignment_title']
+        
+        reports = PlagiarismReport.objects(**query).exclude('pairs').order_by('-created_at').limit(50)
+        return success_response({
+            'reports': [serialize_plagiarism_report(r, include_pairs=False) for r in reports]
+        })
+    except Exception as e:
+        current_app.logger.error(f"Failed to list plagiarism reports: {str(e)}", exc_info=True)
+        return error_response('Failed to list plagiarism reports. Please try again.', 500)
+
+
+@bp.route('/teacher/plagiarism-reports/<report_id>', methods=['GET'])
+@login_required
+def get_plagiarism_report(report_id: str) -> Dict[str, Any]:
+    """Get a stored plagiarism report with its ranked pairs"""
+    try:
+        if current_user.role != 'teacher':
+            return forbidden_response('Only teachers can view plagiarism reports')
+        
+        obj_id = to_object_id(report_id)
+        report = PlagiarismReport.objects(id=obj_id).first() if obj_id else None
+        if not report:
+            return not_found_response('Plagiarism report')
+        return success_response({'report': serialize_plagiarism_report(report)})
+    except Exception as e:
+        current_app.logger.error(f"Failed to fetch plagiarism report: {str(e)}", exc_info=True)
+        return error_response('Failed to fetch plagiarism report. Please try again.', 500)
+
+
+@bp.route('/teacher/peer-reviews/assign', methods=['POST'])
+@login_required
+def assign_peer_reviews() -> Dict[str, Any]:
+    """Assign reviewers to every submission of a course and/or assignment in one balanced pass"""
+    try:
+        if current_user.role != 'teacher':
+            return forbidden_response('Only teachers can assign peer reviews')
+        
+        data = request.json or {}
+        course_id = data.get('course_id')
+        assignment_title = (data.get('assignment_title') or '').strip() or None
+        if not course_id and not assignment_title:
+            return error_response('course_id or assignment_title is required', 400)
+        
+        from app.config import DEFAULT_PEERS_PER_SUBMISSION, MIN_PEERS_PER_SUBMISSION, MAX_PEERS_PER_SUBMISSION
+        try:
+            peers_per_submission = int(data.get('peers_per_submission', DEFAULT_PEERS_PER_SUBMISSION))
+            max_reviews = data.get('max_reviews_per_reviewer')
+            max_reviews = int(max_reviews) if max_reviews is not None else None
+        except (TypeError, ValueError):
+            return error_response('peers_per_submission and max_reviews_per_reviewer must be integers', 400)
+        if not MIN_PEERS_PER_SUBMISSION <= peers_per_submission <= MAX_PEERS_PER_SUBMISSION:
+            return error_response(
+                f'peers_per_submission must be between {MIN_PEERS_PER_SUBMISSION} and {MAX_PEERS_PER_SUBMISSION}', 400
+            )
+        if max_reviews is not None and max_reviews < 1:
+            return error_response('max_reviews_per_reviewer must be at least 1', 400)
+        
+        query = {'is_practice__ne': True}
+        if course_id:
+            course = get_course_by_id(course_id)
+            if not course:
+                return not_found_response('Course')
+            query['course_id'] = course
+        if assignment_title:
+            query['assignment_title'] = assignment_title
+        submissions = list(Submission.objects(**query).only('id', 'user_id', 'assignment_title').order_by('created_at'))
+        
+        assignments = peer_matching_service.assign_reviewers(
+            submissions,
+            peers_per_submission=peers_per_submission,
+            max_reviews_per_reviewer=max_reviews
+        )
+        return success_response({
+            'submissions': len(submissions),
+            'assigned': sum(len(reviewers) for reviewers in assignments.values()),
+            'assignments': assignments
+        })
+    except Exception as e:
+        current_app.logger.error(f"Failed to assign peer reviews: {str(e)}", exc_info=True)
+        return error_response('Failed to assign peer reviews. Please try again.', 500)
+
+
+def _broadcast_department(data: Dict[str, Any]) -> str:
+    """Department a teacher broadcast goes to: the one given, else the teacher's own"""
+    department = data.get('department') or current_user.department or DEFAULT_DEPARTMENT
+    if department not in {opt['value'] for opt in DEPARTMENT_OPTIONS}:
+        raise ValidationError('Invalid department')
+    return department
+
+
+def _department_students(department: str) -> list:
+    return list(User.objects(department=department, role='student').scalar('id'))
+
+
+@bp.route('/teacher/announcements', methods=['POST'])
+@login_required
+def create_announcement() -> Dict[str, Any]:
+    """Post an announcement and notify every student of the department"""
+    try:
+        if current_user.role != 'teacher':
+            return forbidden_response('Only teachers can post announcements')
+        
+        data = request.json or {}
+        title = (data.get('title') or '').strip()
+        content = (data.get('content') or '').strip()
+        if not title or not content:
+            return error_response('Title and content are required', 400)
+        priority = data.get('priority') or 'normal'
+        if priority not in ANNOUNCEMENT_PRIORITIES:
+            return error_response(f"priority must be one of: {', '.join(ANNOUNCEMENT_PRIORITIES)}", 400)
+        department = _broadcast_department(data)
+        
+        announcement = Announcement(
+            course_id=get_or_create_department_course(department),
+            title=title[:200],
+            content=content,
+            priority=priority,
+            created_by=current_user.id,
+            is_pinned=bool(data.get('is_pinned', False))
+        )
+        announcement.save()
+        
+        notified = notification_inbox.notify_many(
+            _department_students(department),
+            title=f'Announcement: {title}'[:200],
+            message=content[:500],
+            notification_type='announcement',
+            related_id=str(announcement.id)
+        )
+        return success_response({'announcement_id': str(announcement.id), 'notified': notified})
+    except ValidationError as e:
+        return error_response(e.message, 400)
+    except Exception as e:
+        current_app.logger.error(f"Failed to post announcement: {str(e)}", exc_info=True)
+        return error_response('Failed to post announcement. Please try again.', 500)
+
+
+@bp.route('/teacher/deadlines', methods=['POST'])
+@login_required
+def create_deadline() -> Dict[str, Any]:
+    """Set a deadline and notify every student of the department"""
+    try:
+        if current_user.role != 'teacher':
+            return forbidden_response('Only teachers can set deadlines')
+        
+        data = request.json or {}
+        title = (data.get('title') or '').strip()
+        if not title or not data.get('due_date'):
+            return error_response('Title and due_date are required', 400)
+        try:
+            due_date = datetime.fromisoformat(str(data['due_date']).replace('Z', '+00:00'))
+        except ValueError:
+            return error_response('due_date must be an ISO 8601 date', 400)
+        if due_date.tzinfo:
+            due_date = due_date.astimezone(timezone.utc).replace(tzinfo=None)
+        department = _broadcast_department(data)
+        
+        deadline = Deadline(
+            course_id=get_or_create_department_course(department),
+            title=title[:200],
+            description=data.get('description') or '',
+            due_date=due_date,
+            created_by=current_user.id
+        )
+        deadline.save()
+        
+        notified = notification_inbox.notify_many(
+            _department_students(department),
+            title=f'New deadline: {title}'[:200],
+            message=f"Due {due_date.strftime('%Y-%m-%d %H:%M')} UTC",
+            notification_type='deadline',
+            related_id=str(deadline.id)
+        )
+        return success_response({'deadline_id': str(deadline.id), 'notified': notified})
+    except ValidationError as e:
+        return error_response(e.message, 400)
+    except Exception as e:
+        current_app.logger.error(f"Failed to set deadline: {str(e)}", exc_info=True)
+        return error_response('Failed to set deadline. Please try again.', 500)
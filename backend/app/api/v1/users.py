@@ -6,13 +6,18 @@ from app.utils.auth_utils import normalize_email, is_metropolia_email, hash_pass
 from app.utils.response_utils import success_response, error_response
 from app.utils.validation import validate_string_length, validate_email, validate_password
 from app.utils.security_utils import sanitize_input
-from app.config import DEFAULT_DEPARTMENT, DEPARTMENT_OPTIONS
-import base64
+from app.config import DEFAULT_DEPARTMENT, DEPARTMENT_OPTIONS, AVATAR_CONTENT_TYPES, AVATAR_MAX_BYTES
+from app.exceptions.api_exceptions import ValidationError
+from app.services import avatar_service
 
 from . import api_v1
 
 bp = api_v1
 
+def _avatar_url(user):
+    """Immutable, browser-cacheable URL of the user's avatar (None without one)"""
+    return avatar_service.url(user.avatar_hash)
+
 @bp.route('/user/profile', methods=['GET'])
 @login_required
 def get_user_profile():
@@ -27,7 +32,7 @@ def get_user_profile():
             'skill_level': getattr(current_user, 'skill_level', None),
             'created_at': current_user.created_at.isoformat() if hasattr(current_user, 'created_at') and current_user.created_at else None,
             'theme_preference': getattr(current_user, 'theme_preference', 'light') or 'light',
-            'avatar_url': getattr(current_user, 'avatar_url', None)
+            'avatar_url': _avatar_url(current_user)
         })
     except Exception as e:
         from flask import current_app
@@ -89,10 +94,11 @@ def update_user_profile():
         
         if 'avatar_url' in data:
             avatar_url = data['avatar_url']
-            # Validate avatar_url length if provided
-            if avatar_url and len(avatar_url) > 10000000:  # 10MB max
-                return error_response('Avatar URL/data is too large. Maximum size is 10MB', 400)
-            current_user.avatar_url = avatar_url
+            if not avatar_url:
+                current_user.avatar_hash = None
+            elif avatar_url != _avatar_url(current_user):
+                # Inline data URLs are still accepted, but stored in the blob store
+                current_user.avatar_hash = avatar_service.store_data_url(avatar_url)
         
         current_user.save()
         
@@ -106,9 +112,11 @@ def update_user_profile():
                 'skill_level': getattr(current_user, 'skill_level', None),
                 'created_at': current_user.created_at.isoformat() if hasattr(current_user, 'created_at') and current_user.created_at else None,
                 'theme_preference': getattr(current_user, 'theme_preference', 'light') or 'light',
-                'avatar_url': getattr(current_user, 'avatar_url', None)
+                'avatar_url': _avatar_url(current_user)
             }
         }, message='Profile updated successfully')
+    except ValidationError as e:
+        return error_response(e.message, 400)
     except Exception as e:
         from flask import current_app
         current_app.logger.error(f"Failed to update profile: {str(e)}", exc_info=True)
@@ -145,31 +153,26 @@ def upload_avatar():
         if file.filename == '':
             return error_response('No file selected', 400)
         
-        allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
         file_ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
-        if file_ext not in allowed_extensions:
+        if file_ext not in AVATAR_CONTENT_TYPES:
             return error_response('Invalid file type. Allowed: PNG, JPG, JPEG, GIF, WEBP', 400)
         
         file.seek(0, 2)  # SEEK_END
         file_size = file.tell()
         file.seek(0)
-        # Reduce max size to 3MB to ensure base64 encoded data fits in MongoDB (3MB -> ~4MB base64)
-        if file_size > 3 * 1024 * 1024:
-            return error_response('File too large. Maximum size is 3MB', 400)
-        
-        file_data = file.read()
-        base64_data = base64.b64encode(file_data).decode('utf-8')
-        data_url = f'data:image/{file_ext};base64,{base64_data}'
+        if file_size > AVATAR_MAX_BYTES:
+            return error_response(f'File too large. Maximum size is {AVATAR_MAX_BYTES // (1024 * 1024)}MB', 400)
         
-        # Validate data URL length before saving (with some safety margin)
-        max_url_length = 10000000  # 10MB
-        if len(data_url) > max_url_length:
-            return error_response(f'Image too large when encoded. Please use a smaller image (max ~3MB original)', 400)
-        
-        current_user.avatar_url = data_url
+        # Stored once by content hash, with thumbnails; the user only keeps the hash
+        current_user.avatar_hash = avatar_service.store(file.read(), AVATAR_CONTENT_TYPES[file_ext])
         current_user.save()
         
-        return success_response({'avatar_url': data_url}, message='Avatar uploaded successfully')
+        return success_response({
+            'avatar_url': _avatar_url(current_user),
+            'avatar_hash': current_user.avatar_hash
+        }, message='Avatar uploaded successfully')
+    except ValidationError as e:
+        return error_response(e.message, 400)
     except Exception as e:
         from flask import current_app
         current_app.logger.error(f"Failed to upload avatar: {str(e)}", exc_info=True)
@@ -39,11 +39,103 @@ ALLOWED_FILE_EXTENSIONS = {
 DEFAULT_PEERS_PER_SUBMISSION = 2
 MIN_PEERS_PER_SUBMISSION = 1
 MAX_PEERS_PER_SUBMISSION = 5
+MAX_REVIEWS_PER_REVIEWER = int(os.getenv('MAX_REVIEWS_PER_REVIEWER', 5))  # Pending reviews a student can hold before being skipped
 ALLOW_SELF_REVIEW = os.getenv('ALLOW_SELF_REVIEW', 'false').lower() == 'true'  # Allow students to review their own submissions (for testing/small setups)
 
+# AI Response Cache Constants
+AI_CACHE_ENABLED = os.getenv('AI_CACHE_ENABLED', 'true').lower() == 'true'
+AI_CACHE_TTL_SECONDS = int(os.getenv('AI_CACHE_TTL_SECONDS', 7 * 24 * 3600))  # 7 days
+AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', 10000))  # Mongo tier, LRU-evicted beyond this
+AI_CACHE_MEMORY_ENTRIES = int(os.getenv('AI_CACHE_MEMORY_ENTRIES', 256))  # In-process front tier
+
+# Semantic Similarity Constants
+SIMILARITY_MODEL_NAME = os.getenv('SIMILARITY_MODEL_NAME', 'all-MiniLM-L6-v2')  # SentenceTransformer model
+SIMILARITY_ENCODE_BATCH_SIZE = int(os.getenv('SIMILARITY_ENCODE_BATCH_SIZE', 64))
+
+# Embedding Store Constants
+EMBEDDINGS_ENABLED = os.getenv('EMBEDDINGS_ENABLED', 'false').lower() == 'true'  # Queue writes for the embedding worker
+EMBEDDING_STORE_DIR = os.getenv('EMBEDDING_STORE_DIR', os.path.join(project_root, 'data', 'embeddings'))  # One subdirectory per source
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 256))  # Documents per encode call
+EMBEDDING_MAX_CHARS = int(os.getenv('EMBEDDING_MAX_CHARS', 4000))  # Text beyond this is not embedded
+EMBEDDING_WORKER_POLL_SECONDS = float(os.getenv('EMBEDDING_WORKER_POLL_SECONDS', 5.0))  # Idle worker poll interval
+
+# Approximate Nearest-Neighbour Index Constants
+ANN_MIN_VECTORS = int(os.getenv('ANN_MIN_VECTORS', 20000))  # Smaller stores are scanned exactly and get no index
+ANN_NLIST = int(os.getenv('ANN_NLIST', 0))  # Inverted lists (0 = 4 * sqrt(vectors))
+ANN_NPROBE = int(os.getenv('ANN_NPROBE', 16))  # Lists scanned per query; higher is slower with better recall
+ANN_DELTA_MAX_ROWS = int(os.getenv('ANN_DELTA_MAX_ROWS', 5000))  # Inserts held outside the lists before a rebuild
+ANN_EXACT_FILTER_MAX = int(os.getenv('ANN_EXACT_FILTER_MAX', 5000))  # Scopes this small are scanned exactly
+
+# Full-Text Search Constants
+SEARCH_SNIPPET_CHARS = int(os.getenv('SEARCH_SNIPPET_CHARS', 160))  # Context shown around the first match
+SEARCH_MAX_QUERY_CHARS = int(os.getenv('SEARCH_MAX_QUERY_CHARS', 200))
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', 500))  # Deepest a search can be paged
+
+# Blob Store Constants
+BLOB_CHUNK_SIZE = int(os.getenv('BLOB_CHUNK_SIZE', 255 * 1024))  # Bytes per stored chunk
+
+# Avatar Constants
+AVATAR_MAX_BYTES = 3 * 1024 * 1024  # 3MB upload limit
+AVATAR_THUMBNAIL_SIZES = [int(size) for size in os.getenv('AVATAR_THUMBNAIL_SIZES', '64,256').split(',') if size.strip()]
+AVATAR_BASE_URL = os.getenv('AVATAR_BASE_URL', '')  # Public origin of this API for avatar URLs; defaults to the request's host
+AVATAR_CONTENT_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+
+# User Identity Cache Constants
+USER_CACHE_ENABLED = os.getenv('USER_CACHE_ENABLED', 'true').lower() == 'true'
+USER_CACHE_TTL_SECONDS = int(os.getenv('USER_CACHE_TTL_SECONDS', 60))  # Bounds staleness across app processes
+USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', 10000))
+
+# Feedback Job Queue Constants
+FEEDBACK_WORKERS = int(os.getenv('FEEDBACK_WORKERS', 0))  # Threads each app process starts on first use (0 = run `feedback-worker`)
+FEEDBACK_JOB_LEASE_SECONDS = int(os.getenv('FEEDBACK_JOB_LEASE_SECONDS', 300))  # Jobs held longer are reclaimed
+FEEDBACK_JOB_MAX_ATTEMPTS = int(os.getenv('FEEDBACK_JOB_MAX_ATTEMPTS', 3))
+FEEDBACK_JOB_POLL_SECONDS = float(os.getenv('FEEDBACK_JOB_POLL_SECONDS', 2.0))  # Idle worker poll interval
+
+# Plagiarism Detection Constants
+PLAGIARISM_KGRAM_SIZE = int(os.getenv('PLAGIARISM_KGRAM_SIZE', 5))  # Tokens per k-gram
+PLAGIARISM_WINDOW_SIZE = int(os.getenv('PLAGIARISM_WINDOW_SIZE', 4))  # Winnowing window (k-grams)
+PLAGIARISM_NUM_PERM = int(os.getenv('PLAGIARISM_NUM_PERM', 128))  # MinHash signature length
+PLAGIARISM_LSH_BANDS = int(os.getenv('PLAGIARISM_LSH_BANDS', 32))  # Must divide PLAGIARISM_NUM_PERM; 32x4 targets ~0.4 Jaccard
+PLAGIARISM_THRESHOLD = float(os.getenv('PLAGIARISM_THRESHOLD', 0.5))  # Jaccard similarity flagged as plagiarism
+PLAGIARISM_TOP_K = int(os.getenv('PLAGIARISM_TOP_K', 5))
+PLAGIARISM_REPORT_MIN_SIMILARITY = float(os.getenv('PLAGIARISM_REPORT_MIN_SIMILARITY', 0.3))  # Lowest pair similarity kept in reports
+PLAGIARISM_REPORT_MAX_PAIRS = int(os.getenv('PLAGIARISM_REPORT_MAX_PAIRS', 500))
+PLAGIARISM_MATRIX_CHUNK_ROWS = int(os.getenv('PLAGIARISM_MATRIX_CHUNK_ROWS', 256))  # Rows scored per block, bounds memory
+PLAGIARISM_MATRIX_WORKERS = int(os.getenv('PLAGIARISM_MATRIX_WORKERS', min(4, os.cpu_count() or 1)))
+PLAGIARISM_MATRIX_PARALLEL_ROWS = int(os.getenv('PLAGIARISM_MATRIX_PARALLEL_ROWS', 2000))  # Below this, process start-up costs more than it saves
+PLAGIARISM_REPORT_LEASE_SECONDS = int(os.getenv('PLAGIARISM_REPORT_LEASE_SECONDS', 1800))  # Running reports held longer are reclaimed
+PLAGIARISM_REPORT_MAX_ATTEMPTS = int(os.getenv('PLAGIARISM_REPORT_MAX_ATTEMPTS', 2))
+PLAGIARISM_WORKER_POLL_SECONDS = float(os.getenv('PLAGIARISM_WORKER_POLL_SECONDS', 5.0))  # Idle worker poll interval
+
+# Department Progress Constants
+DEPARTMENT_ROLLUPS_ENABLED = os.getenv('DEPARTMENT_ROLLUPS_ENABLED', 'false').lower() == 'true'  # Serve /teacher/progress from daily rollups
+DEPARTMENT_ROLLUP_REFRESH_SECONDS = float(os.getenv('DEPARTMENT_ROLLUP_REFRESH_SECONDS', 60.0))  # Rollup worker pause between refreshes
+
+# Notification Stream Constants
+NOTIFICATION_STREAM_QUEUE_SIZE = int(os.getenv('NOTIFICATION_STREAM_QUEUE_SIZE', 100))  # Pending pushes kept per connection
+NOTIFICATION_STREAM_HEARTBEAT_SECONDS = int(os.getenv('NOTIFICATION_STREAM_HEARTBEAT_SECONDS', 25))
+# Feed the stream hub from a change stream on notifications (replica set required); needed when
+# notifications are created in other processes (several app workers, feedback-worker)
+NOTIFICATION_CHANGE_STREAM_ENABLED = os.getenv('NOTIFICATION_CHANGE_STREAM_ENABLED', 'false').lower() == 'true'
+NOTIFICATION_ARCHIVE_AFTER_DAYS = int(os.getenv('NOTIFICATION_ARCHIVE_AFTER_DAYS', 180))  # archive-notifications default
+
 # Flashcard Constants
 DEFAULT_FLASHCARD_COUNT = 25
 MAX_FLASHCARD_COUNT = 100
+FLASHCARD_IMPORT_BATCH_SIZE = int(os.getenv('FLASHCARD_IMPORT_BATCH_SIZE', '500'))  # Cards per insert_many
+FLASHCARD_IMPORT_MAX_ROWS = int(os.getenv('FLASHCARD_IMPORT_MAX_ROWS', '10000'))  # Rows read from one imported deck
+FLASHCARD_IMPORT_MAX_JSON_BYTES = int(os.getenv('FLASHCARD_IMPORT_MAX_JSON_BYTES', 2 * 1024 * 1024))  # .json decks are parsed whole; CSV/JSONL stream
+FLASHCARD_MIN_EASE = 1.3  # SM-2 floor for the ease factor
+FLASHCARD_MAX_INTERVAL_DAYS = int(os.getenv('FLASHCARD_MAX_INTERVAL_DAYS', '365'))
+# Answer verification: cosine similarity to the stored answer at or below REJECT is incorrect. Nothing is
+# accepted on similarity alone (negations and near-miss numbers score high), so the rest goes to Gemini
+FLASHCARD_VERIFY_REJECT_SIMILARITY = float(os.getenv('FLASHCARD_VERIFY_REJECT_SIMILARITY', '0.3'))
 
 # Quiz Constants
 DEFAULT_QUIZ_TIME_LIMIT = 20  # minutes
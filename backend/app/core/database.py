@@ -27,6 +27,10 @@ def init_db():
         from app.utils.db_utils import init_db as init_default_data
         init_default_data()
         
+        # Build any declared indexes that are missing (background builds)
+        from app.core.indexes import sync_indexes
+        sync_indexes()
+        
         return True
     except Exception as e:
         # Log error but don't crash the app
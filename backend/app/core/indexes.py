@@ -0,0 +1,129 @@
+"""Index catalogue synchronisation and drift reporting"""
+import logging
+from typing import Dict, List, Optional
+
+from mongoengine import Document
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+def get_indexed_documents() -> List[type]:
+    """Return every top-level Document class exported by app.models"""
+    from app import models
+
+    documents = []
+    for name in models.__all__:
+        model = getattr(models, name)
+        if isinstance(model, type) and issubclass(model, Document) and not model._meta.get('abstract'):
+            documents.append(model)
+    return documents
+
+
+def _raw_collection(document):
+    """Get the PyMongo collection without triggering MongoEngine's auto index creation"""
+    return document._get_db()[document._get_collection_name()]
+
+
+def _sorted_text_keys(keys) -> list:
+    """Key list with the fields of a text index in name order (the server does not keep declaration order)"""
+    keys = list(keys)
+    text = sorted(key for key in keys if key[1] == 'text')
+    if not text:
+        return keys
+    at = next(i for i, key in enumerate(keys) if key[1] == 'text')
+    rest = [key for key in keys if key[1] != 'text']
+    return rest[:at] + text + rest[at:]
+
+
+def _declared_indexes(document) -> List[list]:
+    """Index key lists declared in the document meta, plus the implicit _id index"""
+    declared = [_sorted_text_keys(spec['fields']) for spec in document._meta.get('index_specs') or []]
+    if [('_id', 1)] not in declared:
+        declared.append([('_id', 1)])
+    return declared
+
+
+def _existing_indexes(collection) -> Dict[str, list]:
+    """Map index name -> key list for the indexes that exist on a collection"""
+    existing = {}
+    for name, info in collection.index_information().items():
+        keys = list(info['key'])
+        if ('_fts', 'text') in keys:
+            # Text indexes are stored as _fts/_ftsx (after any prefix keys); rebuild them from the weights
+            at = keys.index(('_fts', 'text'))
+            keys = keys[:at] + [(field, 'text') for field in info.get('weights', {})] + keys[at + 2:]
+        existing[name] = _sorted_text_keys(keys)
+    return existing
+
+
+def _index_usage(collection) -> Optional[Dict[str, int]]:
+    """Map index name -> number of operations since the server started, or None if unsupported"""
+    try:
+        return {
+            stat['name']: int(stat.get('accesses', {}).get('ops', 0))
+            for stat in collection.aggregate([{'$indexStats': {}}])
+        }
+    except (OperationFailure, NotImplementedError) as e:
+        logger.debug(f"$indexStats unavailable for {collection.name}: {e}")
+        return None
+
+
+def sync_indexes(documents: Optional[List[type]] = None) -> Dict[str, List[list]]:
+    """
+    Create any declared indexes that are missing.
+
+    Indexes are built with background=True (see ``index_background`` in each
+    model's meta) so existing collections stay available while they build.
+
+    Returns:
+        Dict of collection name -> list of index keys that were created
+    """
+    created = {}
+    for document in documents or get_indexed_documents():
+        collection = _raw_collection(document)
+        before = list(_existing_indexes(collection).values())
+        try:
+            document.ensure_indexes()
+        except OperationFailure as e:
+            logger.error(f"Failed to create indexes for {collection.name}: {e}")
+            continue
+        new_indexes = [keys for keys in _declared_indexes(document) if keys not in before]
+        if new_indexes:
+            created[collection.name] = new_indexes
+            logger.info(f"Created indexes on {collection.name}: {new_indexes}")
+    return created
+
+
+def index_report(documents: Optional[List[type]] = None) -> List[Dict]:
+    """
+    Compare declared indexes with the database and $indexStats usage counters.
+
+    Each entry contains the collection name and:
+        missing: declared indexes that do not exist yet
+        extra: indexes that exist but are not declared in any model
+        unused: declared indexes with zero recorded operations
+        usage: index name -> ops (None when $indexStats is not supported)
+    """
+    report = []
+    for document in documents or get_indexed_documents():
+        collection = _raw_collection(document)
+        declared = _declared_indexes(document)
+        existing = _existing_indexes(collection)
+        usage = _index_usage(collection)
+
+        unused = []
+        if usage is not None:
+            unused = [
+                name for name, keys in existing.items()
+                if name != '_id_' and keys in declared and usage.get(name, 0) == 0
+            ]
+
+        report.append({
+            'collection': collection.name,
+            'missing': [keys for keys in declared if keys not in existing.values()],
+            'extra': [name for name, keys in existing.items() if keys not in declared],
+            'unused': unused,
+            'usage': usage,
+        })
+    return report
@@ -0,0 +1,129 @@
+"""
+Pairwise set-similarity kernels for cohort-wide plagiarism matrices.
+
+Kept free of Flask/MongoEngine imports so spawned pool workers start quickly.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+import numpy as np
+
+try:
+    from scipy import sparse
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+_worker_state = {}
+
+
+def _shared_columns(fingerprint_sets: List[List[int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Build a CSR layout (indptr, indices) over fingerprints that occur in at least two sets.
+
+    Fingerprints unique to one submission cannot contribute to any intersection, so
+    dropping them shrinks the matrix a lot. Also returns the full set sizes for Jaccard.
+    """
+    sizes = np.array([len(s) for s in fingerprint_sets], dtype=np.int64)
+    if not sizes.sum():
+        return np.zeros(len(sizes) + 1, dtype=np.int64), np.zeros(0, dtype=np.int64), sizes
+
+    values = np.concatenate([np.asarray(s, dtype=np.int64) for s in fingerprint_sets])
+    rows = np.repeat(np.arange(len(sizes)), sizes)
+    columns, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    keep = counts[inverse] > 1
+
+    remap = np.cumsum(counts > 1) - 1  # Old column -> compact shared column id
+    indices = remap[inverse[keep]]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows[keep], minlength=len(sizes)))])
+    return indptr, indices, sizes
+
+
+def _build_matrix(indptr: np.ndarray, indices: np.ndarray, n_columns: int):
+    """Binary row matrix: scipy CSR when available, dense float32 otherwise"""
+    n_rows = len(indptr) - 1
+    if SCIPY_AVAILABLE:
+        data = np.ones(len(indices), dtype=np.float32)
+        return sparse.csr_matrix((data, indices, indptr), shape=(n_rows, n_columns))
+    dense = np.zeros((n_rows, n_columns), dtype=np.float32)
+    dense[np.repeat(np.arange(n_rows), np.diff(indptr)), indices] = 1.0
+    return dense
+
+
+def _score_rows(matrix, sizes: np.ndarray, start: int, end: int, threshold: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Jaccard of rows [start, end) against all later rows; returns pairs at or above threshold"""
+    block = matrix[start:end]
+    if SCIPY_AVAILABLE:
+        intersections = (block @ matrix.T).tocoo()
+        i, j, shared = intersections.row + start, intersections.col, intersections.data
+    else:
+        dense = block @ matrix.T
+        i, j = np.nonzero(dense)
+        shared = dense[i, j]
+        i = i + start
+
+    upper = j > i
+    i, j, shared = i[upper], j[upper], shared[upper].astype(np.float64)
+    similarity = shared / (sizes[i] + sizes[j] - shared)
+    hit = similarity >= threshold
+    return i[hit], j[hit], similarity[hit]
+
+
+def _init_worker(indptr, indices, n_columns, sizes, threshold):
+    _worker_state['matrix'] = _build_matrix(indptr, indices, n_columns)
+    _worker_state['sizes'] = sizes
+    _worker_state['threshold'] = threshold
+
+
+def _score_chunk(bounds: Tuple[int, int]):
+    start, end = bounds
+    return _score_rows(_worker_state['matrix'], _worker_state['sizes'], start, end, _worker_state['threshold'])
+
+
+def pairwise_jaccard(
+    fingerprint_sets: List[List[int]],
+    threshold: float = 0.0,
+    chunk_rows: int = 256,
+    workers: int = 1,
+    min_parallel_rows: int = 400
+) -> List[Tuple[int, int, float]]:
+    """
+    Exact Jaccard similarity for every pair of fingerprint sets that share a fingerprint.
+
+    Rows are scored in chunks of chunk_rows against the whole matrix to bound memory;
+    with workers > 1 and enough rows, chunks are spread over a spawned process pool.
+
+    Returns:
+        List of (row_a, row_b, similarity) with row_a < row_b, most similar first
+    """
+    n_rows = len(fingerprint_sets)
+    if n_rows < 2:
+        return []
+
+    indptr, indices, sizes = _shared_columns(fingerprint_sets)
+    n_columns = int(indices.max()) + 1 if len(indices) else 0
+    if not n_columns:
+        return []
+
+    chunks = [(start, min(start + chunk_rows, n_rows)) for start in range(0, n_rows, chunk_rows)]
+    init_args = (indptr, indices, n_columns, sizes, threshold)
+
+    if workers > 1 and n_rows >= min_parallel_rows and len(chunks) > 1:
+        context = multiprocessing.get_context('spawn')  # Forking a threaded server process is unsafe
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(chunks)),
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=init_args
+        ) as pool:
+            results = list(pool.map(_score_chunk, chunks))
+    else:
+        matrix = _build_matrix(indptr, indices, n_columns)
+        results = [_score_rows(matrix, sizes, start, end, threshold) for start, end in chunks]
+
+    i = np.concatenate([r[0] for r in results])
+    j = np.concatenate([r[1] for r in results])
+    similarity = np.concatenate([r[2] for r in results])
+    order = np.argsort(-similarity, kind='stable')
+    return [(int(i[k]), int(j[k]), float(similarity[k])) for k in order]
@@ -2,6 +2,7 @@
 CLI management script for Flask application
 Usage: python -m app.manage <command>
 """
+import click
 from flask.cli import FlaskGroup
 from app import create_app
 
@@ -15,6 +16,239 @@ def init_db():
     init_db()
     print("Database initialized!")
 
+@cli.command()
+@click.option('--report-only', is_flag=True, help='Only report index drift, do not create indexes')
+def sync_indexes(report_only):
+    """Create missing indexes and report drift against $indexStats"""
+    from app.core.indexes import sync_indexes as sync, index_report
+    if not report_only:
+        created = sync()
+        for collection, keys in created.items():
+            print(f"Created on {collection}: {keys}")
+        if not created:
+            print("All declared indexes already exist.")
+    
+    for entry in index_report():
+        problems = []
+        if entry['missing']:
+            problems.append(f"missing={entry['missing']}")
+        if entry['extra']:
+            problems.append(f"extra={entry['extra']}")
+        if entry['unused']:
+            problems.append(f"unused={entry['unused']}")
+        if entry['usage'] is None:
+            problems.append("usage=unavailable")
+        print(f"{entry['collection']}: {', '.join(problems) if problems else 'ok'}")
+
+@cli.command()
+@click.option('--workers', type=int, default=None, help='Worker threads (defaults to FEEDBACK_WORKERS)')
+@click.option('--once', is_flag=True, help='Drain runnable jobs and exit instead of polling')
+def feedback_worker(workers, once):
+    """Run AI feedback jobs from the queue in a dedicated process"""
+    import time
+    from flask import current_app
+    from app.services import feedback_job_service
+    if once:
+        print(f"Processed {feedback_job_service.run_pending()} feedback job(s).")
+        return
+    count = workers if workers is not None else max(feedback_job_service.workers, 1)
+    feedback_job_service.start_workers(current_app._get_current_object(), count)
+    print("Feedback workers running. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        feedback_job_service.stop_workers()
+        print("Feedback workers stopped.")
+
+@cli.command()
+@click.option('--force', is_flag=True, help='Re-fingerprint submissions whose content is unchanged')
+def rebuild_plagiarism_index(force):
+    """Fingerprint existing submissions into the plagiarism index"""
+    from app.services import plagiarism_service
+    count = plagiarism_service.rebuild(force=force)
+    print(f"Indexed {count} submission(s) for plagiarism detection.")
+
+@cli.command()
+def rebuild_student_features():
+    """Backfill the per-student feature store used by performance predictions"""
+    from app.services import student_feature_service
+    count = student_feature_service.rebuild()
+    print(f"Rebuilt features for {count} user(s).")
+
+@cli.command()
+@click.option('--department', default=None, help='Only refresh this department')
+@click.option('--full', is_flag=True, help='Recompute every day, not just days written to since the last refresh')
+def refresh_department_rollups(department, full):
+    """Refresh the daily rollups behind /teacher/progress"""
+    from app.services import department_progress_service
+    count = department_progress_service.refresh(department, full=full)
+    print(f"Refreshed {count} department day rollup(s).")
+
+@cli.command()
+def rollup_worker():
+    """Keep the daily rollups behind /teacher/progress refreshed (run in a single process)"""
+    import time
+    from flask import current_app
+    from app.services import department_progress_service
+    department_progress_service.start_worker(current_app._get_current_object())
+    print("Rollup worker running. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        department_progress_service.stop_worker()
+        print("Rollup worker stopped.")
+
+@cli.command()
+def migrate_avatars():
+    """Move inline data-URL avatars out of user documents into the blob store"""
+    from app.services import avatar_service
+    migrated, skipped = avatar_service.migrate_inline()
+    print(f"Migrated {migrated} avatar(s); skipped {skipped}.")
+
+@cli.command()
+@click.option('--days', type=int, default=None, help='Archive notifications older than this (default NOTIFICATION_ARCHIVE_AFTER_DAYS)')
+def archive_notifications(days):
+    """Move old notifications to notifications_archive"""
+    from app.config import NOTIFICATION_ARCHIVE_AFTER_DAYS
+    from app.services import notification_inbox
+    archived = notification_inbox.archive(days if days is not None else NOTIFICATION_ARCHIVE_AFTER_DAYS)
+    print(f"Archived {archived} notification(s).")
+
+@cli.command()
+def recount_notifications():
+    """Rebuild every user's unread notification counter"""
+    from app.services import notification_inbox
+    counts = notification_inbox.recount()
+    print(f"Recounted unread notifications for {len(counts)} user(s).")
+
+@cli.command()
+def migrate_submission_files():
+    """Move embedded submission file bodies into the blob store"""
+    from app.services.submission_storage import migrate_inline_files
+    migrated = migrate_inline_files()
+    print(f"Migrated files of {migrated} submission(s).")
+
+@cli.command()
+def backfill_flashcard_hashes():
+    """Set the duplicate-check hash on every flashcard created before it existed (imports also do this per user)"""
+    from app.services import flashcard_service
+    updated = flashcard_service.backfill_hashes()
+    print(f"Hashed {updated} flashcard(s).")
+
+@cli.command()
+@click.option('--once', is_flag=True, help='Drain the queue and exit instead of polling')
+def embedding_worker(once):
+    """Encode queued documents into the embedding stores (run in a single process)"""
+    import time
+    from flask import current_app
+    from app.services import embedding_service
+    if once:
+        print(f"Embedded {embedding_service.run_pending()} queued document(s).")
+        return
+    embedding_service.start_worker(current_app._get_current_object())
+    print("Embedding worker running. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        embedding_service.stop_worker()
+        print("Embedding worker stopped.")
+
+@cli.command()
+@click.option('--source', type=click.Choice(['flashcards', 'resources', 'submissions']), default=None,
+              help='Only this source (defaults to all)')
+@click.option('--compact', is_flag=True, help='Also reclaim rows of deleted documents')
+def reindex_embeddings(source, compact):
+    """Queue every document for the embedding worker; unchanged text is not re-encoded"""
+    from app.services import embedding_service
+    from app.services.embedding_service import SOURCES
+    for name in [source] if source else SOURCES:
+        print(f"{name}: queued {embedding_service.reindex(name)} document(s).")
+        if compact:
+            print(f"{name}: reclaimed {embedding_service.store(name).compact()} row(s).")
+
+@cli.command()
+@click.option('--source', type=click.Choice(['flashcards', 'resources', 'submissions']), default=None,
+              help='Only this source (defaults to all)')
+@click.option('--nlist', type=int, default=None, help='Inverted lists (defaults to ANN_NLIST or 4 * sqrt(vectors))')
+def build_ann_index(source, nlist):
+    """Rebuild the approximate nearest-neighbour index of the embedding stores"""
+    from app.services import embedding_service
+    from app.services.embedding_service import SOURCES
+    for name in [source] if source else SOURCES:
+        print(f"{name}: indexed {embedding_service.build_index(name, nlist=nlist)} vector(s).")
+
+@cli.command()
+@click.option('--vectors', 'count', type=int, default=100000, help='Synthetic vectors to index')
+@click.option('--dim', type=int, default=384, help='Vector dimension')
+@click.option('--queries', type=int, default=200, help='Queries to time')
+@click.option('--k', type=int, default=10, help='Neighbours per query')
+@click.option('--nprobe', type=int, multiple=True, help='Lists probed (repeatable; default 4, 8, 16, 32, 64)')
+@click.option('--nlist', type=int, default=None, help='Inverted lists (defaults to ANN_NLIST or 4 * sqrt(vectors))')
+def benchmark_ann(count, dim, queries, k, nprobe, nlist):
+    """Compare ANN recall and latency against an exact scan on synthetic embeddings"""
+    from app.services.ann_index import synthetic_vectors, benchmark
+    vectors = synthetic_vectors(count + queries, dim)
+    rows = benchmark(vectors[:count], vectors[count:], k=k, nprobes=nprobe or (4, 8, 16, 32, 64), nlist=nlist)
+    print(f"{count} vectors x {dim} dims, {queries} queries, recall@{k}; index built in {rows[0]['build_s']}s")
+    for row in rows:
+        label = 'exact' if row['method'] == 'exact' else f"ivf nprobe={row['nprobe']}"
+        print(f"{label:>16}: recall {row['recall']:.3f}  mean {row['mean_ms']:.2f} ms  p95 {row['p95_ms']:.2f} ms")
+
+@cli.command()
+@click.option('--once', is_flag=True, help='Build queued reports and exit instead of polling')
+def plagiarism_worker(once):
+    """Build plagiarism reports queued by teachers in a dedicated process"""
+    import time
+    from flask import current_app
+    from app.services import plagiarism_service
+    if once:
+        print(f"Built {plagiarism_service.run_pending_reports()} plagiarism report(s).")
+        return
+    plagiarism_service.start_worker(current_app._get_current_object())
+    print("Plagiarism worker running. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        plagiarism_service.stop_worker()
+        print("Plagiarism worker stopped.")
+
+@cli.command()
+@click.option('--course-id', default=None, help='Course to compare')
+@click.option('--assignment', 'assignment_title', default=None, help='Assignment title to compare')
+@click.option('--threshold', type=float, default=None, help='Similarity flagged as suspicious')
+@click.option('--workers', type=int, default=None, help='Process pool size')
+@click.option('--top', type=int, default=20, help='Pairs to print')
+def plagiarism_report(course_id, assignment_title, threshold, workers, top):
+    """Compute the pairwise plagiarism matrix for a course or assignment"""
+    from app.config import PLAGIARISM_THRESHOLD, PLAGIARISM_MATRIX_WORKERS
+    from app.services import plagiarism_service
+    from app.utils.model_utils import get_course_by_id
+    if not course_id and not assignment_title:
+        raise click.UsageError('Pass --course-id and/or --assignment')
+    course = get_course_by_id(course_id) if course_id else None
+    if course_id and not course:
+        raise click.BadParameter(f'Course {course_id} not found', param_hint='--course-id')
+    
+    report = plagiarism_service.build_report(
+        course=course,
+        assignment_title=assignment_title,
+        threshold=threshold if threshold is not None else PLAGIARISM_THRESHOLD,
+        workers=workers if workers is not None else PLAGIARISM_MATRIX_WORKERS
+    )
+    if report.status == 'failed':
+        print(f"Report failed: {report.error}")
+        return
+    print(f"Report {report.id}: {report.submission_count} submissions, {report.pair_count} pairs, "
+          f"{report.suspicious_count} suspicious ({report.duration_ms} ms)")
+    for pair in report.pairs[:top]:
+        a, b = pair['submission_a'], pair['submission_b']
+        flag = '!' if pair['suspicious'] else ' '
+        print(f"{flag} {pair['similarity']:.3f}  {a['user_name'] or a['submission_id']}  <->  {b['user_name'] or b['submission_id']}")
+
 @cli.command()
 def seed():
     """Seed the database with sample data"""
@@ -14,12 +14,21 @@ from .time_tracking import TimeTracking
 from .submission_template import SubmissionTemplate
 from .resource import Resource
 from .notification import Notification
+from .notification_counter import NotificationCounter
 from .deadline import Deadline
 from .announcement import Announcement
 from .flashcard import Flashcard
 from .weekly_challenge import WeeklyChallenge, ChallengeSubmission
 from .practice_submission import PracticeSubmission
 from .quiz import Quiz, QuizAttempt
+from .ai_response_cache import AIResponseCache
+from .feedback_job import FeedbackJob
+from .plagiarism_fingerprint import PlagiarismFingerprint
+from .plagiarism_report import PlagiarismReport
+from .student_features import StudentFeatures
+from .department_rollup import DepartmentDailyRollup
+from .blob import Blob, BlobChunk
+from .pending_embedding import PendingEmbedding
 
 __all__ = [
     'User',
@@ -36,6 +45,7 @@ __all__ = [
     'SubmissionTemplate',
     'Resource',
     'Notification',
+    'NotificationCounter',
     'Deadline',
     'Announcement',
     'Flashcard',
@@ -44,5 +54,14 @@ __all__ = [
     'PracticeSubmission',
     'Quiz',
     'QuizAttempt',
+    'AIResponseCache',
+    'FeedbackJob',
+    'PlagiarismFingerprint',
+    'PlagiarismReport',
+    'StudentFeatures',
+    'DepartmentDailyRollup',
+    'Blob',
+    'BlobChunk',
+    'PendingEmbedding',
 ]
 
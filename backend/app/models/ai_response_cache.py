@@ -0,0 +1,23 @@
+"""AI response cache model"""
+from mongoengine import Document, StringField, IntField, DateTimeField
+from datetime import datetime
+
+class AIResponseCache(Document):
+    """Persistent tier of the AI response cache, keyed by a hash of the prompt and generation settings"""
+    meta = {
+        'collection': 'ai_response_cache',
+        'indexes': [
+            {'fields': ['cache_key'], 'unique': True},
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0},  # MongoDB TTL monitor removes expired entries
+            'last_accessed',  # LRU eviction order
+        ],
+        'index_background': True,
+    }
+    
+    cache_key = StringField(required=True, max_length=64)  # SHA-256 hex digest
+    model_name = StringField(max_length=100)
+    response_text = StringField(required=True)
+    hit_count = IntField(default=0)
+    created_at = DateTimeField(default=datetime.utcnow)
+    last_accessed = DateTimeField(default=datetime.utcnow)
+    expires_at = DateTimeField(required=True)
@@ -4,7 +4,13 @@ from datetime import datetime
 
 class Announcement(Document):
     """Announcements board"""
-    meta = {'collection': 'announcements'}
+    meta = {
+        'collection': 'announcements',
+        'indexes': [
+            ('course_id', '-is_pinned', '-created_at'),
+        ],
+        'index_background': True,
+    }
     
     course_id = ReferenceField('Course')
     title = StringField(required=True, max_length=200)
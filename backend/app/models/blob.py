@@ -0,0 +1,35 @@
+"""Content-addressed blob models"""
+from mongoengine import Document, StringField, IntField, DateTimeField, DictField, BinaryField
+from datetime import datetime
+
+class Blob(Document):
+    """Metadata for an immutable blob keyed by the SHA-256 of its bytes"""
+    meta = {
+        'collection': 'blobs',
+        'indexes': [
+            {'fields': ['hash'], 'unique': True},
+        ],
+        'index_background': True,
+    }
+    
+    hash = StringField(required=True, max_length=64)  # Hex SHA-256 of the content
+    length = IntField(required=True)
+    content_type = StringField(max_length=100)
+    chunk_size = IntField(required=True)
+    chunk_count = IntField(required=True)
+    variants = DictField()  # Derived blobs, e.g. {"64": "<hash>"} for avatar thumbnails
+    created_at = DateTimeField(default=datetime.utcnow)
+
+class BlobChunk(Document):
+    """One fixed-size slice of a blob's bytes (kept well under the 16MB document limit)"""
+    meta = {
+        'collection': 'blob_chunks',
+        'indexes': [
+            {'fields': ['blob_hash', 'n'], 'unique': True},
+        ],
+        'index_background': True,
+    }
+    
+    blob_hash = StringField(required=True, max_length=64)
+    n = IntField(required=True)  # Chunk index, from 0
+    data = BinaryField(required=True)
@@ -13,7 +13,13 @@ from mongoengine import (
 class Bookmark(Document):
     """Bookmarks/Favorites for submissions, resources, flashcards, tutor chats"""
 
-    meta = {'collection': 'bookmarks'}
+    meta = {
+        'collection': 'bookmarks',
+        'indexes': [
+            ('user_id', '-created_at', '-_id'),  # /bookmarks keyset pages and duplicate checks
+        ],
+        'index_background': True,
+    }
 
     user_id = ReferenceField('User', required=True)
     submission_id = ReferenceField('Submission')
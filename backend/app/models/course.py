@@ -4,7 +4,13 @@ from datetime import datetime
 
 class Course(Document):
     """Course model"""
-    meta = {'collection': 'courses'}
+    meta = {
+        'collection': 'courses',
+        'indexes': [
+            'department',  # get_or_create_department_course
+        ],
+        'index_background': True,
+    }
     
     name = StringField(required=True, max_length=200)
     code = StringField(required=True, unique=True, max_length=50)
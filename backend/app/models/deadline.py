@@ -4,7 +4,14 @@ from datetime import datetime
 
 class Deadline(Document):
     """Assignment deadlines"""
-    meta = {'collection': 'deadlines'}
+    meta = {
+        'collection': 'deadlines',
+        'indexes': [
+            ('course_id', 'due_date'),
+            ('reminder_sent', 'due_date'),
+        ],
+        'index_background': True,
+    }
     
     course_id = ReferenceField('Course', required=True)
     title = StringField(required=True, max_length=200)
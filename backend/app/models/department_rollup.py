@@ -0,0 +1,29 @@
+"""Department daily rollup model"""
+from mongoengine import Document, StringField, IntField, FloatField, BooleanField, DateTimeField, DictField
+from datetime import datetime
+
+class DepartmentDailyRollup(Document):
+    """Precomputed progress counts for one department and one UTC day of submissions"""
+    meta = {
+        'collection': 'department_daily_rollups',
+        'indexes': [
+            {'fields': ['department', 'day'], 'unique': True},
+            ('department', 'dirty'),  # Days awaiting refresh
+        ],
+        'index_background': True,
+    }
+    
+    department = StringField(required=True, max_length=100)
+    day = StringField(required=True, max_length=10)  # 'YYYY-MM-DD' (UTC) of the submissions counted here
+    submissions = IntField(default=0)
+    status_counts = DictField()  # {"submitted": 3, "reviewed": 1, ...}
+    new_students = IntField(default=0)  # Students whose first submission fell on this day; sums to unique students
+    feedbacks = IntField(default=0)
+    score_sum = FloatField(default=0.0)  # Sum of per-feedback mean scores
+    score_count = IntField(default=0)
+    peer_reviews = IntField(default=0)
+    completed_peer_reviews = IntField(default=0)
+    pending_peer_reviews = IntField(default=0)
+    dirty = BooleanField(default=True)  # A write touched this day since the last refresh
+    dirtied_at = DateTimeField()
+    refreshed_at = DateTimeField()
@@ -4,7 +4,13 @@ from datetime import datetime
 
 class Draft(Document):
     """Draft submissions (auto-saved)"""
-    meta = {'collection': 'drafts'}
+    meta = {
+        'collection': 'drafts',
+        'indexes': [
+            ('user_id', '-last_saved'),
+        ],
+        'index_background': True,
+    }
     
     user_id = ReferenceField('User', required=True)
     assignment_title = StringField(max_length=200)
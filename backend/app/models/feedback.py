@@ -4,7 +4,13 @@ from datetime import datetime
 
 class Feedback(Document):
     """Feedback model"""
-    meta = {'collection': 'feedbacks'}
+    meta = {
+        'collection': 'feedbacks',
+        'indexes': [
+            ('submission_id', 'feedback_type', 'reviewer_id'),  # AI/peer feedback lookups per submission
+        ],
+        'index_background': True,
+    }
     
     submission_id = ReferenceField('Submission', required=True)
     reviewer_id = ReferenceField('User')  # None for AI feedback
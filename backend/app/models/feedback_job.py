@@ -0,0 +1,31 @@
+"""Feedback job model"""
+from mongoengine import Document, StringField, IntField, BooleanField, DateTimeField, ReferenceField
+from datetime import datetime
+
+class FeedbackJob(Document):
+    """Queued AI feedback generation for a submission, claimed by workers with a lease"""
+    meta = {
+        'collection': 'feedback_jobs',
+        'indexes': [
+            ('status', 'run_after'),  # Claiming queued jobs
+            ('status', 'lease_expires_at'),  # Reclaiming jobs whose worker died
+            ('submission_id', '-created_at'),  # Active job lookup per submission
+            {'fields': ['finished_at'], 'expireAfterSeconds': 7 * 24 * 3600},  # Purge finished jobs after a week
+        ],
+        'index_background': True,
+    }
+    
+    submission_id = ReferenceField('Submission', required=True)
+    requested_by = ReferenceField('User')
+    status = StringField(default='queued', choices=['queued', 'running', 'completed', 'failed'])
+    notify_user = BooleanField(default=False)  # Send a 'Feedback Generated' notification when done
+    attempts = IntField(default=0)
+    max_attempts = IntField(default=3)
+    error = StringField()
+    worker_id = StringField(max_length=100)
+    feedback_id = ReferenceField('Feedback')
+    run_after = DateTimeField(default=datetime.utcnow)  # Retry backoff
+    lease_expires_at = DateTimeField()
+    created_at = DateTimeField(default=datetime.utcnow)
+    started_at = DateTimeField()
+    finished_at = DateTimeField()
@@ -4,7 +4,13 @@ from datetime import datetime
 
 class FeedbackReaction(Document):
     """Reactions to feedback (helpful, confusing, etc.)"""
-    meta = {'collection': 'feedback_reactions'}
+    meta = {
+        'collection': 'feedback_reactions',
+        'indexes': [
+            ('feedback_id', 'user_id'),
+        ],
+        'index_background': True,
+    }
     
     feedback_id = ReferenceField('Feedback', required=True)
     user_id = ReferenceField('User', required=True)
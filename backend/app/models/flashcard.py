@@ -4,15 +4,36 @@ from datetime import datetime
 
 class Flashcard(Document):
     """Flashcard system"""
-    meta = {'collection': 'flashcards'}
+    meta = {
+        'collection': 'flashcards',
+        'indexes': [
+            ('user_id', '-created_at', '-_id'),  # /flashcards keyset pages
+            ('user_id', 'category'),
+            ('user_id', 'front_hash'),  # Duplicate checks on bulk create
+            ('user_id', 'due_at'),  # /flashcards/due study queue
+            {  # /search, always for one user (text index prefixes need an equality match)
+                'fields': ['user_id', '$front', '$back', '$category'],
+                'default_language': 'english',
+                'weights': {'front': 5, 'back': 3, 'category': 1},
+            },
+        ],
+        'index_background': True,
+        'strict': False,  # Tolerate back_embedding on older cards; answer vectors live in the embedding store
+    }
     
     user_id = ReferenceField('User', required=True)
     front = StringField(required=True)  # Question or term
     back = StringField(required=True)  # Answer or definition
     category = StringField(max_length=100)
+    front_hash = StringField(max_length=64)  # sha256 of the normalised front, see flashcard_service
     difficulty = IntField(default=1)  # 1-5
     last_reviewed = DateTimeField()
     review_count = IntField(default=0)
     mastery_level = FloatField(default=0.0)  # 0.0 to 1.0
+    # SM-2 schedule (see flashcard_service.schedule_review)
+    ease = FloatField(default=2.5)
+    interval = IntField(default=0)  # Days until the next review
+    repetitions = IntField(default=0)  # Consecutive successful reviews
+    due_at = DateTimeField(default=datetime.utcnow)  # Unset on cards created before scheduling: due now
     created_at = DateTimeField(default=datetime.utcnow)
 
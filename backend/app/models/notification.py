@@ -4,13 +4,30 @@ from datetime import datetime
 
 class Notification(Document):
     """User notifications"""
-    meta = {'collection': 'notifications'}
+    meta = {
+        'collection': 'notifications',
+        'indexes': [
+            ('user_id', '-created_at', '-_id'),  # /notifications keyset pages
+            ('user_id', 'is_read'),  # read-all, counter recounts
+            {'fields': ['read_at'], 'expireAfterSeconds': 30 * 24 * 3600},  # Purge notifications a month after they are read
+            'created_at',  # archive-notifications
+            # notify_many deduplication; older notifications have no key and are not constrained
+            {
+                'fields': ['user_id', 'dedupe_key'],
+                'unique': True,
+                'partialFilterExpression': {'dedupe_key': {'$type': 'string'}},
+            },
+        ],
+        'index_background': True,
+    }
     
     user_id = ReferenceField('User', required=True)
     title = StringField(required=True, max_length=200)
     message = StringField(required=True)
     notification_type = StringField(max_length=50)  # 'feedback', 'review', 'deadline', 'announcement'
     related_id = StringField()  # ID of related submission, feedback, etc. (as string for flexibility)
+    dedupe_key = StringField()  # '<notification_type>:<related_id>' for notifications sent once per user
     is_read = BooleanField(default=False)
+    read_at = DateTimeField()  # Set when read; drives the TTL index (unread notifications never expire)
     created_at = DateTimeField(default=datetime.utcnow)
 
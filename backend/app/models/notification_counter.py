@@ -0,0 +1,15 @@
+"""Notification counter model"""
+from mongoengine import Document, IntField, ReferenceField
+
+class NotificationCounter(Document):
+    """Per-user unread notification count, kept in step with $inc on every notification write"""
+    meta = {
+        'collection': 'notification_counters',
+        'indexes': [
+            {'fields': ['user_id'], 'unique': True},
+        ],
+        'index_background': True,
+    }
+    
+    user_id = ReferenceField('User', required=True)
+    unread = IntField(default=0)
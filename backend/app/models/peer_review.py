@@ -4,7 +4,14 @@ from datetime import datetime
 
 class PeerReview(Document):
     """Peer review model"""
-    meta = {'collection': 'peer_reviews'}
+    meta = {
+        'collection': 'peer_reviews',
+        'indexes': [
+            ('reviewer_id', '-assigned_at', '-_id'),  # /peer-reviews keyset pages
+            ('submission_id', 'reviewer_id'),  # per-submission reviews, duplicate checks
+        ],
+        'index_background': True,
+    }
     
     submission_id = ReferenceField('Submission', required=True)
     reviewer_id = ReferenceField('User', required=True)
@@ -0,0 +1,19 @@
+"""Pending embedding model"""
+from mongoengine import Document, StringField, BooleanField, DateTimeField, ObjectIdField
+from datetime import datetime
+
+class PendingEmbedding(Document):
+    """A document whose vector must be (re)computed or dropped by the embedding worker"""
+    meta = {
+        'collection': 'pending_embeddings',
+        'indexes': [
+            {'fields': ['source', 'doc_id'], 'unique': True},
+            ('source', 'queued_at'),  # Oldest first per source
+        ],
+        'index_background': True,
+    }
+    
+    source = StringField(required=True, max_length=50)  # 'flashcards', 'resources', 'submissions'
+    doc_id = ObjectIdField(required=True)
+    deleted = BooleanField(default=False)  # Drop the vector instead of encoding
+    queued_at = DateTimeField(default=datetime.utcnow)  # Re-queueing bumps this so in-flight work is redone
@@ -0,0 +1,29 @@
+"""Plagiarism fingerprint model"""
+from mongoengine import Document, StringField, IntField, DateTimeField, ListField, ReferenceField
+from datetime import datetime
+
+class PlagiarismFingerprint(Document):
+    """Winnowing fingerprints, MinHash signature and LSH band buckets for one submission"""
+    meta = {
+        'collection': 'plagiarism_fingerprints',
+        'indexes': [
+            {'fields': ['submission_id'], 'unique': True},
+            'lsh_buckets',  # Candidate lookup: any shared band bucket
+            ('course_id', 'assignment_title'),  # Per-assignment index scope
+        ],
+        'index_background': True,
+    }
+    
+    submission_id = ReferenceField('Submission', required=True)
+    user_id = ReferenceField('User')
+    course_id = ReferenceField('Course')
+    assignment_title = StringField(max_length=200)
+    submission_type = StringField(max_length=50)
+    content_hash = StringField(max_length=64)  # Skip re-indexing when content is unchanged
+    fingerprints = ListField(IntField())  # Sorted winnowed k-gram hashes, used for exact Jaccard re-ranking
+    minhash = ListField(IntField())  # MinHash signature (PLAGIARISM_NUM_PERM values)
+    lsh_buckets = ListField(StringField())  # '<band>:<hash>' keys derived from the signature
+    token_count = IntField(default=0)
+    submitted_at = DateTimeField()  # Submission creation time, for "prior submission" queries
+    created_at = DateTimeField(default=datetime.utcnow)
+    updated_at = DateTimeField(default=datetime.utcnow)
@@ -0,0 +1,33 @@
+"""Plagiarism report model"""
+from mongoengine import Document, StringField, IntField, FloatField, DateTimeField, ListField, DictField, ReferenceField
+from datetime import datetime
+
+class PlagiarismReport(Document):
+    """Cohort-wide pairwise similarity results for a course and/or assignment"""
+    meta = {
+        'collection': 'plagiarism_reports',
+        'indexes': [
+            ('course_id', 'assignment_title', '-created_at'),
+            ('requested_by', '-created_at'),
+            ('status', 'created_at'),  # Claiming queued reports
+        ],
+        'index_background': True,
+    }
+    
+    course_id = ReferenceField('Course')
+    assignment_title = StringField(max_length=200)
+    requested_by = ReferenceField('User')
+    status = StringField(default='queued', choices=['queued', 'running', 'completed', 'failed'])
+    min_similarity = FloatField()  # Pairs below this were not stored
+    threshold = FloatField()  # Pairs at or above this are flagged suspicious
+    submission_count = IntField(default=0)
+    pair_count = IntField(default=0)  # Pairs at or above min_similarity (before truncation)
+    suspicious_count = IntField(default=0)
+    pairs = ListField(DictField())  # Ranked: {submission_a, submission_b, user_a, user_b, ..., similarity, suspicious}
+    duration_ms = IntField()
+    error = StringField()
+    worker_id = StringField(max_length=100)
+    attempts = IntField(default=0)
+    lease_expires_at = DateTimeField()  # A running report past this is reclaimed by another worker
+    created_at = DateTimeField(default=datetime.utcnow)
+    finished_at = DateTimeField()
@@ -4,7 +4,13 @@ from datetime import datetime
 
 class PracticeSubmission(Document):
     """Practice mode submissions (not graded)"""
-    meta = {'collection': 'practice_submissions'}
+    meta = {
+        'collection': 'practice_submissions',
+        'indexes': [
+            ('user_id', '-created_at'),
+        ],
+        'index_background': True,
+    }
     
     user_id = ReferenceField('User', required=True)
     title = StringField(required=True, max_length=200)
@@ -4,7 +4,14 @@ from datetime import datetime
 
 class Quiz(Document):
     """Quiz/Test system"""
-    meta = {'collection': 'quizzes'}
+    meta = {
+        'collection': 'quizzes',
+        'indexes': [
+            ('department', 'is_active'),
+            'course_id',
+        ],
+        'index_background': True,
+    }
     
     title = StringField(required=True, max_length=200)
     description = StringField()
@@ -28,7 +35,14 @@ class Quiz(Document):
 
 class QuizAttempt(Document):
     """Student quiz attempts"""
-    meta = {'collection': 'quiz_attempts'}
+    meta = {
+        'collection': 'quiz_attempts',
+        'indexes': [
+            ('user_id', 'quiz_id'),
+            ('quiz_id', '-submitted_at'),
+        ],
+        'index_background': True,
+    }
     
     quiz_id = ReferenceField('Quiz', required=True)
     user_id = ReferenceField('User', required=True)
@@ -4,7 +4,18 @@ from datetime import datetime
 
 class Resource(Document):
     """Resource library items"""
-    meta = {'collection': 'resources'}
+    meta = {
+        'collection': 'resources',
+        'indexes': [
+            ('department', 'category'),
+            {  # /search; department is filtered after the text match
+                'fields': ['$title', '$tags', '$description', '$content'],
+                'default_language': 'english',
+                'weights': {'title': 10, 'tags': 5, 'description': 3, 'content': 1},
+            },
+        ],
+        'index_background': True,
+    }
     
     title = StringField(required=True, max_length=200)
     description = StringField()
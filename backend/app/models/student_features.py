@@ -0,0 +1,26 @@
+"""Student feature store model"""
+from mongoengine import Document, IntField, FloatField, DateTimeField, ReferenceField
+from datetime import datetime
+
+class StudentFeatures(Document):
+    """Running aggregates behind performance predictions, maintained with $inc on every write"""
+    meta = {
+        'collection': 'student_features',
+        'indexes': [
+            {'fields': ['user_id'], 'unique': True},
+        ],
+        'index_background': True,
+    }
+    
+    user_id = ReferenceField('User', required=True)
+    submission_count = IntField(default=0)
+    reviewed_count = IntField(default=0)  # Submissions with at least one feedback
+    score_sum = FloatField(default=0.0)  # Sum of per-feedback mean scores
+    score_count = IntField(default=0)  # Feedbacks that carried scores
+    peer_score_sum = FloatField(default=0.0)
+    peer_score_count = IntField(default=0)
+    # Trend moments over (x = submission day, y = score); trend is derived from their covariance
+    trend_x_sum = FloatField(default=0.0)
+    trend_x_sq_sum = FloatField(default=0.0)
+    trend_xy_sum = FloatField(default=0.0)
+    updated_at = DateTimeField(default=datetime.utcnow)
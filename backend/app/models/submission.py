@@ -1,22 +1,36 @@
 """Submission models"""
-from mongoengine import Document, StringField, BooleanField, DateTimeField, ListField, ReferenceField, EmbeddedDocument, EmbeddedDocumentField
+from mongoengine import Document, StringField, IntField, BooleanField, DateTimeField, ListField, ReferenceField, EmbeddedDocument, EmbeddedDocumentField
 from datetime import datetime
 
 class SubmissionFile(EmbeddedDocument):
-    """Embedded document for submission files"""
+    """Embedded document for submission file metadata (bodies live in the blob store)"""
     filename = StringField(required=True, max_length=255)
-    file_content = StringField(required=True)
+    content_hash = StringField(max_length=64)  # SHA-256 of the UTF-8 body in the blob store
+    size = IntField()  # Body length in bytes
+    file_content = StringField()  # Legacy inline body, cleared by migrate-submission-files
     file_type = StringField(max_length=50)  # 'java', 'py', 'cpp', etc.
     created_at = DateTimeField(default=datetime.utcnow)
 
 class Submission(Document):
     """Submission model"""
-    meta = {'collection': 'submissions'}
+    meta = {
+        'collection': 'submissions',
+        'indexes': [
+            ('user_id', '-created_at', '-_id'),  # /submissions keyset pages, teacher rosters (user_id__in)
+            ('course_id', 'assignment_title'),
+            {  # /search over a student's own submissions; file bodies live in the blob store, unindexed
+                'fields': ['user_id', '$assignment_title', '$task_description', '$content'],
+                'default_language': 'english',
+                'weights': {'assignment_title': 5, 'task_description': 2, 'content': 1},
+            },
+        ],
+        'index_background': True,
+    }
     
     user_id = ReferenceField('User', required=True)
     course_id = ReferenceField('Course', required=True)
     assignment_title = StringField(required=True, max_length=200)
-    content = StringField(required=True)  # Main content or combined content
+    content = StringField()  # Inline text; empty for file submissions (see services.submission_storage.submission_content)
     task_description = StringField()  # Original task/assignment description from teacher
     submission_type = StringField(required=True, max_length=50)  # 'code', 'essay', 'report'
     status = StringField(default='submitted', max_length=50)  # 'submitted', 'reviewed', 'graded', 'practice'
@@ -4,7 +4,13 @@ from datetime import datetime
 
 class SubmissionTemplate(Document):
     """Templates for common assignment types"""
-    meta = {'collection': 'submission_templates'}
+    meta = {
+        'collection': 'submission_templates',
+        'indexes': [
+            ('department', 'is_public'),
+        ],
+        'index_background': True,
+    }
     
     name = StringField(required=True, max_length=200)
     description = StringField()
@@ -4,7 +4,13 @@ from datetime import datetime
 
 class SubmissionVersion(Document):
     """Revision history for submissions"""
-    meta = {'collection': 'submission_versions'}
+    meta = {
+        'collection': 'submission_versions',
+        'indexes': [
+            ('submission_id', '-version_number'),
+        ],
+        'index_background': True,
+    }
     
     submission_id = ReferenceField('Submission', required=True)
     content = StringField(required=True)
@@ -4,7 +4,14 @@ from datetime import datetime
 
 class TimeTracking(Document):
     """Time spent on assignments"""
-    meta = {'collection': 'time_tracking'}
+    meta = {
+        'collection': 'time_tracking',
+        'indexes': [
+            ('user_id', '-start_time'),
+            'submission_id',
+        ],
+        'index_background': True,
+    }
     
     user_id = ReferenceField('User', required=True)
     submission_id = ReferenceField('Submission')
@@ -4,7 +4,14 @@ from datetime import datetime
 
 class User(Document):
     """User model"""
-    meta = {'collection': 'users'}
+    meta = {
+        'collection': 'users',
+        'indexes': [
+            ('role', 'department'),  # peer matching, department rosters
+        ],
+        'index_background': True,
+        'strict': False,  # Tolerate legacy inline avatar_url until migrate-avatars has run
+    }
     
     email = StringField(required=True, unique=True)
     password_hash = StringField(required=True)
@@ -14,7 +21,7 @@ class User(Document):
     department = StringField(default='General Studies', max_length=100)
     created_at = DateTimeField(default=datetime.utcnow)
     theme_preference = StringField(default='light', max_length=20)  # 'light', 'dark', 'auto'
-    avatar_url = StringField(max_length=10000000)  # Allow inline data URLs (10MB max for base64 encoded images)
+    avatar_hash = StringField(max_length=64)  # SHA-256 of the avatar in the blob store (served from /avatars/<hash>)
     
     def is_authenticated(self):
         return True
@@ -4,7 +4,13 @@ from datetime import datetime
 
 class WeeklyChallenge(Document):
     """Weekly challenges/competitions"""
-    meta = {'collection': 'weekly_challenges'}
+    meta = {
+        'collection': 'weekly_challenges',
+        'indexes': [
+            ('department', 'is_active', '-start_date'),
+        ],
+        'index_background': True,
+    }
     
     title = StringField(required=True, max_length=200)
     description = StringField(required=True)
@@ -18,7 +24,14 @@ class WeeklyChallenge(Document):
 
 class ChallengeSubmission(Document):
     """Submissions to weekly challenges"""
-    meta = {'collection': 'challenge_submissions'}
+    meta = {
+        'collection': 'challenge_submissions',
+        'indexes': [
+            ('challenge_id', '-score'),  # leaderboards
+            ('user_id', 'challenge_id'),
+        ],
+        'index_background': True,
+    }
     
     challenge_id = ReferenceField('WeeklyChallenge', required=True)
     user_id = ReferenceField('User', required=True)
@@ -2,17 +2,80 @@
 from .ai_service import AIService
 from .peer_matching_service import PeerMatchingService
 from .performance_predictor_service import PerformancePredictor
+from .feedback_job_service import FeedbackJobService
+from .plagiarism_service import PlagiarismService
+from .student_feature_service import StudentFeatureService
+from .department_progress_service import DepartmentProgressService
+from .user_cache import UserIdentityCache
+from .blob_store import BlobStore
+from .avatar_service import AvatarService
+from .notification_hub import NotificationHub
+from .notification_inbox import NotificationInbox
+from .flashcard_service import FlashcardService
+from .embedding_service import EmbeddingService
+from .search_service import SearchService
 
 # Create singleton instances (one instance shared across the application)
 ai_service = AIService()
 peer_matching_service = PeerMatchingService()
-performance_predictor_service = PerformancePredictor()
+student_feature_service = StudentFeatureService()
+performance_predictor_service = PerformancePredictor(student_feature_service)
+feedback_job_service = FeedbackJobService()
+plagiarism_service = PlagiarismService()
+department_progress_service = DepartmentProgressService()
+user_cache = UserIdentityCache()
+blob_store = BlobStore()
+avatar_service = AvatarService(blob_store)
+notification_hub = NotificationHub()
+notification_inbox = NotificationInbox()
+flashcard_service = FlashcardService()
+embedding_service = EmbeddingService()
+search_service = SearchService()
+
+# Keep the plagiarism index in step with Submission saves/deletes
+plagiarism_service.connect_signals()
+# Keep per-student prediction features in step with Submission/Feedback writes
+student_feature_service.connect_signals()
+# Mark department rollup days dirty (no-op unless DEPARTMENT_ROLLUPS_ENABLED)
+department_progress_service.connect_signals()
+# Drop cached identities whenever a user document is written
+user_cache.connect_signals()
+# Push new notifications to open /notifications/stream connections
+notification_hub.connect_signals()
+# Keep per-user unread counters in step with notification inserts/deletes
+notification_inbox.connect_signals()
+# Queue changed documents for the embedding worker (no-op unless EMBEDDINGS_ENABLED)
+embedding_service.connect_signals()
 
 __all__ = [
     'AIService',
     'PeerMatchingService',
     'PerformancePredictor',
+    'FeedbackJobService',
+    'PlagiarismService',
+    'StudentFeatureService',
+    'DepartmentProgressService',
+    'UserIdentityCache',
+    'BlobStore',
+    'AvatarService',
+    'NotificationHub',
+    'NotificationInbox',
+    'FlashcardService',
+    'EmbeddingService',
+    'SearchService',
     'ai_service',
     'peer_matching_service',
     'performance_predictor_service',
+    'feedback_job_service',
+    'plagiarism_service',
+    'student_feature_service',
+    'department_progress_service',
+    'user_cache',
+    'blob_store',
+    'avatar_service',
+    'notification_hub',
+    'notification_inbox',
+    'flashcard_service',
+    'embedding_service',
+    'search_service',
 ]
@@ -0,0 +1,142 @@
+"""
+AI Response Cache
+Two-tier (in-process LRU + MongoDB) cache for deterministic Gemini prompts
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from app.config import (
+    AI_CACHE_ENABLED, AI_CACHE_TTL_SECONDS,
+    AI_CACHE_MAX_ENTRIES, AI_CACHE_MEMORY_ENTRIES
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AIResponseCacheService:
+    """Content-addressed cache for AI responses"""
+
+    def __init__(
+        self,
+        ttl_seconds: int = AI_CACHE_TTL_SECONDS,
+        max_entries: int = AI_CACHE_MAX_ENTRIES,
+        memory_entries: int = AI_CACHE_MEMORY_ENTRIES,
+        enabled: bool = AI_CACHE_ENABLED
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.enabled = enabled
+        self._memory = OrderedDict()  # key -> (response_text, expires_at)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt: str, model_name: str, generation_config: Optional[Dict] = None) -> str:
+        """Hash the fully built prompt together with everything that changes the model output"""
+        payload = json.dumps({
+            'model': model_name,
+            'config': generation_config or {},
+            'prompt': prompt,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response, checking the in-process tier before MongoDB"""
+        if not self.enabled:
+            return None
+
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    return entry[0]
+                del self._memory[key]
+
+        try:
+            from app.models import AIResponseCache
+            cached = AIResponseCache.objects(cache_key=key, expires_at__gt=now).only(
+                'response_text', 'expires_at'
+            ).first()
+            if not cached:
+                return None
+            AIResponseCache.objects(cache_key=key).update_one(
+                set__last_accessed=now, inc__hit_count=1
+            )
+        except Exception as e:
+            logger.warning(f"AI cache lookup failed: {e}")
+            return None
+
+        self._remember(key, cached.response_text, cached.expires_at)
+        return cached.response_text
+
+    def set(self, key: str, response_text: str, model_name: str = None) -> None:
+        """Store a response in both tiers"""
+        if not self.enabled or not response_text:
+            return
+
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl_seconds)
+        self._remember(key, response_text, expires_at)
+
+        try:
+            from app.models import AIResponseCache
+            AIResponseCache.objects(cache_key=key).update_one(
+                upsert=True,
+                set__response_text=response_text,
+                set__model_name=model_name,
+                set__last_accessed=now,
+                set__expires_at=expires_at,
+                set_on_insert__created_at=now,
+                set_on_insert__hit_count=0,
+            )
+            self._evict_persistent()
+        except Exception as e:
+            logger.warning(f"AI cache store failed: {e}")
+
+    def invalidate(self, key: str) -> None:
+        """Remove a single entry from both tiers"""
+        with self._lock:
+            self._memory.pop(key, None)
+        try:
+            from app.models import AIResponseCache
+            AIResponseCache.objects(cache_key=key).delete()
+        except Exception as e:
+            logger.warning(f"AI cache invalidation failed: {e}")
+
+    def clear_memory(self) -> None:
+        """Drop the in-process tier (the MongoDB tier is left intact)"""
+        with self._lock:
+            self._memory.clear()
+
+    def _remember(self, key: str, response_text: str, expires_at: datetime) -> None:
+        """Insert into the in-process LRU, evicting the least recently used entries"""
+        if self.memory_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = (response_text, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _evict_persistent(self) -> None:
+        """Keep the MongoDB tier within max_entries by dropping least recently used entries"""
+        from app.models import AIResponseCache
+
+        if self.max_entries <= 0:
+            return
+        excess = AIResponseCache._get_collection().estimated_document_count() - self.max_entries
+        if excess <= 0:
+            return
+        stale_ids = [
+            entry.id for entry in
+            AIResponseCache.objects.order_by('last_accessed').only('id').limit(excess)
+        ]
+        if stale_ids:
+            AIResponseCache.objects(id__in=stale_ids).delete()
@@ -4,7 +4,13 @@ AI Services for feedback generation, plagiarism detection, and scoring
 import os
 import re
 import logging
-from typing import Dict, List, Optional
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from app.config import SIMILARITY_MODEL_NAME, SIMILARITY_ENCODE_BATCH_SIZE
+from app.services.ai_cache import AIResponseCacheService
 
 logger = logging.getLogger(__name__)
 
@@ -176,25 +182,53 @@ Do **not** use jokes like “fail with extreme prejudice” or insult the studen
         'spacing': re.compile(r'\n\s*\n'),
         'naming': re.compile(r'[a-z][A-Z]'),
     }
-    _PLAGIARISM_PATTERNS = [
-        re.compile(r'copy.*paste', re.IGNORECASE),
-        re.compile(r'from.*website', re.IGNORECASE),
-        re.compile(r'found.*online', re.IGNORECASE),
-    ]
+    _FEEDBACK_GENERATION_CONFIG = {
+        'max_output_tokens': 3000,
+        'temperature': 0.3,  # Lower temperature for consistency and strictness
+    }
     
     def __init__(self):
         self.gemini_api_key = os.environ.get('GEMINI_API_KEY')
+        self.model_name = os.environ.get('GEMINI_MODEL', 'gemini-2.0-flash')
         self.use_gemini = self.gemini_api_key is not None and GEMINI_AVAILABLE
         
         if self.use_gemini:
             try:
                 genai.configure(api_key=self.gemini_api_key)
-                self.model = genai.GenerativeModel('gemini-2.0-flash')
+                self.model = genai.GenerativeModel(self.model_name)
             except Exception:
                 self.use_gemini = False
         
         self.similarity_model = None
         self._similarity_model_loaded = False
+        self._similarity_model_lock = threading.Lock()
+        self.response_cache = AIResponseCacheService()
+    
+    def get_similarity_model(self):
+        """The SentenceTransformer, loaded on first use once per process (None when unavailable)"""
+        if not self._similarity_model_loaded:
+            with self._similarity_model_lock:
+                if not self._similarity_model_loaded:
+                    if SENTENCE_TRANSFORMER_AVAILABLE:
+                        try:
+                            self.similarity_model = SentenceTransformer(SIMILARITY_MODEL_NAME)
+                        except Exception as e:
+                            logger.warning(f"Could not load similarity model {SIMILARITY_MODEL_NAME}: {e}")
+                    self._similarity_model_loaded = True
+        return self.similarity_model
+    
+    def encode(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Unit-length float32 embeddings, one row per text (None when no similarity model is available)"""
+        model = self.get_similarity_model()
+        if model is None or not texts:
+            return None
+        vectors = model.encode(
+            list(texts),
+            batch_size=SIMILARITY_ENCODE_BATCH_SIZE,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return np.asarray(vectors, dtype=np.float32)
     
     def generate_feedback(
         self, 
@@ -211,22 +245,81 @@ Do **not** use jokes like “fail with extreme prejudice” or insult the studen
         
         try:
             prompt = self._build_feedback_prompt(content, submission_type, task_description, files)
+            cache_key = self._feedback_cache_key(prompt)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
             
             response = self.model.generate_content(
                 prompt,
-                generation_config={
-                    'max_output_tokens': 3000,
-                    'temperature': 0.3,  # Lower temperature for consistency and strictness
-                }
+                generation_config=self._FEEDBACK_GENERATION_CONFIG
             )
             
-            feedback = response.text.strip()
-            return self._format_feedback(feedback)
+            feedback = self._format_feedback(response.text.strip())
+            self.response_cache.set(cache_key, feedback, model_name=self.model_name)
+            return feedback
             
         except Exception as e:
             error_msg = f"AI evaluation failed: {str(e)}"
             return f"**Instructor Note:** {error_msg}\nThe automatic feedback could not be generated. This is a system issue, not your grade."
     
+    def generate_feedback_stream(
+        self, 
+        content: str, 
+        submission_type: str = 'code', 
+        task_description: str = '', 
+        files: Optional[List[Dict]] = None
+    ) -> Iterator[str]:
+        """Generate AI feedback with the Gemini streaming API, yielding formatted text chunks"""
+        
+        if not self.use_gemini:
+            yield self.generate_feedback(content, submission_type, task_description, files)
+            return
+        
+        prompt = self._build_feedback_prompt(content, submission_type, task_description, files)
+        cache_key = self._feedback_cache_key(prompt)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        parts = []
+        try:
+            response = self.model.generate_content(
+                prompt,
+                generation_config=self._FEEDBACK_GENERATION_CONFIG,
+                stream=True
+            )
+            # Chunks without parts (e.g. a trailing safety/finish chunk) carry no text
+            raw_chunks = (chunk.text for chunk in response if chunk.parts)
+            for piece in self._format_feedback_stream(raw_chunks):
+                parts.append(piece)
+                yield piece
+        except Exception as e:
+            error_msg = f"AI evaluation failed: {str(e)}"
+            separator = "\n\n" if parts else ""
+            yield f"{separator}**Instructor Note:** {error_msg}\nThe automatic feedback could not be generated. This is a system issue, not your grade."
+            return
+        
+        self.response_cache.set(cache_key, ''.join(parts).strip(), model_name=self.model_name)
+    
+    def get_cached_feedback(
+        self, 
+        content: str, 
+        submission_type: str = 'code', 
+        task_description: str = '', 
+        files: Optional[List[Dict]] = None
+    ) -> Optional[str]:
+        """Return previously generated feedback for identical input, without calling Gemini"""
+        if not self.use_gemini:
+            return None
+        prompt = self._build_feedback_prompt(content, submission_type, task_description, files)
+        return self.response_cache.get(self._feedback_cache_key(prompt))
+    
+    def _feedback_cache_key(self, prompt: str) -> str:
+        """Cache key for a feedback prompt under the current model and generation config"""
+        return self.response_cache.make_key(prompt, self.model_name, self._FEEDBACK_GENERATION_CONFIG)
+    
     def _build_feedback_prompt(
         self, 
         content: str, 
@@ -271,6 +364,50 @@ Do **not** use jokes like “fail with extreme prejudice” or insult the studen
             feedback = pattern.sub(replacement, feedback)
         return feedback
     
+    def _format_feedback_stream(self, chunks: Iterable[str]) -> Iterator[str]:
+        """
+        Apply _format_feedback incrementally to streamed text.
+        
+        Bullet patterns only look at the start of a line, so a line is emitted as
+        soon as its prefix is settled rather than waiting for the whole response.
+        """
+        pending = ''  # Current line text not yet emitted
+        line_open = False  # Current line's prefix has already been formatted and emitted
+        started = False  # Leading whitespace of the response is dropped, as in generate_feedback
+        
+        for chunk in chunks:
+            if not started:
+                chunk = chunk.lstrip()
+                if not chunk:
+                    continue
+                started = True
+            pending += chunk
+            
+            out = []
+            newline = pending.find('\n')
+            while newline != -1:
+                line, pending = pending[:newline + 1], pending[newline + 1:]
+                out.append(line if line_open else self._format_feedback(line))
+                line_open = False
+                newline = pending.find('\n')
+            
+            if pending and (line_open or self._line_prefix_settled(pending)):
+                out.append(pending if line_open else self._format_feedback(pending))
+                pending = ''
+                line_open = True
+            
+            if out:
+                yield ''.join(out)
+        
+        tail = pending.rstrip()
+        if tail:
+            yield tail if line_open else self._format_feedback(tail)
+    
+    @staticmethod
+    def _line_prefix_settled(line: str) -> bool:
+        """True once more text cannot change whether the line starts with a bullet marker"""
+        return line[0] not in '-*' or bool(line[1:].strip())
+    
     def score_correctness(self, content: str) -> float:
         """Score correctness/functionality (0.0 to 1.0) using optimized patterns"""
         score = 0.3  # Start lower for strictness
@@ -314,21 +451,44 @@ Do **not** use jokes like “fail with extreme prejudice” or insult the studen
         
         return (word_score * 0.6 + line_score * 0.4)  # Weight lines more
     
-    def check_plagiarism(self, content: str, threshold: float = 0.7) -> Dict:  # Lower threshold = stricter
-        """Check for plagiarism using pre-compiled patterns and semantic similarity"""
-        found_patterns = [
-            pattern for pattern in self._PLAGIARISM_PATTERNS 
-            if pattern.search(content)
-        ]
+    def check_plagiarism(
+        self, 
+        content: str = '', 
+        threshold: Optional[float] = None, 
+        submission=None, 
+        submission_type: Optional[str] = None,
+        top_k: Optional[int] = None
+    ) -> Dict:
+        """
+        Check for plagiarism against other submissions using the winnowing/MinHash index.
+        
+        With a submission, compares it to earlier submissions for the same course and
+        assignment; otherwise compares raw content against every indexed submission.
+        """
+        from app.config import PLAGIARISM_THRESHOLD, PLAGIARISM_TOP_K
+        from app.services import plagiarism_service
+        
+        threshold = PLAGIARISM_THRESHOLD if threshold is None else threshold
+        result = plagiarism_service.find_similar(
+            content=content,
+            submission_type=submission_type,
+            submission=submission,
+            top_k=top_k or PLAGIARISM_TOP_K
+        )
+        matches = result['matches']
         
-        # Stricter scoring
-        similarity_score = 0.9 if found_patterns else 0.6  # Higher baseline suspicion
-        is_plagiarized = similarity_score > threshold
+        similarity_score = matches[0]['similarity'] if matches else 0.0
+        is_plagiarized = similarity_score >= threshold
+        # Very short submissions share k-grams by chance, so trust them less
+        confidence = round(min(0.95, 0.5 + 0.45 * result['fingerprint_count'] / 50), 2)
         
         return {
             'is_plagiarized': is_plagiarized,
             'similarity_score': similarity_score,
-            'confidence': 0.95 if is_plagiarized else 0.7,
+            'similarity': similarity_score,
+            'matches': matches,
+            'threshold': threshold,
+            'confidence': confidence,
             'message': (
                 '**🚨 PLAGIARISM DETECTED** - Automatic F grade. Original work required.'
                 if is_plagiarized 
@@ -0,0 +1,340 @@
+"""
+ANN Index
+Inverted-file (IVF) approximate nearest-neighbour index over unit vectors, persisted as NumPy memmaps
+"""
+import logging
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import ANN_NLIST, ANN_NPROBE, ANN_DELTA_MAX_ROWS
+from app.services.vector_store import (
+    ID_DTYPE, OPEN_ATTEMPTS, top_k, generation_dir, meta_stamp, read_meta, publish_meta, prune_generations
+)
+
+logger = logging.getLogger(__name__)
+
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 40  # Training vectors per centroid
+ASSIGN_CHUNK_ROWS = 8192
+MAX_NLIST = 4096
+
+
+def default_nlist(count: int) -> int:
+    return max(1, min(MAX_NLIST, int(4 * math.sqrt(max(count, 1)))))
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest (highest dot product) centroid for each vector"""
+    lists = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS):
+        block = np.asarray(vectors[start:start + ASSIGN_CHUNK_ROWS], dtype=np.float32)
+        lists[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return lists
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of vectors: nlist unit-length centroids"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * KMEANS_SAMPLE_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        lists = assign_lists(sample, centroids)
+        counts = np.bincount(lists, minlength=nlist)
+        empty = counts == 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(sample[np.argsort(lists, kind='stable')], starts[~empty], axis=0)
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]  # Re-seed lists that lost every vector
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """
+    Vectors are clustered around nlist centroids and stored grouped by nearest centroid, so
+    a query scores only the nprobe lists whose centroids are closest to it.
+
+    Layout of a generation: centroids.npy, the grouped vectors.npy (float16) and ids.npy with
+    offsets.npy marking where each list starts, plus deleted.npy (a mask over those rows) and
+    delta_vectors.npy / delta_ids.npy for vectors added since the last rebuild, which every
+    query scans exactly. Updates tombstone the old row and add the vector to the delta; once
+    the delta outgrows delta_max_rows the lists are rebuilt from scratch. The grouped files
+    are memory-mapped, so opening the index is cheap and pages are shared between processes.
+
+    As with VectorStore, one process writes (the embedding worker) and readers reload
+    when meta.json changes. Every save writes a new generation directory (hard-linking the
+    grouped files when only the tombstones and delta changed) and publishes it with one
+    rename of meta.json, so a reader never pairs the lists of one build with the tombstones
+    of another.
+    """
+
+    def __init__(self, directory: str, nprobe: int = ANN_NPROBE, delta_max_rows: int = ANN_DELTA_MAX_ROWS):
+        self.directory = directory
+        self.nprobe = nprobe
+        self.delta_max_rows = delta_max_rows
+        self.dim: Optional[int] = None
+        self.trained_count = 0
+        self.generation = 0
+        self._centroids = None
+        self._vectors = None
+        self._ids = None
+        self._offsets = None
+        self._deleted = None
+        self._delta_vectors = None
+        self._delta_ids: List[str] = []
+        self._base_rows: Optional[Dict[str, int]] = None  # id -> row, built on first write
+        self._meta_stamp = None
+        self._lock = threading.RLock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(generation_dir(self.directory, self.generation), name)
+
+    def exists(self) -> bool:
+        return meta_stamp(self.directory) is not None
+
+    def __len__(self) -> int:
+        self.refresh()
+        if self._ids is None:
+            return 0
+        return int(len(self._ids) - self._deleted.sum()) + len(self._delta_ids)
+
+    def refresh(self) -> None:
+        """Re-open the files if another process rebuilt or saved the index"""
+        stamp = meta_stamp(self.directory)
+        if stamp is None or stamp == self._meta_stamp:
+            return
+        with self._lock:
+            for attempt in range(OPEN_ATTEMPTS):
+                stamp = meta_stamp(self.directory)
+                try:
+                    meta = read_meta(self.directory)
+                    files = generation_dir(self.directory, meta['generation'])
+                    arrays = {
+                        name: np.load(os.path.join(files, f'{name}.npy'), mmap_mode=mode)
+                        for name, mode in (('centroids', None), ('vectors', 'r'), ('ids', 'r'), ('offsets', None),
+                                           ('deleted', None), ('delta_vectors', None), ('delta_ids', None))
+                    }
+                    break
+                except FileNotFoundError:
+                    # That generation was pruned while we opened it; meta.json names a newer one
+                    if attempt == OPEN_ATTEMPTS - 1:
+                        raise
+            self.dim, self.trained_count, self.generation = meta['dim'], meta['trained_count'], meta['generation']
+            self._centroids = arrays['centroids']
+            self._vectors = arrays['vectors']
+            self._ids = arrays['ids']
+            self._offsets = arrays['offsets']
+            self._deleted = arrays['deleted']
+            self._delta_vectors = arrays['delta_vectors'].astype(np.float32)
+            self._delta_ids = [str(doc_id) for doc_id in arrays['delta_ids']]
+            self._base_rows = None
+            self._meta_stamp = stamp
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        Approximate top-k by cosine similarity, best first.
+
+        Scoped searches filter these results afterwards (see EmbeddingService.search).
+        """
+        self.refresh()
+        if self._centroids is None or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        nlist = len(self._centroids)
+        order = np.argsort(-(self._centroids @ query))
+        lists = order[:min(nprobe or self.nprobe, nlist)]
+
+        # The delta is small and always scanned exactly
+        delta_ids = np.asarray(self._delta_ids, dtype=ID_DTYPE)
+        delta_scores = self._delta_vectors @ query if len(delta_ids) else np.zeros(0, dtype=np.float32)
+
+        rows = np.concatenate([np.arange(self._offsets[i], self._offsets[i + 1]) for i in lists])
+        rows = rows[~self._deleted[rows]]
+        ids = np.asarray(self._ids[rows])
+        scores = np.asarray(self._vectors[rows], dtype=np.float32) @ query
+        return top_k(np.concatenate([delta_ids, ids]), np.concatenate([delta_scores, scores]), k)
+
+    # ------------------------------------------------------------------
+    # Writing (single writer process)
+    # ------------------------------------------------------------------
+
+    def build(self, ids: Sequence, vectors: np.ndarray, nlist: Optional[int] = None, seed: int = 0) -> None:
+        """Train centroids on vectors and write a fresh index (replacing any existing one)"""
+        with self._lock:
+            ids = np.asarray([str(doc_id) for doc_id in ids], dtype=ID_DTYPE)
+            if not len(ids):
+                raise ValueError('Cannot build an index without vectors')
+            nlist = min(nlist or ANN_NLIST or default_nlist(len(ids)), len(ids))
+            centroids = train_centroids(vectors, nlist, seed=seed)
+            self._write_base(centroids, ids, vectors, trained_count=len(ids))
+
+    def add(self, ids: Sequence, vectors: np.ndarray) -> None:
+        """Insert or replace vectors; rebuilds the lists once the delta grows past delta_max_rows"""
+        with self._lock:
+            self.refresh()
+            if self._centroids is None:
+                return
+            ids = [str(doc_id) for doc_id in ids]
+            vectors = np.asarray(vectors, dtype=np.float32)
+            self._tombstone(ids)
+            self._delta_ids.extend(ids)
+            self._delta_vectors = np.concatenate([self._delta_vectors, vectors]) if len(self._delta_vectors) else vectors
+            if len(self._delta_ids) > self.delta_max_rows:
+                self._rebuild()
+
+    def remove(self, ids: Iterable) -> None:
+        with self._lock:
+            self.refresh()
+            if self._centroids is not None:
+                self._tombstone([str(doc_id) for doc_id in ids])
+
+    def save(self) -> None:
+        """Publish tombstones and the delta (the grouped lists only change on rebuild, so they are linked)"""
+        with self._lock:
+            if self._centroids is None:
+                return
+            self._publish({}, link=('centroids.npy', 'vectors.npy', 'ids.npy', 'offsets.npy'))
+
+    def _tombstone(self, ids: List[str]) -> None:
+        if self._base_rows is None:
+            self._base_rows = {str(doc_id): row for row, doc_id in enumerate(self._ids)}
+        rows = [self._base_rows[doc_id] for doc_id in ids if doc_id in self._base_rows]
+        if rows:
+            self._deleted[rows] = True
+        drop = set(ids)
+        if drop.intersection(self._delta_ids):
+            keep = [i for i, doc_id in enumerate(self._delta_ids) if doc_id not in drop]
+            self._delta_ids = [self._delta_ids[i] for i in keep]
+            self._delta_vectors = self._delta_vectors[keep]
+
+    def _rebuild(self) -> None:
+        """Merge the delta into the lists; retrain once the index has doubled since training"""
+        live = np.flatnonzero(~self._deleted)
+        ids = np.concatenate([np.asarray(self._ids[live]), np.asarray(self._delta_ids, dtype=ID_DTYPE)])
+        vectors = np.concatenate([np.asarray(self._vectors[live], dtype=np.float32), self._delta_vectors])
+        if len(ids) > 2 * self.trained_count:
+            centroids = train_centroids(vectors, min(ANN_NLIST or default_nlist(len(ids)), len(ids)))
+            trained_count = len(ids)
+        else:
+            centroids, trained_count = self._centroids, self.trained_count
+        logger.info(f"Rebuilding ANN index {self.directory} with {len(ids)} vectors")
+        self._write_base(centroids, ids, vectors, trained_count)
+
+    def _write_base(self, centroids: np.ndarray, ids: np.ndarray, vectors: np.ndarray, trained_count: int) -> None:
+        lists = assign_lists(vectors, centroids)
+        order = np.argsort(lists, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=len(centroids)))]).astype(np.int64)
+
+        self.dim = int(centroids.shape[1])
+        self.trained_count = trained_count
+        self._centroids = centroids
+        self._offsets = offsets
+        self._deleted = np.zeros(len(ids), dtype=bool)
+        self._delta_vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._delta_ids = []
+        self._base_rows = None
+        self._publish({
+            'centroids.npy': centroids,
+            'vectors.npy': np.asarray(vectors, dtype=np.float16)[order],
+            'ids.npy': ids[order],
+            'offsets.npy': offsets,
+        })
+        self._vectors = np.load(self._path('vectors.npy'), mmap_mode='r')
+        self._ids = np.load(self._path('ids.npy'), mmap_mode='r')
+
+    def _publish(self, arrays: Dict[str, np.ndarray], link: Sequence[str] = ()) -> None:
+        """
+        Write a new generation: arrays, the current tombstones and delta, and hard links to the
+        current generation's files named in link. Then point meta.json at it.
+        """
+        previous = generation_dir(self.directory, self.generation)
+        generation = self.generation + 1
+        files = generation_dir(self.directory, generation)
+        os.makedirs(files, exist_ok=True)
+        for name in link:
+            try:
+                os.link(os.path.join(previous, name), os.path.join(files, name))
+            except OSError:
+                shutil.copyfile(os.path.join(previous, name), os.path.join(files, name))
+        arrays = dict(arrays)
+        arrays['deleted.npy'] = self._deleted
+        arrays['delta_vectors.npy'] = self._delta_vectors.astype(np.float16)
+        arrays['delta_ids.npy'] = np.asarray(self._delta_ids, dtype=ID_DTYPE)
+        for name, array in arrays.items():
+            np.save(os.path.join(files, name), array)
+
+        self.generation = generation
+        self._meta_stamp = publish_meta(self.directory, {
+            'dim': self.dim, 'nlist': len(self._centroids), 'trained_count': self.trained_count,
+            'generation': generation,
+        })
+        prune_generations(self.directory, generation)
+
+
+def synthetic_vectors(count: int, dim: int, clusters: Optional[int] = None, noise: float = 2.0,
+                      seed: int = 0) -> np.ndarray:
+    """Unit vectors drawn around random topic centres (about 100 per topic), roughly the shape of sentence embeddings"""
+    rng = np.random.default_rng(seed)
+    clusters = clusters or max(1, count // 100)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, count)] + noise * rng.normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def benchmark(vectors: np.ndarray, queries: np.ndarray, k: int = 10, nprobes: Sequence[int] = (8, 16, 32),
+              nlist: Optional[int] = None, directory: Optional[str] = None) -> List[Dict]:
+    """
+    Recall@k and latency of the IVF index against an exact scan of the same float16 vectors.
+
+    Returns one row per setting: {'method', 'nprobe', 'recall', 'mean_ms', 'p95_ms'}; the
+    exact row also carries the index build time as 'build_s'.
+    """
+    ids = np.asarray([f'{i:024x}' for i in range(len(vectors))], dtype=ID_DTYPE)
+    exact = np.asarray(vectors, dtype=np.float16).astype(np.float32)  # Same precision as the index
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        index = IVFIndex(tmp)
+        started = time.perf_counter()
+        index.build(ids, vectors, nlist=nlist)
+        build_seconds = time.perf_counter() - started
+
+        truth, exact_times = [], []
+        for query in queries:
+            started = time.perf_counter()
+            scores = exact @ query
+            truth.append({doc_id for doc_id, _ in top_k(ids, scores, k)})
+            exact_times.append(time.perf_counter() - started)
+        rows = [_latency_row('exact', None, 1.0, exact_times)]
+        rows[0]['build_s'] = round(build_seconds, 2)
+
+        for nprobe in nprobes:
+            hits, times = 0, []
+            for query, expected in zip(queries, truth):
+                started = time.perf_counter()
+                found = index.search(query, k, nprobe=nprobe)
+                times.append(time.perf_counter() - started)
+                hits += len(expected.intersection(doc_id for doc_id, _ in found))
+            rows.append(_latency_row('ivf', nprobe, hits / (k * len(queries)), times))
+    return rows
+
+
+def _latency_row(method: str, nprobe: Optional[int], recall: float, seconds: List[float]) -> Dict:
+    millis = np.asarray(seconds) * 1000
+    return {
+        'method': method,
+        'nprobe': nprobe,
+        'recall': round(recall, 4),
+        'mean_ms': round(float(millis.mean()), 3),
+        'p95_ms': round(float(np.percentile(millis, 95)), 3),
+    }
@@ -0,0 +1,151 @@
+"""
+Avatar Service
+Stores uploaded avatars in the blob store with pre-rendered square thumbnails
+"""
+import base64
+import binascii
+import io
+import logging
+import re
+from typing import Optional, Tuple
+
+from app.config import AVATAR_MAX_BYTES, AVATAR_THUMBNAIL_SIZES, AVATAR_CONTENT_TYPES, AVATAR_BASE_URL
+from app.exceptions.api_exceptions import ValidationError
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_DATA_URL_RE = re.compile(r'^data:(image/[\w.+-]+);base64,(.*)$', re.DOTALL)
+
+
+class AvatarService:
+    """Avatar uploads, thumbnails and URLs"""
+
+    def __init__(self, blob_store, thumbnail_sizes=None):
+        self.blob_store = blob_store
+        self.thumbnail_sizes = thumbnail_sizes if thumbnail_sizes is not None else AVATAR_THUMBNAIL_SIZES
+
+    def store(self, data: bytes, content_type: str) -> str:
+        """
+        Store an avatar image and its thumbnails; returns the original's hash.
+
+        Without Pillow the original is stored as-is and served for every size.
+        """
+        if not data:
+            raise ValidationError('No file provided')
+        if len(data) > AVATAR_MAX_BYTES:
+            raise ValidationError(f'File too large. Maximum size is {AVATAR_MAX_BYTES // (1024 * 1024)}MB')
+        if content_type not in AVATAR_CONTENT_TYPES.values():
+            raise ValidationError('Invalid file type. Allowed: PNG, JPG, JPEG, GIF, WEBP')
+
+        image = self._open(data) if PIL_AVAILABLE else None
+        avatar_hash = self.blob_store.put(data, content_type)
+        if image is not None:
+            for size in self.thumbnail_sizes:
+                thumbnail = self._thumbnail(image, size)
+                self.blob_store.set_variant(avatar_hash, str(size), self.blob_store.put(thumbnail, 'image/png'))
+        return avatar_hash
+
+    def store_data_url(self, data_url: str) -> str:
+        """Store an inline 'data:image/...;base64,...' avatar"""
+        content_type, data = self.decode_data_url(data_url)
+        return self.store(data, content_type)
+
+    @staticmethod
+    def decode_data_url(data_url: str) -> Tuple[str, bytes]:
+        match = _DATA_URL_RE.match(data_url or '')
+        if not match:
+            raise ValidationError('Avatar must be an inline base64 image')
+        try:
+            return match.group(1), base64.b64decode(match.group(2), validate=False)
+        except (binascii.Error, ValueError):
+            raise ValidationError('Avatar image is not valid base64')
+
+    def resolve(self, avatar_hash: str, size: Optional[int] = None) -> Optional[Tuple[str, dict]]:
+        """
+        Pick the blob to serve for an avatar and size.
+
+        Returns (blob_hash, blob_info) for the smallest thumbnail at least `size` pixels
+        wide (the original when none is), or None for unknown avatars.
+        """
+        info = self.blob_store.info(avatar_hash)
+        if not info:
+            return None
+        if size:
+            variants = sorted((int(name), blob_hash) for name, blob_hash in (info.get('variants') or {}).items())
+            for variant_size, variant_hash in variants:
+                if variant_size >= size:
+                    variant = self.blob_store.info(variant_hash)
+                    if variant:
+                        return variant_hash, variant
+                    break
+        return avatar_hash, info
+
+    @staticmethod
+    def url(avatar_hash: Optional[str], size: Optional[int] = None) -> Optional[str]:
+        """
+        Absolute URL of an avatar, so it also loads when the frontend is served from
+        another origin. AVATAR_BASE_URL overrides the request's host (e.g. behind a proxy).
+        """
+        from flask import url_for
+
+        if not avatar_hash:
+            return None
+        if AVATAR_BASE_URL:
+            return f"{AVATAR_BASE_URL.rstrip('/')}/api/v1/avatars/{avatar_hash}" + (f'?size={size}' if size else '')
+        return url_for('api_v1.get_avatar', avatar_hash=avatar_hash, size=size, _external=True)
+
+    def migrate_inline(self) -> Tuple[int, int]:
+        """
+        Move legacy inline avatar_url data URLs into the blob store.
+
+        Returns (migrated, skipped); skipped avatars (not data URLs or not images) keep
+        their inline value so nothing is lost.
+        """
+        from app.models import User
+
+        collection = User._get_collection()
+        migrated = skipped = 0
+        for son in collection.find({'avatar_url': {'$exists': True}}, {'avatar_url': 1}):
+            value = son.get('avatar_url')
+            if not value:
+                collection.update_one({'_id': son['_id']}, {'$unset': {'avatar_url': ''}})
+                continue
+            try:
+                avatar_hash = self.store_data_url(value)
+            except ValidationError as e:
+                logger.warning(f"Skipping avatar for user {son['_id']}: {e.message}")
+                skipped += 1
+                continue
+            collection.update_one(
+                {'_id': son['_id']},
+                {'$set': {'avatar_hash': avatar_hash}, '$unset': {'avatar_url': ''}}
+            )
+            migrated += 1
+        return migrated, skipped
+
+    @staticmethod
+    def _open(data: bytes):
+        try:
+            image = Image.open(io.BytesIO(data))
+            image.load()
+        except Exception:
+            raise ValidationError('File is not a valid image')
+        return image
+
+    @staticmethod
+    def _thumbnail(image, size: int) -> bytes:
+        """Center-cropped square PNG of size x size pixels"""
+        side = min(image.size)
+        left = (image.width - side) // 2
+        top = (image.height - side) // 2
+        square = image.convert('RGBA').crop((left, top, left + side, top + side))
+        square = square.resize((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        square.save(buffer, format='PNG', optimize=True)
+        return buffer.getvalue()
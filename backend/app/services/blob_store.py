@@ -0,0 +1,116 @@
+"""
+Blob Store
+Content-addressed, chunked storage for immutable bytes (avatars, large file contents) in MongoDB
+"""
+import hashlib
+import logging
+from typing import Dict, Iterator, List, Optional
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.config import BLOB_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """Blobs are keyed by the SHA-256 of their bytes, so identical content is stored once"""
+
+    def __init__(self, chunk_size: int = BLOB_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def hash_bytes(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def put(self, data: bytes, content_type: Optional[str] = None) -> str:
+        """
+        Store bytes and return their hash; storing existing content is a no-op.
+
+        Chunks are written before the Blob document, so a Blob is only visible once
+        all of its bytes are. Concurrent puts of the same content are safe.
+        """
+        from app.models import Blob, BlobChunk
+
+        blob_hash = self.hash_bytes(data)
+        if Blob.objects(hash=blob_hash).count():
+            return blob_hash
+
+        chunks = [
+            {'blob_hash': blob_hash, 'n': n, 'data': data[offset:offset + self.chunk_size]}
+            for n, offset in enumerate(range(0, len(data), self.chunk_size))
+        ]
+        if chunks:
+            try:
+                BlobChunk._get_collection().insert_many(chunks, ordered=False)
+            except BulkWriteError as e:
+                # Another writer stored the same chunks first (duplicate keys only)
+                if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                    raise
+
+        try:
+            Blob.objects(hash=blob_hash).update_one(
+                upsert=True,
+                set_on_insert__length=len(data),
+                set_on_insert__content_type=content_type,
+                set_on_insert__chunk_size=self.chunk_size,
+                set_on_insert__chunk_count=len(chunks),
+            )
+        except DuplicateKeyError:
+            pass
+        return blob_hash
+
+    def info(self, blob_hash: str) -> Optional[Dict]:
+        """Blob metadata (length, content_type, variants, ...) without its bytes"""
+        from app.models import Blob
+        return Blob.objects(hash=blob_hash).exclude('id').as_pymongo().first()
+
+    def get(self, blob_hash: str) -> Optional[bytes]:
+        """Reassemble a blob's bytes, or None if it does not exist or is incomplete"""
+        from app.models import BlobChunk
+
+        blob = self.info(blob_hash)
+        if not blob:
+            return None
+        chunks = BlobChunk.objects(blob_hash=blob_hash).order_by('n').scalar('data')
+        data = b''.join(bytes(chunk) for chunk in chunks)
+        if len(data) != blob['length']:
+            logger.warning(f"Blob {blob_hash} is incomplete ({len(data)}/{blob['length']} bytes)")
+            return None
+        return data
+
+    def get_many(self, blob_hashes: List[str]) -> Dict[str, bytes]:
+        """Fetch several complete blobs in two queries; missing or incomplete ones are left out"""
+        from app.models import Blob, BlobChunk
+
+        blob_hashes = list(set(blob_hashes))
+        if not blob_hashes:
+            return {}
+        lengths = {
+            blob['hash']: blob['length']
+            for blob in Blob.objects(hash__in=blob_hashes).only('hash', 'length').as_pymongo()
+        }
+        parts: Dict[str, List[bytes]] = {blob_hash: [] for blob_hash in lengths}
+        chunks = BlobChunk.objects(blob_hash__in=list(lengths)).order_by('blob_hash', 'n').exclude('id').as_pymongo()
+        for chunk in chunks:
+            parts[chunk['blob_hash']].append(bytes(chunk['data']))
+
+        blobs = {}
+        for blob_hash, pieces in parts.items():
+            data = b''.join(pieces)
+            if len(data) == lengths[blob_hash]:
+                blobs[blob_hash] = data
+            else:
+                logger.warning(f"Blob {blob_hash} is incomplete ({len(data)}/{lengths[blob_hash]} bytes)")
+        return blobs
+
+    def iter_chunks(self, blob_hash: str) -> Iterator[bytes]:
+        """Stream a blob's bytes chunk by chunk without holding the whole blob in memory"""
+        from app.models import BlobChunk
+        for data in BlobChunk.objects(blob_hash=blob_hash).order_by('n').scalar('data').no_cache():
+            yield bytes(data)
+
+    def set_variant(self, blob_hash: str, name: str, variant_hash: str) -> None:
+        """Record a derived blob (e.g. a thumbnail) on its source"""
+        from app.models import Blob
+        Blob.objects(hash=blob_hash).update_one(**{f'set__variants__{name}': variant_hash})
@@ -0,0 +1,421 @@
+"""
+Department Progress Service
+Server-side aggregations and optional daily rollups behind the teacher progress dashboard
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from app.config import DEPARTMENT_OPTIONS, DEPARTMENT_ROLLUPS_ENABLED, DEPARTMENT_ROLLUP_REFRESH_SECONDS
+from app.utils.model_utils import ref_id
+
+logger = logging.getLogger(__name__)
+
+DAY_FORMAT = '%Y-%m-%d'
+RECENT_DAYS = 7
+_METRICS = (
+    'submissions', 'feedbacks', 'score_sum', 'score_count',
+    'peer_reviews', 'completed_peer_reviews', 'pending_peer_reviews',
+)
+
+
+def _day_of(value: Optional[datetime]) -> str:
+    return (value or datetime.utcnow()).strftime(DAY_FORMAT)
+
+
+def _earliest(*values: Optional[datetime]) -> Optional[datetime]:
+    values = [value for value in values if value is not None]
+    return min(values) if values else None
+
+
+def _empty_day() -> Dict:
+    day = {metric: 0 for metric in _METRICS}
+    day['status_counts'] = {}
+    return day
+
+
+class DepartmentProgressService:
+    """Counts and averages for a department's submissions, feedback and peer reviews"""
+
+    def __init__(self, rollups_enabled: bool = DEPARTMENT_ROLLUPS_ENABLED,
+                 refresh_seconds: float = DEPARTMENT_ROLLUP_REFRESH_SECONDS):
+        self.rollups_enabled = rollups_enabled
+        self.refresh_seconds = refresh_seconds
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def progress(self, department: str) -> Dict:
+        """Dashboard figures, from rollups when enabled and a live aggregation otherwise"""
+        if self.rollups_enabled:
+            return self.rollup_progress(department)
+        return self.live_progress(department)
+
+    def live_progress(self, department: str) -> Dict:
+        """Aggregate the whole department on the server; only per-day counts come back"""
+        student_ids = self._student_ids(department)
+        days = self.aggregate_daily(student_ids)
+        new_students = self._first_submission_days(student_ids)
+        for day, count in new_students.items():
+            days.setdefault(day, _empty_day())['new_students'] = count
+        return self._summarize(department, days.values(), days.keys())
+
+    def rollup_progress(self, department: str) -> Dict:
+        """
+        Sum the department's stored daily rollups; nothing is aggregated on the read.
+
+        Days written to since the last refresh show their previous counts until the rollup
+        worker (or refresh-department-rollups) catches up; new_students is kept current on
+        every write. A department that was never rolled up is served live meanwhile.
+        """
+        from app.models import DepartmentDailyRollup
+
+        rollups = DepartmentDailyRollup.objects(department=department)
+        if not rollups.filter(refreshed_at__ne=None).only('id').first():
+            return self.live_progress(department)
+        rows = list(rollups.exclude('id').as_pymongo())
+        return self._summarize(department, rows, [row['day'] for row in rows])
+
+    def _summarize(self, department: str, rows: Iterable[Dict], days: Iterable[str]) -> Dict:
+        totals = _empty_day()
+        totals['new_students'] = 0
+        recent = 0
+        recent_since = _day_of(datetime.utcnow() - timedelta(days=RECENT_DAYS))
+        for row, day in zip(rows, days):
+            for metric in list(_METRICS) + ['new_students']:
+                totals[metric] += row.get(metric) or 0
+            for status, count in (row.get('status_counts') or {}).items():
+                totals['status_counts'][status] = totals['status_counts'].get(status, 0) + count
+            if day >= recent_since:
+                recent += row.get('submissions') or 0
+
+        avg_score = (totals['score_sum'] / totals['score_count'] * 100) if totals['score_count'] > 0 else 0
+        return {
+            'department': department,
+            'total_submissions': totals['submissions'],
+            'unique_students': totals['new_students'],
+            'total_feedbacks': totals['feedbacks'],
+            'total_peer_reviews': totals['peer_reviews'],
+            'completed_peer_reviews': totals['completed_peer_reviews'],
+            'pending_peer_reviews': totals['pending_peer_reviews'],
+            'average_score': round(avg_score, 2),
+            'status_breakdown': totals['status_counts'],
+            'recent_submissions': recent,  # Submissions on the last RECENT_DAYS UTC days
+        }
+
+    # ------------------------------------------------------------------
+    # Aggregations
+    # ------------------------------------------------------------------
+
+    def _student_ids(self, department: str) -> List:
+        from app.models import User
+        return list(User.objects(department=department, role='student').scalar('id'))
+
+    def aggregate_daily(self, student_ids: List, days: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """
+        Per-day counts for the given students' submissions in one $facet aggregation.
+
+        Args:
+            student_ids: Submission owners to include
+            days: Restrict to these 'YYYY-MM-DD' days (all days when None)
+
+        Returns:
+            day -> {submissions, status_counts, feedbacks, score_sum, score_count, peer_reviews, ...}
+        """
+        from app.models import Submission, Feedback, PeerReview
+
+        if not student_ids:
+            return {}
+        match = {'user_id': {'$in': student_ids}}
+        if days:
+            start = datetime.strptime(min(days), DAY_FORMAT)
+            end = datetime.strptime(max(days), DAY_FORMAT) + timedelta(days=1)
+            match['created_at'] = {'$gte': start, '$lt': end}
+
+        pipeline = [
+            {'$match': match},
+            {'$project': {
+                'status': 1,
+                'day': {'$dateToString': {'format': DAY_FORMAT, 'date': '$created_at'}},
+            }},
+        ]
+        if days:
+            pipeline.append({'$match': {'day': {'$in': list(days)}}})
+        pipeline.append({'$facet': {
+            'submissions': [
+                {'$group': {'_id': {'day': '$day', 'status': '$status'}, 'count': {'$sum': 1}}},
+            ],
+            'feedbacks': [
+                {'$lookup': {
+                    'from': Feedback._get_collection_name(),
+                    'localField': '_id',
+                    'foreignField': 'submission_id',
+                    'as': 'feedback',
+                }},
+                {'$unwind': '$feedback'},
+                {'$project': {
+                    'day': 1,
+                    'feedback_id': '$feedback._id',
+                    'score': {'$objectToArray': {'$ifNull': ['$feedback.scores', {}]}},
+                }},
+                # Mean of each feedback's score values, then per-day sums
+                {'$unwind': {'path': '$score', 'preserveNullAndEmptyArrays': True}},
+                {'$group': {'_id': {'day': '$day', 'feedback': '$feedback_id'}, 'score': {'$avg': '$score.v'}}},
+                {'$group': {
+                    '_id': '$_id.day',
+                    'feedbacks': {'$sum': 1},
+                    'score_sum': {'$sum': '$score'},
+                    'score_count': {'$sum': {'$cond': [{'$eq': [{'$ifNull': ['$score', None]}, None]}, 0, 1]}},
+                }},
+            ],
+            'peer_reviews': [
+                {'$lookup': {
+                    'from': PeerReview._get_collection_name(),
+                    'localField': '_id',
+                    'foreignField': 'submission_id',
+                    'as': 'review',
+                }},
+                {'$unwind': '$review'},
+                {'$group': {'_id': {'day': '$day', 'status': '$review.status'}, 'count': {'$sum': 1}}},
+            ],
+        }})
+
+        result = next(iter(Submission.objects.aggregate(pipeline, allowDiskUse=True)), {})
+        days_out: Dict[str, Dict] = {}
+
+        for row in result.get('submissions', []):
+            day = days_out.setdefault(row['_id']['day'], _empty_day())
+            day['submissions'] += row['count']
+            status = row['_id'].get('status') or 'submitted'
+            day['status_counts'][status] = day['status_counts'].get(status, 0) + row['count']
+
+        for row in result.get('feedbacks', []):
+            day = days_out.setdefault(row['_id'], _empty_day())
+            day['feedbacks'] = row['feedbacks']
+            day['score_sum'] = row['score_sum'] or 0.0
+            day['score_count'] = row['score_count']
+
+        for row in result.get('peer_reviews', []):
+            day = days_out.setdefault(row['_id']['day'], _empty_day())
+            day['peer_reviews'] += row['count']
+            if row['_id'].get('status') == 'completed':
+                day['completed_peer_reviews'] += row['count']
+            elif row['_id'].get('status') == 'pending':
+                day['pending_peer_reviews'] += row['count']
+
+        return days_out
+
+    def _first_submission_days(self, student_ids: List) -> Dict[str, int]:
+        """day -> number of students whose first submission fell on it"""
+        from app.models import Submission
+
+        if not student_ids:
+            return {}
+        pipeline = [
+            {'$match': {'user_id': {'$in': student_ids}}},
+            {'$group': {'_id': '$user_id', 'first': {'$min': '$created_at'}}},
+            {'$group': {'_id': {'$dateToString': {'format': DAY_FORMAT, 'date': '$first'}}, 'count': {'$sum': 1}}},
+        ]
+        return {row['_id']: row['count'] for row in Submission.objects.aggregate(pipeline)}
+
+    # ------------------------------------------------------------------
+    # Rollups
+    # ------------------------------------------------------------------
+
+    def refresh(self, department: Optional[str] = None, full: bool = False) -> int:
+        """
+        Recompute rollups for days marked dirty (or every day with full=True).
+
+        A department that was never rolled up (no day has been refreshed yet, e.g. just
+        after enabling rollups) gets a full refresh, so its history is not missing.
+        Dirty flags are cleared before aggregating: a write that lands meanwhile flags
+        its day again, and one that still saw the flag set is included in this pass.
+        new_students is maintained on write and only recomputed by a full refresh.
+
+        Returns the number of (department, day) rollups rewritten.
+        """
+        from app.models import DepartmentDailyRollup
+
+        departments = [department] if department else [opt['value'] for opt in DEPARTMENT_OPTIONS]
+        rewritten = 0
+        for name in departments:
+            started = datetime.utcnow()
+            rollups = DepartmentDailyRollup.objects(department=name)
+            full_refresh = full or not rollups.filter(refreshed_at__ne=None).first()
+            if full_refresh:
+                days = None
+                rollups.filter(dirty=True).update(set__dirty=False)
+            else:
+                days = list(rollups.filter(dirty=True).scalar('day'))
+                if not days:
+                    continue
+                rollups.filter(day__in=days, dirty=True).update(set__dirty=False)
+
+            try:
+                student_ids = self._student_ids(name)
+                computed = self.aggregate_daily(student_ids, days)
+                new_students = self._first_submission_days(student_ids) if full_refresh else None
+            except Exception:
+                # Leave the days for the next refresh
+                if days:
+                    rollups.filter(day__in=days).update(set__dirty=True)
+                raise
+            if full_refresh:
+                stale = set(rollups.scalar('day'))
+                days = sorted(stale | set(computed))
+
+            operations = []
+            for day in days:
+                values = computed.get(day) or _empty_day()
+                values['refreshed_at'] = started
+                operations.append(UpdateOne({'department': name, 'day': day}, {'$set': values}, upsert=True))
+
+            if new_students is not None:
+                # Also repairs any drift in the counts kept by _shift_first_days
+                for day, count in new_students.items():
+                    operations.append(UpdateOne({'department': name, 'day': day}, {'$set': {'new_students': count}}, upsert=True))
+                operations.append(UpdateOne(
+                    {'department': name, 'day': {'$nin': list(new_students)}, 'new_students': {'$ne': 0}},
+                    {'$set': {'new_students': 0}}
+                ))
+
+            DepartmentDailyRollup._get_collection().bulk_write(operations, ordered=True)
+            rewritten += len(days)
+        return rewritten
+
+    def mark_dirty(self, user_id, created_at: Optional[datetime]) -> None:
+        """Flag the rollup day a submission belongs to for the next refresh"""
+        self.mark_dirty_many([(user_id, created_at)])
+
+    def mark_dirty_many(self, submissions: Iterable) -> None:
+        """
+        Flag the rollup days of (owner id, created_at) submission pairs.
+
+        Days already flagged are skipped with one read; the rest cost one upsert per
+        department day.
+        """
+        from app.models import User, DepartmentDailyRollup
+
+        submissions = list(submissions)
+        departments = dict(User.objects(id__in=list({user_id for user_id, _ in submissions})).scalar('id', 'department'))
+        touched = {(departments.get(user_id), _day_of(created_at)) for user_id, created_at in submissions}
+        touched = {(department, day) for department, day in touched if department}
+        if not touched:
+            return
+        already = set(DepartmentDailyRollup.objects(
+            department__in=list({department for department, _ in touched}),
+            day__in=list({day for _, day in touched}),
+            dirty=True
+        ).scalar('department', 'day'))
+        now = datetime.utcnow()
+        for department, day in touched - already:
+            DepartmentDailyRollup.objects(department=department, day=day).update_one(
+                upsert=True, set__dirty=True, set__dirtied_at=now
+            )
+
+    def _shift_first_days(self, documents: List, deleted: bool = False) -> None:
+        """
+        Keep new_students current for inserted (or deleted) submissions.
+
+        A student counts on the day of their earliest submission. When the write moves
+        that day, the old day's rollup loses them and the new day's gains them, with one
+        $min aggregation over the owners' other submissions.
+        """
+        from app.models import Submission, User, DepartmentDailyRollup
+
+        written: Dict = {}
+        for document in documents:
+            written.setdefault(ref_id(document._data.get('user_id')), []).append(document.created_at)
+        user_ids = list(written)
+        pipeline = [
+            {'$match': {'user_id': {'$in': user_ids}, '_id': {'$nin': [document.id for document in documents]}}},
+            {'$group': {'_id': '$user_id', 'first': {'$min': '$created_at'}}},
+        ]
+        others = {row['_id']: row['first'] for row in Submission.objects.aggregate(pipeline)}
+        departments = dict(User.objects(id__in=user_ids).scalar('id', 'department'))
+
+        for user_id, created in written.items():
+            department = departments.get(user_id)
+            if not department:
+                continue
+            before, after = others.get(user_id), _earliest(others.get(user_id), *created)
+            if deleted:
+                before, after = after, before
+            if before and after and _day_of(before) == _day_of(after):
+                continue
+            for first, delta in ((before, -1), (after, 1)):
+                if first:
+                    DepartmentDailyRollup.objects(department=department, day=_day_of(first)).update_one(
+                        upsert=True, inc__new_students=delta
+                    )
+
+    def connect_signals(self) -> None:
+        """Update rollups on Submission, Feedback and PeerReview writes, bulk inserts included"""
+        from mongoengine import signals
+        from app.models import Submission, Feedback, PeerReview
+
+        for sender in (Submission, Feedback, PeerReview):
+            signals.post_save.connect(self._on_saved, sender=sender, weak=False)
+            signals.post_delete.connect(self._on_deleted, sender=sender, weak=False)
+            signals.post_bulk_insert.connect(self._on_bulk_insert, sender=sender, weak=False)
+
+    def _on_saved(self, sender, document, created=False, **kwargs) -> None:
+        self._mark_documents(sender, [document], first_days=created)
+
+    def _on_deleted(self, sender, document, **kwargs) -> None:
+        self._mark_documents(sender, [document], first_days=True, deleted=True)
+
+    def _on_bulk_insert(self, sender, documents, **kwargs) -> None:
+        self._mark_documents(sender, documents, first_days=True)
+
+    def _mark_documents(self, sender, documents: List, first_days: bool = False, deleted: bool = False) -> None:
+        if not self.rollups_enabled or not documents:
+            return
+        from app.models import Submission
+
+        try:
+            if sender is Submission:
+                self.mark_dirty_many(
+                    (ref_id(document._data.get('user_id')), document.created_at) for document in documents
+                )
+                if first_days:
+                    self._shift_first_days(documents, deleted=deleted)
+                return
+            submission_ids = list({ref_id(document._data.get('submission_id')) for document in documents})
+            self.mark_dirty_many(
+                (submission['user_id'], submission.get('created_at'))
+                for submission in Submission.objects(id__in=submission_ids).only('user_id', 'created_at').as_pymongo()
+            )
+        except Exception as e:
+            # Never fail the write itself; a full refresh repairs any missed day
+            logger.warning(f"Failed to mark department rollup dirty for {len(documents)} {sender.__name__} write(s): {e}")
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+
+    def start_worker(self, app) -> None:
+        """Refresh dirty rollup days every refresh_seconds on a background thread (no-op if already running)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._worker_loop, args=(app,), name='rollup-worker', daemon=True)
+        self._thread.start()
+        logger.info("Started department rollup worker")
+
+    def stop_worker(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _worker_loop(self, app) -> None:
+        with app.app_context():
+            while not self._stop.is_set():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"Department rollup worker error: {e}", exc_info=True)
+                self._stop.wait(self.refresh_seconds)
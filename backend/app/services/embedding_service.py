@@ -0,0 +1,361 @@
+"""
+Embedding Service
+Background encoding of flashcards, resources and submissions into per-source vector stores,
+with an approximate nearest-neighbour index once a store is large
+"""
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+
+from app.config import (
+    EMBEDDINGS_ENABLED, EMBEDDING_STORE_DIR, EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_CHARS, EMBEDDING_WORKER_POLL_SECONDS, SIMILARITY_MODEL_NAME,
+    ANN_MIN_VECTORS, ANN_EXACT_FILTER_MAX
+)
+from app.services.ann_index import IVFIndex
+from app.services.vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+SCOPED_CANDIDATES = 4  # Candidates fetched per wanted result when post-filtering a large scope
+
+
+def _flashcard_texts(doc_ids: List) -> Dict:
+    """The answer side: it is what flashcard verification compares against, so one vector serves both"""
+    from app.models import Flashcard
+
+    return {
+        card['_id']: card.get('back') or ''
+        for card in Flashcard.objects(id__in=doc_ids).only('back').as_pymongo()
+    }
+
+
+def _resource_texts(doc_ids: List) -> Dict:
+    from app.models import Resource
+
+    fields = ('title', 'description', 'tags', 'content')
+    return {
+        resource['_id']: '\n'.join(resource.get(field) or '' for field in fields)
+        for resource in Resource.objects(id__in=doc_ids).only(*fields).as_pymongo()
+    }
+
+
+def _submission_texts(doc_ids: List) -> Dict:
+    from app.models import Submission
+    from app.services.submission_storage import preload_files, submission_content
+
+    submissions = list(Submission.objects(id__in=doc_ids).only(
+        'assignment_title', 'content', 'files'
+    ).no_dereference())
+    preload_files(submissions)
+    return {
+        submission.id: f'{submission.assignment_title}\n{submission_content(submission)}'
+        for submission in submissions
+    }
+
+
+# source name -> (model class name, texts of documents by id)
+SOURCES = {
+    'flashcards': ('Flashcard', _flashcard_texts),
+    'resources': ('Resource', _resource_texts),
+    'submissions': ('Submission', _submission_texts),
+}
+
+
+def text_digest(text: str) -> bytes:
+    """Short fingerprint of embedded text, so unchanged documents are not re-encoded"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16].encode('ascii')
+
+
+class EmbeddingService:
+    """
+    Keeps one VectorStore per source in step with its collection.
+
+    Model signals queue changed documents in pending_embeddings (when enabled); the
+    embedding worker drains the queue in batches, encoding each batch with one
+    AIService.encode call. The worker is the only writer of the store files, so run
+    it in one process (the embedding-worker command); app processes only read.
+    """
+
+    def __init__(
+        self,
+        store_dir: str = EMBEDDING_STORE_DIR,
+        enabled: bool = EMBEDDINGS_ENABLED,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        poll_seconds: float = EMBEDDING_WORKER_POLL_SECONDS
+    ):
+        self.store_dir = store_dir
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._stores: Dict[str, VectorStore] = {}
+        self._indexes: Dict[str, IVFIndex] = {}
+        self._stores_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def store(self, source: str) -> VectorStore:
+        """The vector store for a source, opened once per process"""
+        if source not in SOURCES:
+            raise ValueError(f'Unknown embedding source: {source}')
+        with self._stores_lock:
+            if source not in self._stores:
+                self._stores[source] = VectorStore(os.path.join(self.store_dir, source))
+            return self._stores[source]
+
+    def index(self, source: str) -> IVFIndex:
+        """The ANN index for a source (it may not have been built yet)"""
+        store = self.store(source)
+        with self._stores_lock:
+            if source not in self._indexes:
+                self._indexes[source] = IVFIndex(os.path.join(store.directory, 'ivf'))
+            return self._indexes[source]
+
+    def build_index(self, source: str, nlist: Optional[int] = None) -> int:
+        """(Re)build a source's ANN index from its store; returns the number of vectors indexed"""
+        ids, vectors = self.store(source).matrix()
+        if not len(ids):
+            return 0
+        self.index(source).build(ids, vectors, nlist=nlist)
+        return len(ids)
+
+    def search(self, source: str, query, k: int = 10, where: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """
+        Stored documents nearest to a query vector, as (id, cosine similarity), best first.
+
+        where is a MongoDB filter on the source's collection that results must match. A scope
+        of at most ANN_EXACT_FILTER_MAX documents is read (ids only) and scanned exactly. A
+        larger one is never materialised: the store is searched unscoped in growing rounds
+        (more candidates, more lists probed) and each round's candidates are checked against
+        where with one _id $in query. Uses the ANN index when there is one.
+        """
+        from app import models
+
+        store = self.store(source)
+        if where is not None:
+            collection = getattr(models, SOURCES[source][0])._get_collection()
+            scoped = list(collection.find(where, {'_id': 1}).limit(ANN_EXACT_FILTER_MAX + 1))
+            if len(scoped) <= ANN_EXACT_FILTER_MAX:
+                return store.search(query, k, [str(doc['_id']) for doc in scoped])
+
+        index = self.index(source)
+        total = len(store)
+        fetch = k * SCOPED_CANDIDATES if where is not None else k
+        nprobe = index.nprobe
+        while True:
+            last = fetch >= total
+            if index.exists():
+                candidates = index.search(query, fetch, nprobe=total if last else nprobe)
+            else:
+                candidates = store.search(query, fetch)
+            if where is None:
+                return candidates
+            allowed = self.matching(source, [doc_id for doc_id, _ in candidates], where)
+            matches = [(doc_id, score) for doc_id, score in candidates if doc_id in allowed]
+            if len(matches) >= k or last:
+                return matches[:k]
+            fetch, nprobe = fetch * SCOPED_CANDIDATES, nprobe * SCOPED_CANDIDATES
+
+    def matching(self, source: str, doc_ids: Iterable, where: Dict) -> Set[str]:
+        """The ids among doc_ids whose documents match the MongoDB filter where"""
+        from app import models
+        from app.utils.model_utils import to_object_id
+
+        model = getattr(models, SOURCES[source][0])
+        object_ids = [to_object_id(str(doc_id)) for doc_id in doc_ids]
+        return {
+            str(doc['_id'])
+            for doc in model._get_collection().find({'$and': [{'_id': {'$in': object_ids}}, where]}, {'_id': 1})
+        }
+
+    def vector_for(self, source: str, doc_id) -> Optional[np.ndarray]:
+        """A document's stored vector, or a freshly encoded one if the worker has not reached it yet"""
+        from app.services.ai_service import ai_service
+
+        found, vectors = self.store(source).get([doc_id])
+        if found:
+            return vectors[0]
+        texts = SOURCES[source][1]([doc_id])
+        if not texts:
+            return None
+        encoded = ai_service.encode([next(iter(texts.values()))[:EMBEDDING_MAX_CHARS]])
+        return encoded[0] if encoded is not None else None
+
+    def similar(self, source: str, text: str, k: int = 10, where: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """Stored documents most similar to text, as (id, cosine similarity)"""
+        from app.services.ai_service import ai_service
+
+        vectors = ai_service.encode([text[:EMBEDDING_MAX_CHARS]])
+        if vectors is None:
+            return []
+        return self.search(source, vectors[0], k, where)
+
+    # ------------------------------------------------------------------
+    # Queue
+    # ------------------------------------------------------------------
+
+    def enqueue(self, source: str, doc_ids: Iterable, deleted: bool = False) -> int:
+        """Queue documents for (re)encoding, or for removal with deleted=True"""
+        from app.models import PendingEmbedding
+
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {'source': source, 'doc_id': doc_id},
+                {'$set': {'deleted': deleted, 'queued_at': now}},
+                upsert=True
+            )
+            for doc_id in dict.fromkeys(doc_ids)
+        ]
+        if operations:
+            PendingEmbedding._get_collection().bulk_write(operations, ordered=False)
+        return len(operations)
+
+    def reindex(self, source: str) -> int:
+        """Queue every document of a source; unchanged text is skipped by the worker, not re-encoded"""
+        from app import models
+
+        model = getattr(models, SOURCES[source][0])
+        queued = 0
+        batch = []
+        for doc_id in model.objects.scalar('id').no_cache():
+            batch.append(doc_id)
+            if len(batch) >= self.batch_size:
+                queued += self.enqueue(source, batch)
+                batch = []
+        return queued + self.enqueue(source, batch)
+
+    def run_pending(self, max_batches: Optional[int] = None) -> int:
+        """
+        Drain the queue in the calling thread; returns the number of queue entries handled.
+
+        Stops early, leaving entries queued, when no similarity model is available.
+        """
+        handled = 0
+        batches = 0
+        for source in SOURCES:
+            while max_batches is None or batches < max_batches:
+                count = self._run_batch(source)
+                if count is None:
+                    return handled
+                if not count:
+                    break
+                handled += count
+                batches += 1
+        return handled
+
+    def _run_batch(self, source: str) -> Optional[int]:
+        """Handle the oldest batch_size entries of a source (None when nothing could be encoded)"""
+        from app.models import PendingEmbedding
+        from app.services.ai_service import ai_service
+
+        entries = list(
+            PendingEmbedding.objects(source=source).order_by('queued_at').limit(self.batch_size).as_pymongo()
+        )
+        if not entries:
+            return 0
+
+        store = self.store(source)
+        live_ids = [entry['doc_id'] for entry in entries if not entry.get('deleted')]
+        texts = SOURCES[source][1](live_ids) if live_ids else {}
+        texts = {str(doc_id): text[:EMBEDDING_MAX_CHARS] for doc_id, text in texts.items()}
+        digests = {doc_id: text_digest(text) for doc_id, text in texts.items()}
+        stored = store.digests(texts)
+        changed = [doc_id for doc_id in texts if stored.get(doc_id) != digests[doc_id]]
+
+        index = self.index(source)
+        if changed:
+            vectors = ai_service.encode([texts[doc_id] for doc_id in changed])
+            if vectors is None:
+                logger.warning("No similarity model available; embeddings stay queued")
+                return None
+            store.upsert(changed, vectors, [digests[doc_id] for doc_id in changed], model=SIMILARITY_MODEL_NAME)
+            index.add(changed, vectors)
+
+        # Deleted documents, and queued ids whose document is already gone
+        removed = [str(entry['doc_id']) for entry in entries if str(entry['doc_id']) not in texts]
+        store.remove(removed)
+        index.remove(removed)
+
+        if index.exists():
+            index.save()
+        elif len(store) >= ANN_MIN_VECTORS:
+            self.build_index(source)
+
+        # Entries re-queued while we worked keep their newer queued_at and are picked up again
+        PendingEmbedding._get_collection().delete_many({'$or': [
+            {'_id': entry['_id'], 'queued_at': entry['queued_at']} for entry in entries
+        ]})
+        return len(entries)
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+
+    def start_worker(self, app) -> None:
+        """Drain the queue on a background thread until stop_worker (no-op if already running)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._worker_loop, args=(app,), name='embedding-worker', daemon=True)
+        self._thread.start()
+        logger.info("Started embedding worker")
+
+    def stop_worker(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _worker_loop(self, app) -> None:
+        with app.app_context():
+            while not self._stop.is_set():
+                try:
+                    handled = self.run_pending(max_batches=1)
+                except Exception as e:
+                    logger.error(f"Embedding worker error: {e}", exc_info=True)
+                    handled = 0
+                if not handled:
+                    self._stop.wait(self.poll_seconds)
+
+    # ------------------------------------------------------------------
+    # Signals
+    # ------------------------------------------------------------------
+
+    def connect_signals(self) -> None:
+        """Queue flashcards, resources and submissions as they are written (no-op unless enabled)"""
+        from mongoengine import signals
+        from app import models
+
+        for source, (model_name, _) in SOURCES.items():
+            sender = getattr(models, model_name)
+            signals.post_save.connect(self._on_saved, sender=sender, weak=False)
+            signals.post_bulk_insert.connect(self._on_bulk_inserted, sender=sender, weak=False)
+            signals.post_delete.connect(self._on_deleted, sender=sender, weak=False)
+
+    def _source_of(self, sender) -> str:
+        return next(source for source, (model_name, _) in SOURCES.items() if model_name == sender.__name__)
+
+    def _on_saved(self, sender, document, **kwargs) -> None:
+        self._safe_enqueue(sender, [document.id])
+
+    def _on_bulk_inserted(self, sender, documents, **kwargs) -> None:
+        self._safe_enqueue(sender, [document.id for document in documents])
+
+    def _on_deleted(self, sender, document, **kwargs) -> None:
+        self._safe_enqueue(sender, [document.id], deleted=True)
+
+    def _safe_enqueue(self, sender, doc_ids: List, deleted: bool = False) -> None:
+        if not self.enabled:
+            return
+        try:
+            self.enqueue(self._source_of(sender), doc_ids, deleted=deleted)
+        except Exception as e:
+            # Never fail the write itself; reindex-embeddings catches anything missed
+            logger.warning(f"Failed to queue {sender.__name__} embeddings: {e}")
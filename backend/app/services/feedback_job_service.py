@@ -0,0 +1,231 @@
+"""
+Feedback Job Service
+MongoDB-backed queue that moves AI feedback generation off the request path
+"""
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from mongoengine.queryset.visitor import Q
+
+from app.config import (
+    FEEDBACK_WORKERS, FEEDBACK_JOB_LEASE_SECONDS,
+    FEEDBACK_JOB_MAX_ATTEMPTS, FEEDBACK_JOB_POLL_SECONDS
+)
+from app.services.submission_storage import submission_files_data, submission_content
+
+logger = logging.getLogger(__name__)
+
+
+def generate_and_store_feedback(submission, notify_user: bool = False, feedback_text: Optional[str] = None):
+    """
+    Generate AI feedback and scores for a submission and persist them.
+
+    Pass feedback_text when the text was already produced (e.g. streamed) to only
+    score and store it. Replaces any existing AI feedback for the submission.
+    Returns the saved Feedback.
+    """
+    from app.models import Feedback
+    from app.services import ai_service, notification_inbox
+
+    content = submission_content(submission)
+    if feedback_text is None:
+        feedback_text = ai_service.generate_feedback(
+            content=content,
+            task_description=submission.task_description or '',
+            submission_type=submission.submission_type,
+            files=submission_files_data(submission)
+        )
+    scores_dict = {
+        'correctness': ai_service.score_correctness(content),
+        'quality': ai_service.score_quality(content),
+        'completeness': ai_service.score_completeness(content)
+    }
+
+    Feedback.objects(submission_id=submission, feedback_type='ai', reviewer_id=None).delete()
+    ai_feedback = Feedback(
+        submission_id=submission,
+        reviewer_id=None,
+        feedback_text=feedback_text,
+        feedback_type='ai'
+    )
+    ai_feedback.set_scores(scores_dict)
+    ai_feedback.save()
+
+    if notify_user and submission.user_id:
+        notification_inbox.notify_many(
+            [submission.user_id],
+            title='Feedback Generated',
+            message=f'AI feedback has been generated for your submission: {submission.assignment_title}',
+            notification_type='feedback',
+            related_id=str(submission.id)
+        )
+
+    return ai_feedback
+
+
+class FeedbackJobService:
+    """Enqueue feedback jobs and run them on a pool of worker threads"""
+
+    def __init__(
+        self,
+        workers: int = FEEDBACK_WORKERS,
+        lease_seconds: int = FEEDBACK_JOB_LEASE_SECONDS,
+        max_attempts: int = FEEDBACK_JOB_MAX_ATTEMPTS,
+        poll_seconds: float = FEEDBACK_JOB_POLL_SECONDS
+    ):
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self._threads = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, submission, requested_by=None, notify_user: bool = False):
+        """Queue feedback generation for a submission, reusing an active job if one exists"""
+        from app.models import FeedbackJob
+
+        job = FeedbackJob.objects(
+            submission_id=submission, status__in=['queued', 'running']
+        ).order_by('-created_at').first()
+        if not job:
+            job = FeedbackJob(
+                submission_id=submission,
+                requested_by=requested_by,
+                notify_user=notify_user,
+                max_attempts=self.max_attempts
+            )
+            job.save()
+        self._wake.set()
+        return job
+
+    def claim(self, worker_id: str):
+        """
+        Atomically take the oldest runnable job.
+
+        A job is runnable when it is queued and past its backoff, or when it is
+        running but its lease expired (the worker that held it died).
+        """
+        from app.models import FeedbackJob
+
+        now = datetime.utcnow()
+        runnable = (
+            (Q(status='queued') & Q(run_after__lte=now)) |
+            (Q(status='running') & Q(lease_expires_at__lt=now))
+        )
+        return FeedbackJob.objects(runnable).order_by('created_at').modify(
+            new=True,
+            set__status='running',
+            set__worker_id=worker_id,
+            set__started_at=now,
+            set__lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+            inc__attempts=1
+        )
+
+    def process(self, job, worker_id: str) -> None:
+        """Run a claimed job and record its outcome, unless another worker took it over"""
+        from app.models import FeedbackJob, Submission
+
+        owned = FeedbackJob.objects(id=job.id, worker_id=worker_id, status='running')
+        try:
+            submission = job.submission_id
+            if not isinstance(submission, Submission):
+                raise ValueError('Submission no longer exists')
+            feedback = generate_and_store_feedback(submission, notify_user=job.notify_user)
+        except Exception as e:
+            logger.warning(f"Feedback job {job.id} attempt {job.attempts} failed: {e}", exc_info=True)
+            now = datetime.utcnow()
+            if job.attempts < job.max_attempts:
+                owned.update_one(
+                    set__status='queued',
+                    set__error=str(e),
+                    set__run_after=now + timedelta(seconds=30 * 2 ** (job.attempts - 1)),
+                    unset__lease_expires_at=True
+                )
+            else:
+                owned.update_one(
+                    set__status='failed',
+                    set__error=str(e),
+                    set__finished_at=now,
+                    unset__lease_expires_at=True
+                )
+            return
+
+        owned.update_one(
+            set__status='completed',
+            set__feedback_id=feedback,
+            set__finished_at=datetime.utcnow(),
+            unset__error=True,
+            unset__lease_expires_at=True
+        )
+
+    def run_pending(self, limit: Optional[int] = None, worker_id: Optional[str] = None) -> int:
+        """Process runnable jobs in the calling thread; returns the number processed"""
+        worker_id = worker_id or self._worker_id()
+        processed = 0
+        while limit is None or processed < limit:
+            job = self.claim(worker_id)
+            if not job:
+                break
+            self.process(job, worker_id)
+            processed += 1
+        return processed
+
+    def start_workers(self, app, count: Optional[int] = None) -> None:
+        """Start the worker thread pool for this process (no-op if already running)"""
+        count = self.workers if count is None else count
+        with self._start_lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            if self._threads or count <= 0:
+                return
+            self._stop.clear()
+            for index in range(count):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    args=(app, f'{self._worker_id()}-{index}'),
+                    name=f'feedback-worker-{index}',
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Started {count} feedback worker thread(s)")
+
+    def ensure_workers(self, app) -> None:
+        """
+        Start FEEDBACK_WORKERS threads in the serving process on first use, i.e. after any
+        fork; with the default of 0 jobs are left to the feedback-worker command. Tests drive
+        the queue with run_pending.
+        """
+        if app.config.get('TESTING') or self._threads:
+            return
+        self.start_workers(app)
+
+    def stop_workers(self, timeout: float = 5.0) -> None:
+        """Signal workers to stop and wait for them to finish their current job"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _worker_loop(self, app, worker_id: str) -> None:
+        with app.app_context():
+            while not self._stop.is_set():
+                try:
+                    processed = self.run_pending(limit=1, worker_id=worker_id)
+                except Exception as e:
+                    logger.error(f"Feedback worker {worker_id} error: {e}", exc_info=True)
+                    processed = 0
+                if not processed:
+                    self._wake.wait(self.poll_seconds)
+                    self._wake.clear()
+
+    @staticmethod
+    def _worker_id() -> str:
+        return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
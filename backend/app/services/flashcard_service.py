@@ -0,0 +1,327 @@
+"""
+Flashcard Service
+Validated, deduplicated bulk creation of flashcards (AI-generated sets and imported decks),
+SM-2 review scheduling and tiered answer verification
+"""
+import csv
+import hashlib
+import json
+import logging
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Dict, IO, Iterable, Iterator, List, Optional
+
+import numpy as np
+from mongoengine.errors import ValidationError as DocumentValidationError
+from pymongo import UpdateOne
+
+from app.config import (
+    FLASHCARD_IMPORT_BATCH_SIZE, FLASHCARD_IMPORT_MAX_ROWS,
+    FLASHCARD_MIN_EASE, FLASHCARD_MAX_INTERVAL_DAYS,
+    FLASHCARD_VERIFY_REJECT_SIMILARITY, EMBEDDING_MAX_CHARS
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_REPORTED_ERRORS = 20
+_WHITESPACE_RE = re.compile(r'\s+')
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+_LEADING_ARTICLE_RE = re.compile(r'^(a|an|the) ')
+
+
+def normalize_front(front: str) -> str:
+    """Front text as compared for duplicates: NFKC, case-folded, single-spaced, no trailing punctuation"""
+    text = unicodedata.normalize('NFKC', front or '').casefold()
+    return _WHITESPACE_RE.sub(' ', text).strip().rstrip('?.!:;').strip()
+
+
+def front_hash(front: str) -> str:
+    return hashlib.sha256(normalize_front(front).encode('utf-8')).hexdigest()
+
+
+def normalize_answer(answer: str) -> str:
+    """Answer text as compared for an exact match: no case, punctuation or leading article"""
+    text = unicodedata.normalize('NFKC', answer or '').casefold()
+    text = _WHITESPACE_RE.sub(' ', _PUNCTUATION_RE.sub(' ', text)).strip()
+    return _LEADING_ARTICLE_RE.sub('', text)
+
+
+def schedule_review(ease: float, interval: int, repetitions: int, quality: int) -> Dict:
+    """
+    SM-2: the next (ease, interval, repetitions) after a review graded 0-5.
+
+    Grades below 3 are lapses and restart the card at a one-day interval; otherwise
+    the interval goes 1 day, 6 days, then grows by the ease factor. Ease moves with
+    every grade and never drops below FLASHCARD_MIN_EASE.
+    """
+    if quality < 3:
+        repetitions, interval = 0, 1
+    else:
+        if repetitions == 0:
+            interval = 1
+        elif repetitions == 1:
+            interval = 6
+        else:
+            interval = round(max(interval, 1) * ease)
+        repetitions += 1
+    ease = max(FLASHCARD_MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return {
+        'ease': round(ease, 4),
+        'interval': min(interval, FLASHCARD_MAX_INTERVAL_DAYS),
+        'repetitions': repetitions,
+    }
+
+
+class FlashcardService:
+    """Bulk flashcard creation that skips cards the user already has, plus the review schedule"""
+
+    def __init__(self, batch_size: int = FLASHCARD_IMPORT_BATCH_SIZE, max_rows: int = FLASHCARD_IMPORT_MAX_ROWS):
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+
+    def build(self, user_id, card: Dict, default_category: str = 'general'):
+        """An unsaved, validated Flashcard from a {front, back, category} dict (raises on bad input)"""
+        from app.models import Flashcard
+
+        if not isinstance(card, dict):
+            raise DocumentValidationError('Card must be an object with front and back')
+        front = str(card.get('front') or '').strip()
+        back = str(card.get('back') or '').strip()
+        if not front or not back:
+            raise DocumentValidationError('Both front and back are required')
+        category = str(card.get('category') or '').strip() or default_category
+        flashcard = Flashcard(
+            user_id=user_id,
+            front=front,
+            back=back,
+            category=category[:100],
+            front_hash=front_hash(front),
+            mastery_level=0.0,
+            review_count=0
+        )
+        flashcard.validate()
+        return flashcard
+
+    def bulk_create(self, user_id, cards: Iterable[Dict], default_category: str = 'general') -> Dict:
+        """
+        Validate, deduplicate and insert cards, one insert per batch_size cards.
+
+        Cards whose normalised front matches one of the user's cards (or an earlier card
+        in the same call) are skipped; the user's cards from before front_hash existed are
+        hashed first so they count too. Stops after max_rows input rows.
+
+        Returns:
+            {'created': [Flashcard, ...], 'duplicates': int, 'invalid': int, 'errors': [...], 'truncated': bool}
+        """
+        result = {'created': [], 'duplicates': 0, 'invalid': 0, 'errors': [], 'truncated': False}
+        self.backfill_hashes(user_id=user_id)
+        seen = set()
+        rows = enumerate(cards, start=1)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            if batch[-1][0] > self.max_rows:
+                batch = [(row, card) for row, card in batch if row <= self.max_rows]
+                result['truncated'] = True
+            self._create_batch(user_id, batch, default_category, seen, result)
+            if result['truncated']:
+                break
+        return result
+
+    def _create_batch(self, user_id, batch, default_category: str, seen: set, result: Dict) -> None:
+        from app.models import Flashcard
+
+        flashcards = []
+        for row, card in batch:
+            try:
+                flashcards.append(self.build(user_id, card, default_category))
+            except DocumentValidationError as e:
+                result['invalid'] += 1
+                if len(result['errors']) < MAX_REPORTED_ERRORS:
+                    result['errors'].append({'row': row, 'error': str(e.message if hasattr(e, 'message') else e)})
+
+        hashes = [flashcard.front_hash for flashcard in flashcards]
+        existing = set(Flashcard.objects(user_id=user_id, front_hash__in=hashes).distinct('front_hash')) if hashes else set()
+        fresh = []
+        for flashcard in flashcards:
+            if flashcard.front_hash in existing or flashcard.front_hash in seen:
+                result['duplicates'] += 1
+                continue
+            seen.add(flashcard.front_hash)
+            fresh.append(flashcard)
+
+        if fresh:
+            Flashcard.objects.insert(fresh, load_bulk=False)
+            result['created'].extend(fresh)
+
+    # ------------------------------------------------------------------
+    # Answer verification
+    # ------------------------------------------------------------------
+
+    def verify_answer(self, flashcard, user_answer: str) -> Dict:
+        """
+        Grade an answer, cheapest check first.
+
+        1. Normalised exact match against the card's back.
+        2. Cosine similarity against the back's vector in the embedding store: clear misses
+           are rejected locally. High similarity is not accepted, since a negated answer or
+           a near-miss number embeds almost like the right one. Verification never writes
+           the store; until the embedding worker has stored the card (always, when
+           EMBEDDINGS_ENABLED is off) the back is encoded together with the answer on
+           every check.
+        3. Gemini for everything else (or when no model is loaded).
+
+        Returns the verify_flashcard_answer result plus 'method' ('exact', 'embedding' or 'ai').
+        """
+        from app.services.ai_service import ai_service
+
+        if normalize_answer(user_answer) == normalize_answer(flashcard.back):
+            return {
+                'is_correct': True,
+                'confidence': 1.0,
+                'similarity_score': 1.0,
+                'feedback': 'Correct!',
+                'method': 'exact',
+            }
+
+        similarity = self._answer_similarity(flashcard, user_answer)
+        if similarity is not None and similarity <= FLASHCARD_VERIFY_REJECT_SIMILARITY:
+            return {
+                'is_correct': False,
+                'confidence': 1.0 - similarity,
+                'similarity_score': similarity,
+                'feedback': f'Not quite. The expected answer is: {flashcard.back}',
+                'method': 'embedding',
+            }
+
+        result = ai_service.verify_flashcard_answer(
+            correct_answer=flashcard.back or '',
+            user_answer=user_answer,
+            question=flashcard.front or ''
+        )
+        result['method'] = 'ai'
+        return result
+
+    def _answer_similarity(self, flashcard, user_answer: str) -> Optional[float]:
+        """Cosine similarity of the answer to the card's back, reusing the back's stored vector when there is one"""
+        from app.services import embedding_service
+        from app.services.ai_service import ai_service
+        from app.services.embedding_service import text_digest
+
+        back = (flashcard.back or '')[:EMBEDDING_MAX_CHARS]
+        store = embedding_service.store('flashcards')
+        # Only a vector of the current back counts (the worker may not have re-encoded an edit yet)
+        if store.digests([flashcard.id]).get(str(flashcard.id)) == text_digest(back):
+            vectors = ai_service.encode([user_answer])
+            if vectors is None:
+                return None
+            expected, answer = store.get([flashcard.id])[1][0], vectors[0]
+            if expected.shape != answer.shape:
+                return None  # Embedded with a different model; leave it to Gemini
+        else:
+            vectors = ai_service.encode([back, user_answer])
+            if vectors is None:
+                return None
+            expected, answer = vectors[0], vectors[1]
+        return float(max(0.0, min(1.0, np.dot(expected, answer))))
+
+    # ------------------------------------------------------------------
+    # Study queue
+    # ------------------------------------------------------------------
+
+    def due(self, user_id, limit: int, now: Optional[datetime] = None) -> List:
+        """Up to limit cards due by now, most overdue first (one (user_id, due_at) index range)"""
+        from mongoengine.queryset.visitor import Q
+        from app.models import Flashcard
+
+        now = now or datetime.utcnow()
+        # Cards created before scheduling have no due_at; they sort first and count as due
+        return list(
+            Flashcard.objects(Q(user_id=user_id) & (Q(due_at__lte=now) | Q(due_at=None)))
+            .order_by('due_at', 'id')
+            .limit(limit)
+        )
+
+    def review(self, flashcard, quality: int, now: Optional[datetime] = None):
+        """Apply a 0-5 review grade to a flashcard's schedule and save it"""
+        now = now or datetime.utcnow()
+        schedule = schedule_review(
+            flashcard.ease or 2.5, flashcard.interval or 0, flashcard.repetitions or 0, quality
+        )
+        flashcard.ease = schedule['ease']
+        flashcard.interval = schedule['interval']
+        flashcard.repetitions = schedule['repetitions']
+        flashcard.due_at = now + timedelta(days=schedule['interval'])
+        # mastery_level stays the simple running score the dashboard shows
+        if quality >= 3:
+            flashcard.mastery_level = min(1.0, (flashcard.mastery_level or 0.0) + 0.1)
+        else:
+            flashcard.mastery_level = max(0.0, (flashcard.mastery_level or 0.0) - 0.1)
+        flashcard.review_count = (flashcard.review_count or 0) + 1
+        flashcard.last_reviewed = now
+        flashcard.save()
+        return flashcard
+
+    # ------------------------------------------------------------------
+    # Deck parsing (rows are produced lazily so large uploads stream)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def iter_csv(stream: IO[str]) -> Iterator[Dict]:
+        """Rows of a CSV deck: a front,back[,category] header, or those columns in that order"""
+        reader = csv.reader(stream)
+        header = next(reader, None)
+        if header is None:
+            return
+        columns = [column.strip().lower() for column in header]
+        if 'front' in columns and 'back' in columns:
+            positions = {name: columns.index(name) for name in ('front', 'back', 'category') if name in columns}
+        else:
+            positions = {'front': 0, 'back': 1, 'category': 2}
+            reader = _chain_row(header, reader)
+        for values in reader:
+            if not any(value.strip() for value in values):
+                continue
+            yield {name: values[index] if index < len(values) else '' for name, index in positions.items()}
+
+    @staticmethod
+    def iter_json_lines(stream: IO[str]) -> Iterator[Dict]:
+        """Rows of a JSON Lines deck (one {front, back, category} object per line)"""
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None  # Counted as an invalid row
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def backfill_hashes(self, batch_size: int = 1000, user_id=None) -> int:
+        """Set front_hash on cards (of user_id, or everyone's) created before it existed; returns the number updated"""
+        from app.models import Flashcard
+
+        collection = Flashcard._get_collection()
+        query = {'front_hash': None, **({'user_id': user_id} if user_id else {})}
+        updated = 0
+        while True:
+            cards = list(collection.find(query, {'front': 1}).limit(batch_size))
+            if not cards:
+                break
+            collection.bulk_write([
+                UpdateOne({'_id': card['_id']}, {'$set': {'front_hash': front_hash(card.get('front') or '')}})
+                for card in cards
+            ], ordered=False)
+            updated += len(cards)
+        return updated
+
+
+def _chain_row(first: List[str], reader) -> Iterator[List[str]]:
+    yield first
+    yield from reader
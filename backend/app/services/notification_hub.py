@@ -0,0 +1,174 @@
+"""
+Notification Hub
+In-process pub/sub that pushes new notifications to connected /notifications/stream clients
+"""
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set
+
+from pymongo.errors import PyMongoError
+
+from app.config import NOTIFICATION_STREAM_QUEUE_SIZE, NOTIFICATION_CHANGE_STREAM_ENABLED
+from app.utils.model_utils import ref_id
+
+logger = logging.getLogger(__name__)
+
+WATCH_RETRY_SECONDS = 5
+
+
+class Subscription:
+    """One connected client: a bounded buffer of notifications waiting to be sent"""
+
+    def __init__(self, user_id: str, max_pending: int):
+        self.user_id = user_id
+        self._pending = deque(maxlen=max_pending)  # Oldest pushes are dropped when the client falls behind
+        self._ready = threading.Condition()
+        self._dropped = 0
+
+    def put(self, notification) -> None:
+        with self._ready:
+            if len(self._pending) == self._pending.maxlen:
+                self._dropped += 1
+            self._pending.append(notification)
+            self._ready.notify()
+
+    def get(self, timeout: float) -> List:
+        """Wait up to timeout seconds and return everything pending (empty on timeout)"""
+        with self._ready:
+            if not self._pending:
+                self._ready.wait(timeout)
+            items = list(self._pending)
+            self._pending.clear()
+            return items
+
+    def take_dropped(self) -> int:
+        """Number of notifications dropped since the last call"""
+        with self._ready:
+            dropped, self._dropped = self._dropped, 0
+            return dropped
+
+
+class NotificationHub:
+    """
+    Fan-out of new notifications to the subscriptions of their recipient.
+
+    Fed by Notification save/bulk-insert signals, which only see writes made by this
+    process; with change_stream_enabled a single watcher thread on the notifications
+    collection feeds the hub instead, so writes from every process are delivered.
+    Waiting connections block on a condition variable, so under gevent workers each
+    one costs a greenlet rather than a worker.
+    """
+
+    def __init__(
+        self,
+        max_pending: int = NOTIFICATION_STREAM_QUEUE_SIZE,
+        change_stream_enabled: bool = NOTIFICATION_CHANGE_STREAM_ENABLED
+    ):
+        self.max_pending = max_pending
+        self.change_stream_enabled = change_stream_enabled
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._watcher_lock = threading.Lock()
+
+    @contextmanager
+    def subscribe(self, user_id):
+        """Register a subscription for user_id for the duration of the with block"""
+        # Started here rather than at import, so it runs in the serving (post-fork) process
+        self.start_watcher()
+        subscription = Subscription(str(user_id), self.max_pending)
+        with self._lock:
+            self._subscribers.setdefault(subscription.user_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscriptions = self._subscribers.get(subscription.user_id)
+                if subscriptions is not None:
+                    subscriptions.discard(subscription)
+                    if not subscriptions:
+                        del self._subscribers[subscription.user_id]
+
+    def publish(self, notification) -> int:
+        """Push a saved Notification to its recipient's open streams; returns how many received it"""
+        user_id = str(ref_id(notification._data.get('user_id')))
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.put(notification)
+        return len(subscriptions)
+
+    def connection_count(self) -> int:
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    # ------------------------------------------------------------------
+    # Feeds
+    # ------------------------------------------------------------------
+
+    def connect_signals(self) -> None:
+        """Publish notifications created in this process (unless the change stream feeds the hub)"""
+        from mongoengine import signals
+        from app.models import Notification
+
+        signals.post_save.connect(self._on_saved, sender=Notification, weak=False)
+        signals.post_bulk_insert.connect(self._on_bulk_inserted, sender=Notification, weak=False)
+
+    def _on_saved(self, sender, document, created=False, **kwargs) -> None:
+        if created and not self.change_stream_enabled:
+            self._safe_publish(document)
+
+    def _on_bulk_inserted(self, sender, documents, **kwargs) -> None:
+        if not self.change_stream_enabled:
+            for document in documents:
+                self._safe_publish(document)
+
+    def _safe_publish(self, notification) -> None:
+        try:
+            self.publish(notification)
+        except Exception as e:
+            # Never fail the write itself; the client still sees it on its next /notifications load
+            logger.warning(f"Failed to push notification {notification.id}: {e}")
+
+    def start_watcher(self) -> None:
+        """Start the change stream watcher thread (no-op unless change_stream_enabled, or already running)"""
+        if not self.change_stream_enabled:
+            return
+        with self._watcher_lock:
+            if self._watcher and self._watcher.is_alive():
+                return
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch_loop, name='notification-watcher', daemon=True)
+            self._watcher.start()
+        logger.info("Started notification change stream watcher")
+
+    def stop_watcher(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._watcher:
+            self._watcher.join(timeout)
+            self._watcher = None
+
+    def _watch_loop(self) -> None:
+        from app.models import Notification
+
+        collection = Notification._get_collection()
+        resume_token = None
+        while not self._stop.is_set():
+            try:
+                with collection.watch(
+                    [{'$match': {'operationType': 'insert'}}],
+                    resume_after=resume_token,
+                    max_await_time_ms=1000
+                ) as stream:
+                    while not self._stop.is_set():
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        resume_token = stream.resume_token
+                        self.publish(Notification._from_son(change['fullDocument'], created=False))
+            except PyMongoError as e:
+                logger.warning(f"Notification change stream interrupted, retrying in {WATCH_RETRY_SECONDS}s: {e}")
+                self._stop.wait(WATCH_RETRY_SECONDS)
@@ -0,0 +1,242 @@
+"""
+Notification Inbox
+Bulk delivery, unread counters, read state and archival for user notifications
+"""
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.utils.model_utils import ref_id
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLLECTION = 'notifications_archive'
+RECOUNT_BATCH_SIZE = 500
+NOTIFY_BATCH_SIZE = 1000
+
+
+class NotificationInbox:
+    """
+    Notification delivery plus per-user unread counts kept in NotificationCounter with atomic $inc.
+
+    Inserts and deletes adjust counters through model signals; reads go through
+    mark_read/mark_all_read, which only count notifications they actually flipped.
+    A user without a counter document is recounted from the notifications themselves.
+    """
+
+    def notify_many(
+        self,
+        users: Iterable,
+        title: str,
+        message: str,
+        notification_type: str,
+        related_id: Optional[str] = None
+    ) -> int:
+        """
+        Send the same notification to many users.
+
+        With a related_id each user gets at most one notification per (notification_type,
+        related_id), however often this is called. Returns the number actually created.
+        """
+        user_ids = list(dict.fromkeys(ref_id(user) for user in users if user))
+        return len(self.deliver([
+            self.compose(user_id, title, message, notification_type, related_id) for user_id in user_ids
+        ]))
+
+    @staticmethod
+    def compose(user, title: str, message: str, notification_type: str, related_id: Optional[str] = None):
+        """An unsaved Notification for deliver(), keyed for deduplication when it has a related_id"""
+        from app.models import Notification
+
+        return Notification(
+            user_id=ref_id(user),
+            title=title,
+            message=message,
+            notification_type=notification_type,
+            related_id=related_id,
+            dedupe_key=f'{notification_type}:{related_id}' if related_id else None,
+        )
+
+    def deliver(self, notifications: List) -> List:
+        """
+        Insert unsaved Notification documents with unordered insert_many batches.
+
+        Duplicates of an existing dedupe_key are skipped. Returns the notifications that
+        were inserted, after the counters and the stream hub have been told about them.
+        """
+        from mongoengine import signals
+        from app.models import Notification
+
+        collection = Notification._get_collection()
+        inserted = []
+        for start in range(0, len(notifications), NOTIFY_BATCH_SIZE):
+            batch = notifications[start:start + NOTIFY_BATCH_SIZE]
+            for notification in batch:
+                notification.validate()
+            raw = [notification.to_mongo().to_dict() for notification in batch]
+            failed = set()
+            try:
+                collection.insert_many(raw, ordered=False)
+            except BulkWriteError as e:
+                errors = e.details.get('writeErrors', [])
+                if any(err.get('code') != 11000 for err in errors):
+                    raise
+                failed = {err['index'] for err in errors}  # Already notified
+            for index, (notification, son) in enumerate(zip(batch, raw)):
+                if index not in failed:
+                    notification.pk = son['_id']
+                    inserted.append(notification)
+
+        if inserted:
+            # Same signal QuerySet.insert sends: feeds unread counters and the stream hub
+            signals.post_bulk_insert.send(Notification, documents=inserted, loaded=False)
+        return inserted
+
+    def unread_count(self, user_id) -> int:
+        from app.models import NotificationCounter
+
+        unread = NotificationCounter.objects(user_id=user_id).scalar('unread').first()
+        if unread is None:
+            return self.recount([user_id]).get(str(user_id), 0)
+        return max(unread, 0)
+
+    def mark_read(self, user_id, notification_id) -> Optional[bool]:
+        """Mark one notification read; True if it was unread, False if already read, None if not found"""
+        from app.models import Notification
+
+        flipped = Notification.objects(id=notification_id, user_id=user_id, is_read=False).update_one(
+            set__is_read=True, set__read_at=datetime.utcnow()
+        )
+        if flipped:
+            self._adjust(user_id, -1)
+            return True
+        return False if Notification.objects(id=notification_id, user_id=user_id).count() else None
+
+    def mark_all_read(self, user_id) -> int:
+        """Mark every unread notification read; returns how many were flipped"""
+        from app.models import Notification
+
+        flipped = Notification.objects(user_id=user_id, is_read=False).update(
+            set__is_read=True, set__read_at=datetime.utcnow()
+        )
+        if flipped:
+            self._adjust(user_id, -flipped)
+        return flipped
+
+    def _adjust(self, user_id, delta: int) -> None:
+        from app.models import Notification, NotificationCounter
+
+        counters = NotificationCounter.objects(user_id=user_id)
+        if counters.update_one(inc__unread=delta):
+            return
+        # First write for this user: create the counter at the count before this change
+        # ($setOnInsert, so a concurrent first writer's counter is kept), then $inc like everyone else
+        unread = Notification.objects(user_id=user_id, is_read=False).count()
+        counters.update_one(upsert=True, set_on_insert__unread=unread - delta)
+        counters.update_one(inc__unread=delta)
+
+    # ------------------------------------------------------------------
+    # Repair and archival
+    # ------------------------------------------------------------------
+
+    def recount(self, user_ids: Optional[Iterable] = None) -> Dict[str, int]:
+        """
+        Recompute counters from the notifications themselves.
+
+        Args:
+            user_ids: Users to recount (every user with notifications or a counter when None)
+
+        Returns:
+            user_id -> unread count for the users recounted
+        """
+        from app.models import Notification, NotificationCounter
+
+        if user_ids is None:
+            user_ids = set(Notification._get_collection().distinct('user_id'))
+            user_ids |= set(NotificationCounter._get_collection().distinct('user_id'))
+        user_ids = [ref_id(user_id) for user_id in user_ids]
+
+        counts: Dict[str, int] = {}
+        for start in range(0, len(user_ids), RECOUNT_BATCH_SIZE):
+            batch = user_ids[start:start + RECOUNT_BATCH_SIZE]
+            unread = {
+                row['_id']: row['count']
+                for row in Notification.objects.aggregate([
+                    {'$match': {'user_id': {'$in': batch}, 'is_read': False}},
+                    {'$group': {'_id': '$user_id', 'count': {'$sum': 1}}},
+                ])
+            }
+            NotificationCounter._get_collection().bulk_write([
+                UpdateOne({'user_id': user_id}, {'$set': {'unread': unread.get(user_id, 0)}}, upsert=True)
+                for user_id in batch
+            ], ordered=False)
+            counts.update({str(user_id): unread.get(user_id, 0) for user_id in batch})
+        return counts
+
+    def archive(self, older_than_days: int, batch_size: int = 1000) -> int:
+        """
+        Move notifications created more than older_than_days ago to notifications_archive.
+
+        Read notifications normally expire through the read_at TTL index first; this
+        catches old unread ones. Returns the number of notifications archived.
+        """
+        from app.models import Notification, NotificationCounter
+
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        collection = Notification._get_collection()
+        archive = collection.database[ARCHIVE_COLLECTION]
+        archived = 0
+        while True:
+            batch = list(collection.find({'created_at': {'$lt': cutoff}}).limit(batch_size))
+            if not batch:
+                break
+            # Upserts keep a rerun after a partial failure from duplicating archive entries
+            archive.bulk_write([ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for doc in batch], ordered=False)
+            collection.delete_many({'_id': {'$in': [doc['_id'] for doc in batch]}})
+
+            unread = Counter(doc['user_id'] for doc in batch if not doc.get('is_read'))
+            if unread:
+                NotificationCounter._get_collection().bulk_write([
+                    UpdateOne({'user_id': user_id}, {'$inc': {'unread': -count}})
+                    for user_id, count in unread.items()
+                ], ordered=False)
+            archived += len(batch)
+        return archived
+
+    # ------------------------------------------------------------------
+    # Signals
+    # ------------------------------------------------------------------
+
+    def connect_signals(self) -> None:
+        """Count unread notifications as they are inserted (singly or in bulk) and deleted"""
+        from mongoengine import signals
+        from app.models import Notification
+
+        signals.post_save.connect(self._on_saved, sender=Notification, weak=False)
+        signals.post_bulk_insert.connect(self._on_bulk_inserted, sender=Notification, weak=False)
+        signals.post_delete.connect(self._on_deleted, sender=Notification, weak=False)
+
+    def _on_saved(self, sender, document, created=False, **kwargs) -> None:
+        if created and not document.is_read:
+            self._safe_adjust({ref_id(document._data.get('user_id')): 1})
+
+    def _on_bulk_inserted(self, sender, documents, **kwargs) -> None:
+        self._safe_adjust(Counter(
+            ref_id(document._data.get('user_id')) for document in documents if not document.is_read
+        ))
+
+    def _on_deleted(self, sender, document, **kwargs) -> None:
+        if not document.is_read:
+            self._safe_adjust({ref_id(document._data.get('user_id')): -1})
+
+    def _safe_adjust(self, deltas: Dict) -> None:
+        for user_id, delta in deltas.items():
+            try:
+                self._adjust(user_id, delta)
+            except Exception as e:
+                # Never fail the write itself; recount-notifications repairs drift
+                logger.warning(f"Failed to update unread counter for user {user_id}: {e}")
@@ -1,74 +1,235 @@
-"""
-Peer Review Matching Service
-Intelligently matches students for peer review based on skill levels
-"""
-from app.models import User, Submission, PeerReview, Feedback
-from typing import List
-import random
-from bson import ObjectId
-
-class PeerMatchingService:
-    """Service for intelligent peer review matching"""
-    
-    def __init__(self):
-        self.peers_per_submission = 2  # Number of peers to assign
-    
-    def match_peers(self, submission_id, submitter_id, course_id, department: str = None) -> List:
-        """
-        Very simple matching:
-        - Take all other students (optionally same department)
-        - Skip anyone who already has a PeerReview for this submission
-        - Return up to `peers_per_submission` reviewer IDs
-
-        This makes behavior predictable for small setups: with two students,
-        each new submission will assign the *other* student as reviewer.
-        """
-        import logging
-        logger = logging.getLogger(__name__)
-
-        try:
-            submission_obj_id = ObjectId(submission_id) if isinstance(submission_id, str) else submission_id
-        except Exception as e:
-            logger.warning(f"Error parsing submission id {submission_id}: {e}")
-            return []
-
-        # Resolve submitter id to ObjectId
-        try:
-            submitter_obj_id = ObjectId(submitter_id) if isinstance(submitter_id, str) else submitter_id
-        except Exception as e:
-            logger.warning(f"Error parsing submitter id {submitter_id}: {e}")
-            return []
-
-        # Base query: all students except the submitter
-        query = User.objects(role='student', id__ne=submitter_obj_id)
-
-        # Prefer same department if provided
-        if department:
-            query = query.filter(department=department)
-
-        students = list(query)
-
-        # If department filter yields nobody, fall back to all other students
-        if not students:
-            students = list(User.objects(role='student', id__ne=submitter_obj_id))
-
-        if not students:
-            return []
-
-        selected_ids: List[str] = []
-        for student in students:
-            if len(selected_ids) >= self.peers_per_submission:
-                break
-
-            # Skip if this student already has a PeerReview for this submission
-            existing = PeerReview.objects(
-                submission_id=submission_obj_id,
-                reviewer_id=student.id
-            ).first()
-            if existing:
-                continue
-
-            selected_ids.append(str(student.id))
-
-        return selected_ids
-
+"""
+Peer Review Matching Service
+Balanced, skill-aware reviewer assignment for batches of submissions
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from bson import ObjectId
+
+from app.config import DEFAULT_PEERS_PER_SUBMISSION, MAX_REVIEWS_PER_REVIEWER
+from app.models import User, Submission, PeerReview
+
+logger = logging.getLogger(__name__)
+
+
+class PeerMatchingService:
+    """Service for intelligent peer review matching"""
+    
+    SKILL_OFFSET = 0.1  # Aim for reviewers slightly stronger than the submitter
+    SKILL_WEIGHT = 2.0  # Cost of a full 0..1 skill gap, in pending reviews
+    CROSS_DEPARTMENT_PENALTY = 100.0  # Other departments are only used when a department runs out
+    
+    def __init__(self):
+        self.peers_per_submission = DEFAULT_PEERS_PER_SUBMISSION
+        self.max_reviews_per_reviewer = MAX_REVIEWS_PER_REVIEWER
+        self._rng = np.random.default_rng()
+    
+    def match_peers(self, submission_id, submitter_id, course_id, department: str = None) -> List:
+        """
+        Pick reviewers for one submission without writing anything.
+
+        Kept for callers that create PeerReview documents themselves; new code
+        should use assign_reviewers, which also persists the assignment.
+        """
+        try:
+            submission_obj_id = ObjectId(submission_id) if isinstance(submission_id, str) else submission_id
+            submitter_obj_id = ObjectId(submitter_id) if isinstance(submitter_id, str) else submitter_id
+        except Exception as e:
+            logger.warning(f"Error parsing ids for peer matching ({submission_id}, {submitter_id}): {e}")
+            return []
+        
+        plan = self.plan_assignments([{
+            'id': submission_obj_id,
+            'user_id': submitter_obj_id,
+            'department': department,
+        }])
+        return [str(reviewer_id) for reviewer_id in plan.get(submission_obj_id, [])]
+    
+    def assign_reviewers(
+        self, 
+        submissions: List[Submission], 
+        peers_per_submission: Optional[int] = None, 
+        max_reviews_per_reviewer: Optional[int] = None,
+        department: Optional[str] = None,
+        notify: bool = True
+    ) -> Dict[str, List[str]]:
+        """
+        Assign reviewers to a batch of submissions and persist the result.
+
+        Reviewers come from each submitter's department unless department is given.
+        PeerReview documents are written with a single bulk insert and notifications with
+        one unordered notification_inbox.deliver() call.
+
+        Returns:
+            Dict of submission id -> list of assigned reviewer ids
+        """
+        from app.services import notification_inbox
+        
+        rows = []
+        titles = {}
+        for submission in submissions:
+            son = submission.to_mongo()  # Raw ids, so the submitter is not dereferenced per submission
+            rows.append({'id': submission.id, 'user_id': son.get('user_id'), 'department': department})
+            titles[submission.id] = submission.assignment_title
+        
+        plan = self.plan_assignments(rows, peers_per_submission, max_reviews_per_reviewer)
+        
+        reviews = []
+        notifications = []
+        for submission_id, reviewer_ids in plan.items():
+            for reviewer_id in reviewer_ids:
+                reviews.append(PeerReview(submission_id=submission_id, reviewer_id=reviewer_id, status='pending'))
+                if notify:
+                    notifications.append(notification_inbox.compose(
+                        reviewer_id,
+                        title='New Peer Review Assigned',
+                        message=f'You have been assigned to review: {titles[submission_id]}',
+                        notification_type='review',
+                        related_id=str(submission_id)
+                    ))
+        if reviews:
+            PeerReview.objects.insert(reviews, load_bulk=False)
+        if notifications:
+            notification_inbox.deliver(notifications)
+        
+        return {str(submission_id): [str(r) for r in reviewer_ids] for submission_id, reviewer_ids in plan.items()}
+    
+    def plan_assignments(
+        self, 
+        submissions: List[Dict], 
+        peers_per_submission: Optional[int] = None, 
+        max_reviews_per_reviewer: Optional[int] = None
+    ) -> Dict[ObjectId, List[ObjectId]]:
+        """
+        Compute a balanced reviewer assignment in one pass, without writing.
+
+        Each submission dict needs 'id' and 'user_id' (ObjectIds) and may carry a
+        'department' override. Reviewers are chosen greedily by cost:
+            pending reviews + SKILL_WEIGHT * |skill - target| (+ CROSS_DEPARTMENT_PENALTY)
+        so load spreads evenly, nobody exceeds max_reviews_per_reviewer pending
+        reviews, submitters never review themselves and existing pairs are skipped.
+
+        Only students of the batch's departments are loaded; submissions those
+        departments cannot fully serve are planned again against every student.
+        """
+        peers = peers_per_submission or self.peers_per_submission
+        capacity = max_reviews_per_reviewer or self.max_reviews_per_reviewer
+        if not submissions:
+            return {}
+        
+        submitters = {
+            user['_id']: user for user in User.objects(
+                id__in=list({s['user_id'] for s in submissions})
+            ).only('id', 'skill_level', 'department').as_pymongo()
+        }
+        rows = []
+        for submission in submissions:
+            submitter = submitters.get(submission['user_id'], {})
+            rows.append({
+                'id': submission['id'],
+                'user_id': submission['user_id'],
+                'department': submission.get('department') or submitter.get('department'),
+                'skill': submitter['skill_level'] if submitter.get('skill_level') is not None else 0.5,
+            })
+        
+        existing = defaultdict(set)
+        for review in PeerReview.objects(submission_id__in=[s['id'] for s in submissions]).only(
+            'submission_id', 'reviewer_id'
+        ).as_pymongo():
+            existing[review['submission_id']].add(review['reviewer_id'])
+        
+        departments = {row['department'] for row in rows}
+        everyone = None in departments
+        plan = self._plan(rows, self._roster(None if everyone else departments), existing, peers, capacity)
+        
+        short = [row for row in rows if len(plan[row['id']]) + len(existing.get(row['id'], ())) < peers]
+        if short and not everyone:
+            # A department ran out: let the rest of the school fill the gaps
+            roster = self._roster(None)
+            short_ids = {row['id'] for row in short}
+            picked = defaultdict(int)
+            for row in rows:
+                if row['id'] not in short_ids:
+                    for reviewer_id in plan[row['id']]:
+                        picked[reviewer_id] += 1
+            for reviewer_id, count in picked.items():
+                roster['load'][roster['position'][reviewer_id]] += count
+            plan.update(self._plan(short, roster, existing, peers, capacity))
+        
+        for row in rows:
+            count = len(plan[row['id']])
+            wanted = max(0, peers - len(existing.get(row['id'], ())))
+            if count < wanted:
+                logger.warning(f"Only {count} of {wanted} reviewers available for submission {row['id']}")
+        return plan
+    
+    def _roster(self, departments: Optional[set]) -> Dict:
+        """Students of departments (every student for None) with their pending review counts"""
+        query = User.objects(role='student')
+        if departments is not None:
+            query = query.filter(department__in=list(departments))
+        roster = list(query.only('id', 'skill_level', 'department').as_pymongo())
+        reviewer_ids = [r['_id'] for r in roster]
+        position = {reviewer_id: i for i, reviewer_id in enumerate(reviewer_ids)}
+        
+        load = np.zeros(len(roster), dtype=np.float64)
+        match = {'status': 'pending'}
+        if departments is not None:
+            match['reviewer_id'] = {'$in': reviewer_ids}
+        for row in PeerReview._get_collection().aggregate([
+            {'$match': match},
+            {'$group': {'_id': '$reviewer_id', 'count': {'$sum': 1}}}
+        ]):
+            if row['_id'] in position:
+                load[position[row['_id']]] = row['count']
+        
+        return {
+            'ids': reviewer_ids,
+            'position': position,
+            'skills': np.array([r['skill_level'] if r.get('skill_level') is not None else 0.5 for r in roster],
+                               dtype=np.float64),
+            'departments': [r.get('department') for r in roster],
+            'load': load,
+        }
+    
+    def _plan(self, rows: List[Dict], roster: Dict, existing: Dict, peers: int, capacity: int) -> Dict:
+        """Greedy cheapest-reviewer picks for rows against one roster; updates roster['load']"""
+        reviewer_ids, position, load = roster['ids'], roster['position'], roster['load']
+        if not reviewer_ids:
+            return {row['id']: [] for row in rows}
+        skills = roster['skills']
+        department_codes = {}
+        roster_departments = np.array([department_codes.setdefault(d, len(department_codes)) for d in roster['departments']])
+        
+        plan = {}
+        for row in rows:
+            submitter = position.get(row['user_id'])
+            target = min(1.0, row['skill'] + self.SKILL_OFFSET)
+            
+            cost = load + self.SKILL_WEIGHT * np.abs(skills - target)
+            if row['department'] is not None:
+                cost += self.CROSS_DEPARTMENT_PENALTY * (roster_departments != department_codes.get(row['department'], -1))
+            cost += self._rng.random(len(cost)) * 1e-3  # Break ties so equal candidates rotate
+            
+            cost[load >= capacity] = np.inf
+            if submitter is not None:
+                cost[submitter] = np.inf
+            for reviewer_id in existing.get(row['id'], ()):
+                if reviewer_id in position:
+                    cost[position[reviewer_id]] = np.inf
+            
+            wanted = max(0, peers - len(existing.get(row['id'], ())))
+            count = min(wanted, int(np.isfinite(cost).sum()))
+            if not count:
+                plan[row['id']] = []
+                continue
+            
+            chosen = np.argpartition(cost, count - 1)[:count]
+            chosen = chosen[np.argsort(cost[chosen])]
+            load[chosen] += 1
+            plan[row['id']] = [reviewer_ids[i] for i in chosen]
+        
+        return plan
@@ -0,0 +1,527 @@
+"""
+Plagiarism Service
+Winnowing fingerprints with a MinHash LSH index for comparing submissions to each other
+"""
+import hashlib
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from mongoengine.queryset.visitor import Q
+from numpy.lib.stride_tricks import sliding_window_view
+
+from app.config import (
+    PLAGIARISM_KGRAM_SIZE, PLAGIARISM_WINDOW_SIZE, PLAGIARISM_NUM_PERM,
+    PLAGIARISM_LSH_BANDS, PLAGIARISM_TOP_K, PLAGIARISM_THRESHOLD,
+    PLAGIARISM_REPORT_MIN_SIMILARITY, PLAGIARISM_REPORT_MAX_PAIRS,
+    PLAGIARISM_MATRIX_CHUNK_ROWS, PLAGIARISM_MATRIX_WORKERS, PLAGIARISM_MATRIX_PARALLEL_ROWS,
+    PLAGIARISM_REPORT_LEASE_SECONDS, PLAGIARISM_REPORT_MAX_ATTEMPTS, PLAGIARISM_WORKER_POLL_SECONDS
+)
+from app.core.similarity import pairwise_jaccard
+from app.services.submission_storage import submission_content
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_MINHASH_SEED = 1  # Fixed so signatures stay comparable across processes and restarts
+_MINHASH_CHUNK = 4096  # Fingerprints hashed per numpy batch, bounds memory for very large submissions
+
+_CODE_TOKEN_RE = re.compile('|'.join([
+    r'(?P<comment>//[^\n]*|/\*[\s\S]*?\*/|#[^\n]*)',
+    r'(?P<string>"""[\s\S]*?"""|' + r"'''[\s\S]*?'''|" + r'"(?:\\.|[^"\\\n])*"|' + r"'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)",
+    r'(?P<number>\b0[xX][0-9a-fA-F]+\b|\b\d[\d_]*(?:\.\d+)?(?:[eE][+-]?\d+)?\b)',
+    r'(?P<name>[A-Za-z_$][\w$]*)',
+    r'(?P<op>[^\s\w])',
+]))
+_PROSE_WORD_RE = re.compile(r'[^\W\d_]+')
+_CODE_HINT_RE = re.compile(r'[;{}]\s*$|\bdef\s+\w+\s*\(|\bfunction\b|\breturn\b|^\s*(import|#include)\b', re.MULTILINE)
+
+# Keywords keep the program's structure; every other identifier is renamed to 'V'
+_CODE_KEYWORDS = frozenset('''
+    and as assert async await break case catch class const continue def default del do elif else
+    enum except export extends false final finally for from function global if implements import
+    in instanceof interface is lambda let new none nonlocal not null or pass private protected
+    public raise return self static super switch this throw throws true try typeof var void
+    while with yield int float double char long bool boolean string str list dict print
+'''.split())
+_PROSE_STOPWORDS = frozenset('''
+    a an and are as at be but by for from has have in is it its of on or that the this to was
+    were will with ja on ei se että
+'''.split())
+
+
+class PlagiarismService:
+    """Fingerprint submissions and find similar ones through a MinHash LSH index"""
+
+    def __init__(
+        self,
+        kgram_size: int = PLAGIARISM_KGRAM_SIZE,
+        window_size: int = PLAGIARISM_WINDOW_SIZE,
+        num_perm: int = PLAGIARISM_NUM_PERM,
+        bands: int = PLAGIARISM_LSH_BANDS,
+        report_lease_seconds: int = PLAGIARISM_REPORT_LEASE_SECONDS,
+        max_report_attempts: int = PLAGIARISM_REPORT_MAX_ATTEMPTS,
+        poll_seconds: float = PLAGIARISM_WORKER_POLL_SECONDS
+    ):
+        if num_perm % bands:
+            raise ValueError('PLAGIARISM_NUM_PERM must be divisible by PLAGIARISM_LSH_BANDS')
+        self.kgram_size = kgram_size
+        self.window_size = window_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.report_lease_seconds = report_lease_seconds
+        self.max_report_attempts = max_report_attempts
+        self.poll_seconds = poll_seconds
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+        # Universal hash parameters; a, b < 2^32 so a * h + b cannot overflow uint64
+        rng = np.random.RandomState(_MINHASH_SEED)
+        self._perm_a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._perm_b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    # ------------------------------------------------------------------
+    # Fingerprinting
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def looks_like_code(text: str) -> bool:
+        """Guess whether free-form content is source code"""
+        return len(_CODE_HINT_RE.findall(text or '')) >= 2
+
+    @staticmethod
+    def normalize(text: str, submission_type: str = 'code') -> List[str]:
+        """
+        Tokenize content so cosmetic edits do not change the fingerprint.
+
+        Code: comments dropped, identifiers -> 'V', strings -> 'S', numbers -> 'N',
+        keywords and operators kept. Prose: lower-cased words without stopwords.
+        """
+        text = text or ''
+        if submission_type != 'code':
+            return [w for w in _PROSE_WORD_RE.findall(text.lower()) if w not in _PROSE_STOPWORDS]
+
+        tokens = []
+        for match in _CODE_TOKEN_RE.finditer(text):
+            kind = match.lastgroup
+            if kind == 'comment':
+                continue
+            if kind == 'string':
+                tokens.append('S')
+            elif kind == 'number':
+                tokens.append('N')
+            elif kind == 'name':
+                word = match.group().lower()
+                tokens.append(word if word in _CODE_KEYWORDS else 'V')
+            else:
+                tokens.append(match.group())
+        return tokens
+
+    def fingerprint(self, tokens: List[str]) -> List[int]:
+        """Winnow the hashed k-grams of a token stream into a sorted list of 32-bit fingerprints"""
+        if not tokens:
+            return []
+        k = min(self.kgram_size, len(tokens))
+        hashes = np.fromiter(
+            (
+                int.from_bytes(hashlib.blake2b('\x1f'.join(tokens[i:i + k]).encode('utf-8'), digest_size=4).digest(), 'big')
+                for i in range(len(tokens) - k + 1)
+            ),
+            dtype=np.uint64
+        )
+        if len(hashes) <= self.window_size:
+            return [int(hashes.min())]
+
+        # Rightmost minimum of every window, as in the winnowing paper
+        windows = sliding_window_view(hashes, self.window_size)
+        offsets = self.window_size - 1 - np.argmin(windows[:, ::-1], axis=1)
+        positions = np.unique(np.arange(len(windows)) + offsets)
+        return sorted(set(int(h) for h in hashes[positions]))
+
+    def minhash(self, fingerprints: List[int]) -> Optional[np.ndarray]:
+        """MinHash signature of a fingerprint set, or None for an empty set"""
+        if not fingerprints:
+            return None
+        values = np.asarray(fingerprints, dtype=np.uint64)
+        signature = np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        for start in range(0, len(values), _MINHASH_CHUNK):
+            chunk = values[start:start + _MINHASH_CHUNK, None]
+            hashed = ((chunk * self._perm_a + self._perm_b) % _MERSENNE_PRIME) & _MAX_HASH
+            signature = np.minimum(signature, hashed.min(axis=0))
+        return signature
+
+    def lsh_buckets(self, signature: Optional[np.ndarray]) -> List[str]:
+        """Split a signature into bands and hash each band to a '<band>:<hash>' bucket key"""
+        if signature is None:
+            return []
+        bands = signature.reshape(self.bands, self.rows)
+        return [
+            f'{band}:{hashlib.blake2b(rows.tobytes(), digest_size=8).hexdigest()}'
+            for band, rows in enumerate(bands)
+        ]
+
+    # ------------------------------------------------------------------
+    # Index maintenance
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _content_hash(content: str, submission_type: str) -> str:
+        return hashlib.sha256(f'{submission_type}\x00{content or ""}'.encode('utf-8')).hexdigest()
+
+    def index_submission(self, submission, force: bool = False):
+        """Fingerprint a submission and upsert its index entry; returns the entry"""
+        from app.models import PlagiarismFingerprint
+
+        content = submission_content(submission)
+        content_hash = self._content_hash(content, submission.submission_type)
+        entry = PlagiarismFingerprint.objects(submission_id=submission.id).first()
+        if entry and entry.content_hash == content_hash and not force:
+            return entry
+
+        tokens = self.normalize(content, submission.submission_type)
+        fingerprints = self.fingerprint(tokens)
+        signature = self.minhash(fingerprints)
+        now = datetime.utcnow()
+
+        PlagiarismFingerprint.objects(submission_id=submission.id).update_one(
+            upsert=True,
+            set__user_id=submission.user_id,
+            set__course_id=submission.course_id,
+            set__assignment_title=submission.assignment_title,
+            set__submission_type=submission.submission_type,
+            set__content_hash=content_hash,
+            set__fingerprints=fingerprints,
+            set__minhash=[int(v) for v in signature] if signature is not None else [],
+            set__lsh_buckets=self.lsh_buckets(signature),
+            set__token_count=len(tokens),
+            set__submitted_at=submission.created_at,
+            set__updated_at=now,
+            set_on_insert__created_at=now,
+        )
+        return PlagiarismFingerprint.objects(submission_id=submission.id).first()
+
+    def remove_submission(self, submission_id) -> None:
+        """Drop a submission from the index"""
+        from app.models import PlagiarismFingerprint
+        PlagiarismFingerprint.objects(submission_id=submission_id).delete()
+
+    def rebuild(self, force: bool = False) -> int:
+        """Index every non-practice submission; returns the number processed"""
+        from app.models import Submission
+
+        count = 0
+        for submission in Submission.objects(is_practice__ne=True).no_cache():
+            self.index_submission(submission, force=force)
+            count += 1
+        return count
+
+    def connect_signals(self) -> None:
+        """Keep the index current on every Submission save/delete"""
+        from mongoengine import signals
+        from app.models import Submission
+
+        signals.post_save.connect(self._on_submission_saved, sender=Submission, weak=False)
+        signals.post_delete.connect(self._on_submission_deleted, sender=Submission, weak=False)
+
+    _INDEXED_FIELDS = frozenset(['content', 'files', 'submission_type', 'course_id', 'assignment_title'])
+
+    def _on_submission_saved(self, sender, document, created=False, **kwargs) -> None:
+        if document.is_practice:
+            return
+        if not created and not self._INDEXED_FIELDS.intersection(document._changed_fields or []):
+            return
+        try:
+            self.index_submission(document)
+        except Exception as e:
+            # Never fail the submission itself because the index could not be updated
+            logger.warning(f"Failed to index submission {document.id} for plagiarism: {e}")
+
+    def _on_submission_deleted(self, sender, document, **kwargs) -> None:
+        try:
+            self.remove_submission(document.id)
+        except Exception as e:
+            logger.warning(f"Failed to remove submission {document.id} from plagiarism index: {e}")
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def find_similar(
+        self,
+        content: Optional[str] = None,
+        submission_type: Optional[str] = None,
+        submission=None,
+        course_id=None,
+        assignment_title: Optional[str] = None,
+        top_k: int = PLAGIARISM_TOP_K,
+        prior_only: bool = True
+    ) -> Dict:
+        """
+        Find the most similar indexed submissions.
+
+        With a submission, its stored fingerprints are used and the search is scoped to
+        its course and assignment (and to earlier submissions when prior_only is set).
+        Otherwise content is fingerprinted on the fly and the optional scope applies.
+
+        Returns:
+            Dict with 'matches' (top_k, most similar first) and 'fingerprint_count'
+        """
+        from app.models import PlagiarismFingerprint, User
+
+        query = {}
+        if submission is not None:
+            entry = self.index_submission(submission)
+            fingerprints = entry.fingerprints if entry else []
+            buckets = entry.lsh_buckets if entry else []
+            query['submission_id__ne'] = submission.id
+            course_id = course_id or (submission.course_id.id if submission.course_id else None)
+            assignment_title = assignment_title or submission.assignment_title
+            if prior_only and submission.created_at:
+                query['submitted_at__lt'] = submission.created_at
+        else:
+            if submission_type is None:
+                submission_type = 'code' if self.looks_like_code(content) else 'essay'
+            fingerprints = self.fingerprint(self.normalize(content, submission_type))
+            buckets = self.lsh_buckets(self.minhash(fingerprints))
+
+        if not buckets:
+            return {'matches': [], 'fingerprint_count': len(fingerprints)}
+        if course_id:
+            query['course_id'] = course_id
+        if assignment_title:
+            query['assignment_title'] = assignment_title
+
+        candidates = PlagiarismFingerprint.objects(lsh_buckets__in=buckets, **query).only(
+            'submission_id', 'user_id', 'assignment_title', 'fingerprints', 'submitted_at'
+        ).no_dereference()
+
+        own = set(fingerprints)
+        scored = []
+        for candidate in candidates:
+            other = set(candidate.fingerprints or [])
+            shared = len(own & other)
+            if not shared:
+                continue
+            scored.append((shared / len(own | other), shared / len(own), candidate))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        scored = scored[:top_k]
+
+        user_ids = [c.user_id.id for _, _, c in scored if c.user_id]
+        names = {u.id: u.name for u in User.objects(id__in=user_ids).only('name')} if user_ids else {}
+        matches = [{
+            'submission_id': str(c.submission_id.id),
+            'user_id': str(c.user_id.id) if c.user_id else None,
+            'user_name': names.get(c.user_id.id) if c.user_id else None,
+            'assignment_title': c.assignment_title,
+            'similarity': round(jaccard, 3),
+            'containment': round(containment, 3),  # Share of the checked content found in the match
+            'submitted_at': c.submitted_at.isoformat() if c.submitted_at else None,
+        } for jaccard, containment, c in scored]
+        return {'matches': matches, 'fingerprint_count': len(fingerprints)}
+
+    # ------------------------------------------------------------------
+    # Cohort reports
+    # ------------------------------------------------------------------
+
+    def build_report(
+        self,
+        course=None,
+        assignment_title: Optional[str] = None,
+        requested_by=None,
+        threshold: float = PLAGIARISM_THRESHOLD,
+        min_similarity: float = PLAGIARISM_REPORT_MIN_SIMILARITY,
+        max_pairs: int = PLAGIARISM_REPORT_MAX_PAIRS,
+        workers: int = PLAGIARISM_MATRIX_WORKERS
+    ):
+        """
+        Compute the pairwise similarity matrix for every submission in a course and/or
+        assignment in the calling thread and store the ranked pairs as a PlagiarismReport.
+
+        Pairs from the same student (resubmissions) are ignored. Web requests use
+        enqueue_report instead and leave the work to the plagiarism worker.
+        """
+        report = self.enqueue_report(course, assignment_title, requested_by, threshold, min_similarity,
+                                     status='running')
+        return self.run_report(report, max_pairs=max_pairs, workers=workers)
+
+    def enqueue_report(
+        self,
+        course=None,
+        assignment_title: Optional[str] = None,
+        requested_by=None,
+        threshold: float = PLAGIARISM_THRESHOLD,
+        min_similarity: float = PLAGIARISM_REPORT_MIN_SIMILARITY,
+        status: str = 'queued'
+    ):
+        """Save a report for the plagiarism worker to build"""
+        from app.models import PlagiarismReport
+
+        if course is None and not assignment_title:
+            raise ValueError('A course or assignment title is required')
+
+        report = PlagiarismReport(
+            course_id=course,
+            assignment_title=assignment_title,
+            requested_by=requested_by,
+            threshold=threshold,
+            min_similarity=min_similarity,
+            status=status
+        )
+        report.save()
+        self._wake.set()
+        return report
+
+    def run_report(
+        self,
+        report,
+        max_pairs: int = PLAGIARISM_REPORT_MAX_PAIRS,
+        workers: int = PLAGIARISM_MATRIX_WORKERS
+    ):
+        """Compute a saved report's pairs and store them with its final status"""
+        from app.models import Submission, PlagiarismFingerprint, User
+
+        started = time.perf_counter()
+        try:
+            scope = {'is_practice__ne': True}
+            if report.course_id is not None:
+                scope['course_id'] = report.course_id
+            if report.assignment_title:
+                scope['assignment_title'] = report.assignment_title
+            submission_ids = [s.id for s in Submission.objects(**scope).only('id')]
+
+            entries = {
+                e.submission_id.id: e for e in PlagiarismFingerprint.objects(
+                    submission_id__in=submission_ids
+                ).only('submission_id', 'user_id', 'assignment_title', 'fingerprints').no_dereference()
+            }
+            missing = [sid for sid in submission_ids if sid not in entries]
+            for submission in Submission.objects(id__in=missing):
+                entry = self.index_submission(submission)
+                entries[submission.id] = PlagiarismFingerprint.objects(id=entry.id).no_dereference().first()
+
+            rows = [entries[sid] for sid in submission_ids if sid in entries]
+            pairs = pairwise_jaccard(
+                [row.fingerprints or [] for row in rows],
+                threshold=report.min_similarity,
+                chunk_rows=PLAGIARISM_MATRIX_CHUNK_ROWS,
+                workers=workers,
+                min_parallel_rows=PLAGIARISM_MATRIX_PARALLEL_ROWS
+            )
+
+            def owner(row):
+                return row.user_id.id if row.user_id else None
+            pairs = [(a, b, sim) for a, b, sim in pairs if owner(rows[a]) is None or owner(rows[a]) != owner(rows[b])]
+
+            kept = pairs[:max_pairs]
+            user_ids = {owner(rows[i]) for a, b, _ in kept for i in (a, b)} - {None}
+            names = {u.id: u.name for u in User.objects(id__in=list(user_ids)).only('name')} if user_ids else {}
+
+            def describe(row):
+                user_id = owner(row)
+                return {
+                    'submission_id': str(row.submission_id.id),
+                    'user_id': str(user_id) if user_id else None,
+                    'user_name': names.get(user_id),
+                    'assignment_title': row.assignment_title,
+                }
+
+            report.pairs = [{
+                'submission_a': describe(rows[a]),
+                'submission_b': describe(rows[b]),
+                'similarity': round(sim, 3),
+                'suspicious': sim >= report.threshold,
+            } for a, b, sim in kept]
+            report.submission_count = len(rows)
+            report.pair_count = len(pairs)
+            report.suspicious_count = sum(1 for _, _, sim in pairs if sim >= report.threshold)
+            report.status = 'completed'
+        except Exception as e:
+            logger.error(f"Plagiarism report {report.id} failed: {e}", exc_info=True)
+            report.status = 'failed'
+            report.error = str(e)
+
+        report.duration_ms = int((time.perf_counter() - started) * 1000)
+        report.finished_at = datetime.utcnow()
+        report.lease_expires_at = None
+        report.save()
+        return report
+
+    # ------------------------------------------------------------------
+    # Report worker
+    # ------------------------------------------------------------------
+
+    def claim_report(self, worker_id: str):
+        """
+        Atomically take the oldest queued report, or a running one whose worker died.
+
+        Reports whose worker died max_report_attempts times are failed instead, so a
+        report that kills its worker is not retried forever.
+        """
+        from app.models import PlagiarismReport
+
+        now = datetime.utcnow()
+        PlagiarismReport.objects(
+            status='running', lease_expires_at__lt=now, attempts__gte=self.max_report_attempts
+        ).update(
+            set__status='failed',
+            set__error='The worker stopped while building this report',
+            set__finished_at=now,
+            unset__lease_expires_at=True
+        )
+        runnable = Q(status='queued') | (Q(status='running') & Q(lease_expires_at__lt=now))
+        return PlagiarismReport.objects(runnable).order_by('created_at').modify(
+            new=True,
+            set__status='running',
+            set__worker_id=worker_id,
+            set__lease_expires_at=now + timedelta(seconds=self.report_lease_seconds),
+            inc__attempts=1
+        )
+
+    def run_pending_reports(self, limit: Optional[int] = None, worker_id: Optional[str] = None) -> int:
+        """Build queued reports in the calling thread; returns the number built"""
+        worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        built = 0
+        while limit is None or built < limit:
+            report = self.claim_report(worker_id)
+            if not report:
+                break
+            self.run_report(report)
+            built += 1
+        return built
+
+    def start_worker(self, app) -> None:
+        """Build queued reports on a background thread until stop_worker (no-op if already running)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._worker_loop, args=(app,), name='plagiarism-worker', daemon=True)
+        self._thread.start()
+        logger.info("Started plagiarism report worker")
+
+    def stop_worker(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _worker_loop(self, app) -> None:
+        with app.app_context():
+            while not self._stop.is_set():
+                try:
+                    built = self.run_pending_reports(limit=1)
+                except Exception as e:
+                    logger.error(f"Plagiarism worker error: {e}", exc_info=True)
+                    built = 0
+                if not built:
+                    self._wake.wait(self.poll_seconds)
+                    self._wake.clear()
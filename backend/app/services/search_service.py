@@ -0,0 +1,233 @@
+"""
+Search Service
+Relevance-ranked full-text search over resources, flashcards and a student's own submissions,
+backed by MongoDB text indexes
+"""
+import base64
+import binascii
+import html
+import json
+import logging
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from app.config import SEARCH_SNIPPET_CHARS, SEARCH_MAX_QUERY_CHARS, SEARCH_MAX_RESULTS
+from app.exceptions.api_exceptions import ValidationError
+from app.utils.pagination import page_size
+
+logger = logging.getLogger(__name__)
+
+# source name -> (model class name, title field, fields a snippet is cut from in order, summary fields)
+SOURCES = {
+    'resources': ('Resource', 'title', ('description', 'content', 'tags', 'title'),
+                  ('title', 'description', 'resource_type', 'url', 'category', 'department')),
+    'flashcards': ('Flashcard', 'front', ('back', 'front', 'category'), ('front', 'back', 'category')),
+    'submissions': ('Submission', 'assignment_title', ('content', 'task_description', 'assignment_title'),
+                    ('assignment_title', 'course_id', 'status', 'created_at')),
+}
+
+_TERM_RE = re.compile(r'(-?)"([^"]+)"|(-?)(\w+)')
+_SUFFIXES = ('ing', 'ed', 'es', 's')
+
+
+def search_terms(query: str) -> List[str]:
+    """Words and quoted phrases of a $search string, minus negated ones, lower-cased"""
+    terms = []
+    for negated_phrase, phrase, negated, word in _TERM_RE.findall(query or ''):
+        if phrase and not negated_phrase:
+            terms.append(' '.join(phrase.lower().split()))
+        elif word and not negated:
+            terms.append(word.lower())
+    return list(dict.fromkeys(term for term in terms if term))
+
+
+def _stem(word: str) -> str:
+    """Crude suffix stripping, so 'sorting' also marks 'sorted' the way the server's stemmer matches it"""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def _terms_pattern(terms: Iterable[str]) -> Optional[re.Pattern]:
+    parts = []
+    for term in terms:
+        words = term.split()
+        if len(words) > 1:
+            parts.append(r'\s+'.join(re.escape(word) for word in words))
+        else:
+            parts.append(re.escape(_stem(term)) + r'\w*')
+    if not parts:
+        return None
+    return re.compile(r'\b(?:' + '|'.join(sorted(parts, key=len, reverse=True)) + r')', re.IGNORECASE)
+
+
+def highlight(text: str, terms: Iterable[str], width: int = SEARCH_SNIPPET_CHARS) -> Optional[str]:
+    """
+    About width characters of text around the first match of terms, HTML-escaped, with
+    every match wrapped in <mark>; None when no term occurs in text.
+    """
+    pattern = _terms_pattern(terms)
+    if not text or pattern is None:
+        return None
+    first = pattern.search(text)
+    if not first:
+        return None
+
+    start = max(0, first.start() - width // 3)
+    if start:
+        # Start on a word boundary rather than mid-word
+        space = text.find(' ', start, first.start())
+        start = space + 1 if space != -1 else start
+    end = min(len(text), max(start + width, first.end()))
+    if end < len(text):
+        space = text.rfind(' ', first.end(), end)
+        end = space if space != -1 else end
+    window = ' '.join(text[start:end].split())
+
+    parts, position = [], 0
+    for match in pattern.finditer(window):
+        parts.append(html.escape(window[position:match.start()]))
+        parts.append(f'<mark>{html.escape(match.group(0))}</mark>')
+        position = match.end()
+    parts.append(html.escape(window[position:]))
+    return ('…' if start else '') + ''.join(parts) + ('…' if end < len(text) else '')
+
+
+def encode_cursor(score: float, source: str, doc_id: ObjectId, position: int = 0) -> str:
+    """Opaque token for the position just after (score, source, doc_id) in a result list; position counts the results up to it"""
+    payload = {'s': score, 't': source, 'id': str(doc_id), 'n': position}
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str) -> Tuple[float, str, ObjectId, int]:
+    """Inverse of encode_cursor; raises ValidationError for tokens we did not issue"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        if payload['t'] not in SOURCES:
+            raise ValueError(payload['t'])
+        position = int(payload.get('n', 0))
+        if position < 0:
+            raise ValueError(position)
+        return float(payload['s']), payload['t'], ObjectId(payload['id']), position
+    except (binascii.Error, ValueError, TypeError, KeyError, InvalidId):
+        raise ValidationError('Invalid cursor')
+
+
+class SearchService:
+    """
+    Full-text search across SOURCES with one result list.
+
+    Each source is queried with $text against its weighted text index and sorted by
+    textScore; the per-source pages are merged into one order (score, then SOURCES
+    order, then newest id). Pages are keyset ranges after the cursor's position and
+    each source returns at most one page plus one row, but $text has to come first in
+    the pipeline, so every page still scores and sorts all of a source's matches: deep
+    pages cost as much as the first, and paging stops after SEARCH_MAX_RESULTS results.
+    Flashcards and submissions are only ever searched for their owner, which is the
+    equality prefix of their text indexes.
+    """
+
+    def search(self, user, query: str, sources: Optional[Iterable[str]] = None,
+               department: Optional[str] = None, cursor: Optional[str] = None,
+               limit: Optional[int] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        One page of matches for query, best first.
+
+        Args:
+            user: The searching user; flashcards and submissions are limited to theirs
+            query: $search string (words, "quoted phrases", -excluded words)
+            sources: Names from SOURCES to search (defaults to all)
+            department: Only resources of this department (and 'All Departments')
+            cursor: next_cursor from the previous page
+            limit: Requested page size
+
+        Returns:
+            (results, next_cursor); next_cursor is None on the last page, which is at the
+            latest the one ending at result SEARCH_MAX_RESULTS
+        """
+        query = (query or '').strip()
+        if not query:
+            raise ValidationError('Search query is required')
+        if len(query) > SEARCH_MAX_QUERY_CHARS:
+            raise ValidationError(f'Search query must be at most {SEARCH_MAX_QUERY_CHARS} characters')
+        sources = [source for source in SOURCES if sources is None or source in sources]
+        after = decode_cursor(cursor) if cursor else None
+        position = after[3] if after else 0
+        size = min(page_size(limit), SEARCH_MAX_RESULTS - position)
+        if size <= 0:
+            return [], None
+
+        rows = []
+        for source in sources:
+            scope = self._scope(source, user, department)
+            for doc in self._ranked(source, query, scope, self._after(source, after), size + 1):
+                rows.append((source, doc))
+
+        # Merge: score descending, then SOURCES order, then newest id (sorts are stable)
+        order = list(SOURCES)
+        rows.sort(key=lambda row: row[1]['_id'], reverse=True)
+        rows.sort(key=lambda row: (-row[1]['score'], order.index(row[0])))
+
+        terms = search_terms(query)
+        results = [self._result(source, doc, terms) for source, doc in rows[:size]]
+        if len(rows) <= size or position + size >= SEARCH_MAX_RESULTS:
+            return results, None
+        source, last = rows[size - 1]
+        return results, encode_cursor(last['score'], source, last['_id'], position + size)
+
+    def _scope(self, source: str, user, department: Optional[str]) -> Dict:
+        """Filter a source is searched with besides the text match"""
+        if source == 'resources':
+            return {'department': {'$in': [department, 'All Departments']}} if department else {}
+        return {'user_id': user.id}
+
+    def _after(self, source: str, after: Optional[Tuple[float, str, ObjectId, int]]) -> Optional[Dict]:
+        """Rows of source that come after the cursor position in the merged order"""
+        if after is None:
+            return None
+        score, cursor_source, doc_id, _ = after
+        order = list(SOURCES)
+        if order.index(source) < order.index(cursor_source):
+            return {'score': {'$lt': score}}
+        if order.index(source) > order.index(cursor_source):
+            return {'score': {'$lte': score}}
+        return {'$or': [{'score': {'$lt': score}}, {'score': score, '_id': {'$lt': doc_id}}]}
+
+    def _ranked(self, source: str, query: str, scope: Dict, after: Optional[Dict], limit: int) -> List[Dict]:
+        """Up to limit text matches of source as raw documents with their textScore, best first"""
+        from app import models
+
+        model_name, _, snippet_fields, summary_fields = SOURCES[source]
+        projection = {field: 1 for field in (*snippet_fields, *summary_fields)}
+        projection['score'] = {'$meta': 'textScore'}
+        pipeline = [
+            {'$match': {'$text': {'$search': query}, **scope}},
+            {'$project': projection},
+        ]
+        if after:
+            pipeline.append({'$match': after})
+        pipeline += [{'$sort': {'score': -1, '_id': -1}}, {'$limit': limit}]
+        return list(getattr(models, model_name)._get_collection().aggregate(pipeline))
+
+    def _result(self, source: str, doc: Dict, terms: List[str]) -> Dict:
+        _, title_field, snippet_fields, summary_fields = SOURCES[source]
+        result = {'id': str(doc['_id']), 'type': source[:-1], 'score': round(doc['score'], 4)}
+        for field in summary_fields:
+            value = doc.get(field)
+            if isinstance(value, ObjectId):
+                value = str(value)
+            elif hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            result[field] = value
+        result['title'] = doc.get(title_field)
+        result['snippet'] = next(
+            (snippet for snippet in (highlight(doc.get(field), terms) for field in snippet_fields) if snippet),
+            html.escape((doc.get(snippet_fields[0]) or '')[:SEARCH_SNIPPET_CHARS])
+        )
+        return result
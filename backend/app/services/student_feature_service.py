@@ -0,0 +1,278 @@
+"""
+Student Feature Service
+Per-student running aggregates behind performance predictions, kept current on every write
+"""
+import logging
+import math
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from pymongo import UpdateOne
+
+from app.utils.model_utils import ref_id
+
+logger = logging.getLogger(__name__)
+
+FEATURE_EPOCH = datetime(2020, 1, 1)  # Submission days are measured from here to keep trend sums small
+_REBUILD_BATCH = 500  # Students aggregated per backfill round trip
+_FIELDS = (
+    'submission_count', 'reviewed_count', 'score_sum', 'score_count',
+    'peer_score_sum', 'peer_score_count', 'trend_x_sum', 'trend_x_sq_sum', 'trend_xy_sum',
+)
+
+
+def _submission_day(created_at: Optional[datetime]) -> float:
+    if not created_at:
+        return 0.0
+    return (created_at - FEATURE_EPOCH).total_seconds() / 86400.0
+
+
+def _mean_score(scores: Optional[Dict]) -> Optional[float]:
+    values = [float(v) for v in (scores or {}).values() if isinstance(v, (int, float)) and not isinstance(v, bool)]
+    return sum(values) / len(values) if values else None
+
+
+def submission_feedback_rows(user_ids: List) -> Iterable[Dict]:
+    """
+    One round trip: the students' submissions with their feedback joined in.
+
+    The $lookup groups feedbacks per submission server-side (feedbacks are indexed
+    on submission_id), so only score dicts and feedback types cross the wire.
+    """
+    from app.models import Submission, Feedback
+
+    pipeline = [
+        {'$match': {'user_id': {'$in': user_ids}}},
+        {'$lookup': {
+            'from': Feedback._get_collection_name(),
+            'localField': '_id',
+            'foreignField': 'submission_id',
+            'as': 'feedback',
+        }},
+        {'$project': {
+            'user_id': 1,
+            'created_at': 1,
+            'feedback.scores': 1,
+            'feedback.feedback_type': 1,
+        }},
+    ]
+    return Submission.objects.aggregate(pipeline, allowDiskUse=True)
+
+
+class StudentFeatureService:
+    """Maintains one StudentFeatures document per student with atomic $inc updates"""
+
+    # ------------------------------------------------------------------
+    # Incremental updates
+    # ------------------------------------------------------------------
+
+    def feedback_increments(self, scores: Optional[Dict], feedback_type: str, submitted_at: Optional[datetime], sign: int = 1) -> Dict[str, float]:
+        """Field deltas contributed by one feedback; empty when it carries no scores"""
+        score = _mean_score(scores)
+        if score is None:
+            return {}
+        x = _submission_day(submitted_at)
+        increments = {
+            'score_sum': score,
+            'score_count': 1,
+            'trend_x_sum': x,
+            'trend_x_sq_sum': x * x,
+            'trend_xy_sum': x * score,
+        }
+        if feedback_type == 'peer':
+            increments['peer_score_sum'] = score
+            increments['peer_score_count'] = 1
+        return {field: sign * value for field, value in increments.items()}
+
+    def apply(self, user_id, increments: Dict[str, float]) -> None:
+        """
+        Atomically $inc a student's feature document.
+
+        A student without one (never written since the store was added) is rebuilt from
+        their submissions instead; the write that called us is already part of that.
+        """
+        from app.models import StudentFeatures
+
+        if not increments:
+            return
+        updates = {f'inc__{field}': value for field, value in increments.items()}
+        if not StudentFeatures.objects(user_id=user_id).update_one(set__updated_at=datetime.utcnow(), **updates):
+            self._rebuild_batch([user_id])
+
+    def connect_signals(self) -> None:
+        """Keep feature documents current on every Submission/Feedback save and delete"""
+        from mongoengine import signals
+        from app.models import Submission, Feedback
+
+        signals.post_save.connect(self._on_submission_saved, sender=Submission, weak=False)
+        signals.post_delete.connect(self._on_submission_deleted, sender=Submission, weak=False)
+        signals.post_save.connect(self._on_feedback_saved, sender=Feedback, weak=False)
+        signals.post_delete.connect(self._on_feedback_deleted, sender=Feedback, weak=False)
+
+    def _on_submission_saved(self, sender, document, created=False, **kwargs) -> None:
+        if not created:
+            return
+        try:
+            self.apply(ref_id(document._data.get('user_id')), {'submission_count': 1})
+        except Exception as e:
+            # Never fail the write itself; rebuild() repairs any drift
+            logger.warning(f"Failed to update student features for submission {document.id}: {e}")
+
+    def _on_submission_deleted(self, sender, document, **kwargs) -> None:
+        try:
+            self.apply(ref_id(document._data.get('user_id')), {'submission_count': -1})
+        except Exception as e:
+            logger.warning(f"Failed to update student features for submission {document.id}: {e}")
+
+    def _on_feedback_saved(self, sender, document, created=False, **kwargs) -> None:
+        # Feedback is only ever created or deleted (regeneration deletes and re-creates)
+        if not created:
+            return
+        self._record_feedback(document, sign=1)
+
+    def _on_feedback_deleted(self, sender, document, **kwargs) -> None:
+        self._record_feedback(document, sign=-1)
+
+    def _record_feedback(self, feedback, sign: int) -> None:
+        from app.models import Submission, Feedback
+
+        try:
+            submission_id = ref_id(feedback._data.get('submission_id'))
+            submission = Submission.objects(id=submission_id).only('user_id', 'created_at').as_pymongo().first()
+            if not submission:
+                return
+
+            increments = self.feedback_increments(feedback.scores, feedback.feedback_type, submission.get('created_at'), sign)
+            # The submission became reviewed (first feedback) or unreviewed (last one removed)
+            remaining = Feedback.objects(submission_id=submission_id).count()
+            if remaining == (1 if sign > 0 else 0):
+                increments['reviewed_count'] = sign
+            self.apply(submission['user_id'], increments)
+        except Exception as e:
+            logger.warning(f"Failed to update student features for feedback {feedback.id}: {e}")
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def feature_columns(self, students: List[Dict]) -> Dict[str, np.ndarray]:
+        """
+        Prediction features for many students from one read of their feature documents.
+
+        Students without a document are aggregated from their submissions and stored first.
+
+        Args:
+            students: Raw user documents (as_pymongo) with at least _id and skill_level
+
+        Returns:
+            Feature name -> array aligned with students
+        """
+        ids = [student['_id'] for student in students]
+        stored = self._stored(ids)
+        missing = [user_id for user_id in ids if user_id not in stored]
+        if missing:
+            # Students never seen by the store (e.g. right after upgrading): aggregate them once
+            for start in range(0, len(missing), _REBUILD_BATCH):
+                self._rebuild_batch(missing[start:start + _REBUILD_BATCH])
+            stored.update(self._stored(missing))
+        raw = np.zeros((len(_FIELDS), len(ids)))
+        for i, user_id in enumerate(ids):
+            doc = stored.get(user_id)
+            if doc:
+                raw[:, i] = [doc.get(field) or 0 for field in _FIELDS]
+
+        features = self.derive(dict(zip(_FIELDS, raw)))
+        features['skill_level'] = np.array(
+            [s['skill_level'] if s.get('skill_level') is not None else 0.5 for s in students], dtype=np.float64
+        )
+        return features
+
+    @staticmethod
+    def _stored(user_ids: List) -> Dict:
+        from app.models import StudentFeatures
+
+        return {
+            doc['user_id']: doc
+            for doc in StudentFeatures.objects(user_id__in=user_ids).exclude('id', 'updated_at').as_pymongo()
+        }
+
+    @staticmethod
+    def derive(sums: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Turn running sums into prediction features.
+
+        The improvement trend is the least-squares slope of score over submission day,
+        scaled by sqrt(3) times the spread of submission days. For evenly spaced
+        submissions that matches "mean of the later half minus mean of the earlier
+        half", and unlike a literal half split it can be kept current with $inc alone.
+        """
+        def ratio(a, b):
+            return np.divide(a, b, out=np.zeros_like(a, dtype=np.float64), where=b > 0)
+
+        count = sums['score_count']
+        avg_score = ratio(sums['score_sum'], count)
+        mean_x = ratio(sums['trend_x_sum'], count)
+        var_x = np.maximum(ratio(sums['trend_x_sq_sum'], count) - mean_x ** 2, 0.0)
+        cov = ratio(sums['trend_xy_sum'], count) - mean_x * avg_score
+        spread = np.sqrt(var_x)
+        has_trend = (count >= 2) & (spread > 1e-6)
+        improvement_trend = math.sqrt(3.0) * ratio(cov, np.where(has_trend, spread, 0.0))
+
+        return {
+            'submission_count': np.maximum(sums['submission_count'], 0),
+            'avg_score': avg_score,
+            'improvement_trend': improvement_trend,
+            'peer_feedback_quality': ratio(sums['peer_score_sum'], sums['peer_score_count']),
+            'completion_rate': np.clip(ratio(sums['reviewed_count'], sums['submission_count']), 0.0, 1.0),
+        }
+
+    # ------------------------------------------------------------------
+    # Backfill
+    # ------------------------------------------------------------------
+
+    def rebuild(self) -> int:
+        """
+        Recompute every user's feature document from submissions and feedback.
+
+        Runs one aggregation per batch of users and overwrites the stored sums, so it
+        also repairs drift from writes that bypassed the signals. Returns users written.
+        """
+        from app.models import User
+
+        user_ids = list(User.objects.scalar('id'))
+        for start in range(0, len(user_ids), _REBUILD_BATCH):
+            self._rebuild_batch(user_ids[start:start + _REBUILD_BATCH])
+        return len(user_ids)
+
+    def _rebuild_batch(self, user_ids: List) -> None:
+        from app.models import StudentFeatures
+
+        n = len(user_ids)
+        index = {user_id: i for i, user_id in enumerate(user_ids)}
+        sums = {field: np.zeros(n) for field in _FIELDS}
+
+        owners, deltas = [], []
+        for row in submission_feedback_rows(user_ids):
+            owner = index[row['user_id']]
+            owners.append(owner)
+            deltas.append({'submission_count': 1, 'reviewed_count': 1 if row.get('feedback') else 0})
+            for feedback in row.get('feedback', []):
+                owners.append(owner)
+                deltas.append(self.feedback_increments(feedback.get('scores'), feedback.get('feedback_type'), row.get('created_at')))
+
+        owners = np.array(owners, dtype=np.int64)
+        for field in _FIELDS:
+            weights = np.array([delta.get(field, 0) for delta in deltas], dtype=np.float64)
+            sums[field] = np.bincount(owners, weights=weights, minlength=n)
+
+        now = datetime.utcnow()
+        operations = []
+        for i, user_id in enumerate(user_ids):
+            values = {field: float(sums[field][i]) for field in _FIELDS}
+            for field in ('submission_count', 'reviewed_count', 'score_count', 'peer_score_count'):
+                values[field] = int(round(values[field]))
+            values['updated_at'] = now
+            operations.append(UpdateOne({'user_id': user_id}, {'$set': values}, upsert=True))
+        if operations:
+            StudentFeatures._get_collection().bulk_write(operations, ordered=False)
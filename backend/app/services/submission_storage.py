@@ -0,0 +1,125 @@
+"""
+Submission Storage
+Submission file bodies live in the blob store; Submission documents keep only file metadata
+"""
+import logging
+import os
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+def combine_files(files: List[Dict]) -> str:
+    """The combined text a multi-file submission is reviewed and fingerprinted as"""
+    return "\n\n".join([
+        f"=== FILE: {f.get('filename', 'unnamed')} ===\n{f.get('content', '')}"
+        for f in files
+    ])
+
+
+def store_submission_files(files_data: List[Dict]) -> List:
+    """Put each file body in the blob store and return metadata-only SubmissionFile entries"""
+    from app.models import SubmissionFile
+    from app.services import blob_store
+
+    submission_files = []
+    for file_data in files_data:
+        filename = file_data.get('filename', 'unnamed')
+        body = (file_data.get('content') or '').encode('utf-8')
+        submission_files.append(SubmissionFile(
+            filename=filename,
+            content_hash=blob_store.put(body, 'text/plain; charset=utf-8'),
+            size=len(body),
+            file_type=os.path.splitext(filename)[1][1:] if '.' in filename else ''
+        ))
+    return submission_files
+
+
+def submission_files_data(submission) -> List[Dict]:
+    """
+    A submission's files with their bodies, as the dicts AIService expects.
+
+    Bodies are fetched from the blob store on first use (one round trip for all files)
+    and remembered on the submission object for the rest of the request.
+    """
+    cached = getattr(submission, '_resolved_files', None)
+    if cached is not None:
+        return cached
+
+    from app.services import blob_store
+
+    files = submission.files or []
+    bodies = blob_store.get_many([f.content_hash for f in files if f.file_content is None and f.content_hash])
+    submission._resolved_files = _resolve(submission, bodies)
+    return submission._resolved_files
+
+
+def _resolve(submission, bodies: Dict[str, bytes]) -> List[Dict]:
+    resolved = []
+    for f in submission.files or []:
+        if f.file_content is not None:
+            content = f.file_content  # Not yet moved by migrate-submission-files
+        else:
+            body = bodies.get(f.content_hash)
+            if body is None:
+                logger.warning(f"Missing blob {f.content_hash} for {f.filename} in submission {submission.id}")
+            content = body.decode('utf-8', errors='replace') if body is not None else ''
+        resolved.append({'filename': f.filename, 'content': content, 'file_type': f.file_type})
+    return resolved
+
+
+def preload_files(submissions: List) -> None:
+    """Resolve the files of many submissions with a single blob store round trip"""
+    from app.services import blob_store
+
+    pending = [s for s in submissions if getattr(s, '_resolved_files', None) is None]
+    hashes = [
+        f.content_hash
+        for s in pending for f in (s.files or [])
+        if f.file_content is None and f.content_hash
+    ]
+    bodies = blob_store.get_many(hashes)
+    for s in pending:
+        s._resolved_files = _resolve(s, bodies)
+
+
+def submission_content(submission) -> str:
+    """Full text of a submission: its inline content, or its files combined"""
+    if submission.content:
+        return submission.content
+    cached = getattr(submission, '_resolved_content', None)
+    if cached is None:
+        cached = combine_files(submission_files_data(submission)) if submission.files else ''
+        submission._resolved_content = cached
+    return cached
+
+
+def migrate_inline_files() -> int:
+    """
+    Move embedded file bodies into the blob store.
+
+    Also drops Submission.content when it is just the files combined, which stored
+    every file twice. Returns the number of submissions rewritten.
+    """
+    from app.models import Submission
+    from app.services import blob_store
+
+    collection = Submission._get_collection()
+    migrated = 0
+    for son in collection.find({'files.file_content': {'$exists': True}}, {'files': 1, 'content': 1}):
+        files = son.get('files') or []
+        combined = combine_files([
+            {'filename': f.get('filename', 'unnamed'), 'content': f.get('file_content', '')} for f in files
+        ])
+        for f in files:
+            if 'file_content' in f:
+                body = (f.pop('file_content') or '').encode('utf-8')
+                f['content_hash'] = blob_store.put(body, 'text/plain; charset=utf-8')
+                f['size'] = len(body)
+
+        update = {'$set': {'files': files}}
+        if files and son.get('content') == combined:
+            update['$unset'] = {'content': ''}
+        collection.update_one({'_id': son['_id']}, update)
+        migrated += 1
+    return migrated
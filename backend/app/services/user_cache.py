@@ -0,0 +1,117 @@
+"""
+User Identity Cache
+In-process TTL/LRU cache behind the Flask-Login user loader
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.config import USER_CACHE_ENABLED, USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+# Never cached (and never loaded for current_user): legacy inline avatars not yet moved by migrate-avatars
+HEAVY_USER_FIELDS = ('avatar_url',)
+
+
+class UserIdentityCache:
+    """
+    Raw user documents keyed by id, rebuilt into a fresh User per request.
+
+    Saves and deletes of a User drop its entry and bump the version of any load in
+    flight for that user; a load that raced with the write sees the version change and
+    does not cache the stale document.
+    Other processes only see the change after ttl_seconds, so keep the TTL short.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = USER_CACHE_TTL_SECONDS,
+        max_entries: int = USER_CACHE_MAX_ENTRIES,
+        enabled: bool = USER_CACHE_ENABLED
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries = OrderedDict()  # user_id -> (son, expires_at)
+        self._loading: Dict[str, List[int]] = {}  # user_id -> [loads in flight, writes seen]; only while loading
+        self._lock = threading.Lock()
+
+    def load(self, user_id):
+        """Return the User for user_id without its heavy fields, or None"""
+        from app.models import User
+        from app.utils.model_utils import to_object_id
+
+        obj_id = to_object_id(user_id)
+        if not obj_id:
+            return None
+        key = str(obj_id)
+
+        if self.enabled:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry[1] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return User._from_son(dict(entry[0]), created=False)
+                if entry:
+                    del self._entries[key]
+                loading = self._loading.setdefault(key, [0, 0])
+                loading[0] += 1
+                version = loading[1]
+
+        son = None
+        try:
+            son = User._get_collection().find_one({'_id': obj_id}, {field: 0 for field in HEAVY_USER_FIELDS})
+        except Exception as e:
+            logger.warning(f"Failed to load user {key}: {e}")
+        finally:
+            if self.enabled:
+                self._remember(key, son, version)
+        if not son:
+            return None
+        return User._from_son(dict(son), created=False)
+
+    def invalidate(self, user_id) -> None:
+        """Drop a user's entry and reject in-flight loads that started before this call"""
+        key = str(user_id)
+        with self._lock:
+            self._entries.pop(key, None)
+            loading = self._loading.get(key)
+            if loading:
+                loading[1] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            for loading in self._loading.values():
+                loading[1] += 1
+
+    def connect_signals(self) -> None:
+        """Invalidate on every User save/delete (profile, avatar and department updates included)"""
+        from mongoengine import signals
+        from app.models import User
+
+        signals.post_save.connect(self._on_user_written, sender=User, weak=False)
+        signals.post_delete.connect(self._on_user_written, sender=User, weak=False)
+
+    def _on_user_written(self, sender, document, **kwargs) -> None:
+        if document.pk:
+            self.invalidate(document.pk)
+
+    def _remember(self, key: str, son: Optional[Dict], version: int) -> None:
+        """End a load of key, caching son unless the user was written to meanwhile"""
+        with self._lock:
+            loading = self._loading[key]
+            loading[0] -= 1
+            if not loading[0]:
+                del self._loading[key]
+            if not son or self.max_entries <= 0:
+                return
+            if loading[1] != version:
+                return  # Written to while we were reading; the document may be stale
+            self._entries[key] = (son, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
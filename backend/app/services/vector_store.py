@@ -0,0 +1,305 @@
+"""
+Vector Store
+Compact on-disk float16 vectors keyed by document id, memory-mapped with NumPy
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ID_DTYPE = '<U24'  # str(ObjectId)
+DIGEST_DTYPE = 'S16'  # Hex prefix of the embedded text's hash
+MIN_CAPACITY = 1024
+SEARCH_CHUNK_ROWS = 65536
+OPEN_ATTEMPTS = 3  # A reader retries when the generation it was opening is pruned under it
+
+
+# ----------------------------------------------------------------------
+# Generations: files that must be read together live in one gen-NNNNNN directory, and
+# meta.json (replaced atomically) names the generation readers should open
+# ----------------------------------------------------------------------
+
+def generation_dir(directory: str, generation: int) -> str:
+    return os.path.join(directory, f'gen-{generation:06d}')
+
+
+def meta_stamp(directory: str) -> Optional[Tuple]:
+    """Identity of the published meta.json (None before the first publish)"""
+    try:
+        stat = os.stat(os.path.join(directory, 'meta.json'))
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def read_meta(directory: str) -> Dict:
+    with open(os.path.join(directory, 'meta.json')) as f:
+        return json.load(f)
+
+
+def publish_meta(directory: str, meta: Dict) -> Tuple:
+    """Point readers at meta (and the generation it names) with one atomic rename; returns the new stamp"""
+    tmp = os.path.join(directory, 'meta.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(directory, 'meta.json'))
+    return meta_stamp(directory)
+
+
+def prune_generations(directory: str, current: int) -> None:
+    """
+    Delete generations older than the previous one. The previous one is kept for readers that
+    read the old meta.json just before it was replaced; files already mapped stay readable anyway.
+    """
+    for name in os.listdir(directory):
+        if name.startswith('gen-') and name[4:].isdigit() and int(name[4:]) < current - 1:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+class VectorStore:
+    """
+    Rows of a float16 matrix in vectors.npy, with each row's document id in ids.npy and a digest
+    of the text it was computed from in digests.npy, all in the generation directory named by
+    meta.json (which also holds dim, model and the number of rows in use).
+
+    One process writes (the embedding worker); every other process maps the files read-only and
+    picks up new rows when meta.json changes. Updates overwrite their row in place, removals
+    blank it, and new rows go past the published count, so readers never see a half-written
+    row as live. Growing or compacting writes all three files into a new generation that is
+    published with one rename of meta.json, so readers never mix files of two generations.
+    Vectors are unit length, so a dot product is the cosine similarity.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.dim: Optional[int] = None
+        self.model: Optional[str] = None
+        self.count = 0  # Rows in use, blanks included
+        self.generation = 0
+        self._vectors = None
+        self._ids = None
+        self._digests = None
+        self._rows: Dict[str, int] = {}
+        self._meta_stamp = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._rows)
+
+    def __contains__(self, doc_id) -> bool:
+        self.refresh()
+        return str(doc_id) in self._rows
+
+    def _path(self, name: str) -> str:
+        return os.path.join(generation_dir(self.directory, self.generation), name)
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def refresh(self) -> None:
+        """Re-open the files if meta.json changed since they were last mapped (cheap when it did not)"""
+        stamp = meta_stamp(self.directory)
+        if stamp is None or stamp == self._meta_stamp:
+            return
+        with self._lock:
+            for attempt in range(OPEN_ATTEMPTS):
+                stamp = meta_stamp(self.directory)
+                try:
+                    meta = read_meta(self.directory)
+                    files = generation_dir(self.directory, meta['generation'])
+                    vectors = np.load(os.path.join(files, 'vectors.npy'), mmap_mode='r')
+                    ids = np.load(os.path.join(files, 'ids.npy'), mmap_mode='r')
+                    digests = np.load(os.path.join(files, 'digests.npy'), mmap_mode='r')
+                    break
+                except FileNotFoundError:
+                    if attempt == OPEN_ATTEMPTS - 1:
+                        raise
+            self.dim, self.model, self.count = meta['dim'], meta.get('model'), meta['count']
+            self.generation = meta['generation']
+            self._vectors, self._ids, self._digests = vectors, ids, digests
+            self._rows = {str(doc_id): row for row, doc_id in enumerate(self._ids[:self.count]) if doc_id}
+            self._meta_stamp = stamp
+
+    def digests(self, doc_ids: Iterable) -> Dict[str, bytes]:
+        """Text digest recorded with each stored vector, for ids that have one"""
+        self.refresh()
+        return {
+            str(doc_id): bytes(self._digests[self._rows[str(doc_id)]])
+            for doc_id in doc_ids if str(doc_id) in self._rows
+        }
+
+    def get(self, doc_ids: Iterable) -> Tuple[List[str], np.ndarray]:
+        """(ids found, float32 matrix with one row per found id)"""
+        self.refresh()
+        found = [str(doc_id) for doc_id in doc_ids if str(doc_id) in self._rows]
+        if not found:
+            return [], np.zeros((0, self.dim or 0), dtype=np.float32)
+        return found, np.asarray(self._vectors[[self._rows[doc_id] for doc_id in found]], dtype=np.float32)
+
+    def matrix(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids, float16 vectors) of every stored row, for building indexes"""
+        self.refresh()
+        if not self.count:
+            return np.zeros(0, dtype=ID_DTYPE), np.zeros((0, self.dim or 0), dtype=np.float16)
+        live = np.flatnonzero(self._ids[:self.count] != '')
+        return np.asarray(self._ids[live]), np.asarray(self._vectors[live])
+
+    def search(self, query: np.ndarray, k: int = 10, doc_ids: Optional[Iterable] = None) -> List[Tuple[str, float]]:
+        """
+        Exact top-k by cosine similarity, best first.
+
+        Scans the whole store in chunks, or only doc_ids when given.
+        """
+        self.refresh()
+        if not self.count or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        if doc_ids is not None:
+            ids, vectors = self.get(doc_ids)
+            return top_k(np.asarray(ids), vectors @ query, k)
+
+        best_ids, best_scores = [], []
+        for start in range(0, self.count, SEARCH_CHUNK_ROWS):
+            ids = self._ids[start:start + SEARCH_CHUNK_ROWS]
+            live = ids != ''
+            scores = np.asarray(self._vectors[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32) @ query
+            for doc_id, score in top_k(np.asarray(ids[live]), scores[live], k):
+                best_ids.append(doc_id)
+                best_scores.append(score)
+        return top_k(np.asarray(best_ids), np.asarray(best_scores), k)
+
+    # ------------------------------------------------------------------
+    # Writing (single writer process)
+    # ------------------------------------------------------------------
+
+    def upsert(self, doc_ids: Sequence, vectors: np.ndarray, digests: Optional[Sequence[bytes]] = None,
+               model: Optional[str] = None) -> None:
+        """Store vectors for doc_ids, overwriting any they already have"""
+        vectors = np.asarray(vectors, dtype=np.float16)
+        if not len(doc_ids):
+            return
+        with self._lock:
+            self.refresh()
+            if self.dim is None:
+                self._create(vectors.shape[1], model)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f'Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}')
+
+            doc_ids = [str(doc_id) for doc_id in doc_ids]
+            new_ids = [doc_id for doc_id in dict.fromkeys(doc_ids) if doc_id not in self._rows]
+            self._reserve(self.count + len(new_ids))
+            for doc_id in new_ids:
+                self._rows[doc_id] = self.count
+                self.count += 1
+
+            rows = [self._rows[doc_id] for doc_id in doc_ids]
+            with self._writable() as (vector_map, id_map, digest_map):
+                vector_map[rows] = vectors
+                id_map[rows] = doc_ids
+                digest_map[rows] = list(digests) if digests is not None else b''
+            self._write_meta()
+
+    def remove(self, doc_ids: Iterable) -> int:
+        """Blank the rows of doc_ids; returns how many were stored"""
+        with self._lock:
+            self.refresh()
+            rows = [self._rows.pop(str(doc_id)) for doc_id in doc_ids if str(doc_id) in self._rows]
+            if rows:
+                with self._writable() as (vector_map, id_map, digest_map):
+                    vector_map[rows] = 0
+                    id_map[rows] = ''
+                    digest_map[rows] = b''
+                self._write_meta()
+            return len(rows)
+
+    def compact(self) -> int:
+        """Rewrite the files without blank rows; returns the number of rows reclaimed"""
+        with self._lock:
+            self.refresh()
+            if self.dim is None:
+                return 0
+            live = np.flatnonzero(self._ids[:self.count] != '')
+            reclaimed = self.count - len(live)
+            if reclaimed:
+                arrays = {
+                    'vectors.npy': self._vectors[live],
+                    'ids.npy': self._ids[live],
+                    'digests.npy': self._digests[live],
+                }
+                self._rows = {str(doc_id): row for row, doc_id in enumerate(arrays['ids.npy'])}
+                self._replace_files(arrays, max(MIN_CAPACITY, len(live)), len(live))
+            return reclaimed
+
+    def _create(self, dim: int, model: Optional[str]) -> None:
+        self.dim, self.model, self._rows = dim, model, {}
+        empty = {
+            'vectors.npy': np.zeros((0, dim), dtype=np.float16),
+            'ids.npy': np.zeros(0, dtype=ID_DTYPE),
+            'digests.npy': np.zeros(0, dtype=DIGEST_DTYPE),
+        }
+        self._replace_files(empty, MIN_CAPACITY, 0)
+
+    def _reserve(self, rows: int) -> None:
+        """Grow the files (doubling) so they hold at least rows rows"""
+        capacity = len(self._ids) if self._ids is not None else 0
+        if rows <= capacity:
+            return
+        self._replace_files({
+            'vectors.npy': self._vectors[:self.count],
+            'ids.npy': self._ids[:self.count],
+            'digests.npy': self._digests[:self.count],
+        }, max(MIN_CAPACITY, capacity * 2, rows), self.count)
+
+    def _replace_files(self, arrays: Dict[str, np.ndarray], capacity: int, count: int) -> None:
+        """Write the arrays (padded to capacity rows) as a new generation of count rows and publish it"""
+        generation = self.generation + 1
+        files = generation_dir(self.directory, generation)
+        os.makedirs(files, exist_ok=True)
+        for name, data in arrays.items():
+            shape = (capacity,) + tuple(data.shape[1:])
+            target = np.lib.format.open_memmap(os.path.join(files, name), mode='w+', dtype=data.dtype, shape=shape)
+            target[:len(data)] = data
+            target.flush()
+            del target
+        self.generation, self.count = generation, count
+        self._write_meta()
+        # Readers that still map the old generation keep a consistent (if stale) view until they refresh
+        self._vectors = np.load(self._path('vectors.npy'), mmap_mode='r')
+        self._ids = np.load(self._path('ids.npy'), mmap_mode='r')
+        self._digests = np.load(self._path('digests.npy'), mmap_mode='r')
+        prune_generations(self.directory, generation)
+
+    @contextmanager
+    def _writable(self):
+        """Read-write maps of the three files, flushed when the with block exits"""
+        maps = tuple(np.load(self._path(name), mmap_mode='r+') for name in ('vectors.npy', 'ids.npy', 'digests.npy'))
+        try:
+            yield maps
+        finally:
+            for array in maps:
+                array.flush()
+
+    def _write_meta(self) -> None:
+        self._meta_stamp = publish_meta(self.directory, {
+            'dim': self.dim, 'model': self.model, 'count': self.count, 'generation': self.generation,
+        })
+
+
+def top_k(ids: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[str, float]]:
+    """The k highest scores, best first, as (id, score) pairs"""
+    if not len(scores):
+        return []
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k - 1)[:k]
+        ids, scores = ids[keep], scores[keep]
+    order = np.argsort(-scores, kind='stable')
+    return [(str(ids[i]), float(scores[i])) for i in order]
@@ -14,9 +14,9 @@ def is_metropolia_email(email):
     return normalize_email(email).endswith(ALLOWED_EMAIL_DOMAIN)
 
 def load_user(user_id):
-    """Load user by ID for Flask-Login"""
-    from app.utils.model_utils import get_user_by_id
-    return get_user_by_id(user_id)
+    """Load user by ID for Flask-Login (cached, without heavy fields such as avatar_url)"""
+    from app.services import user_cache
+    return user_cache.load(user_id)
 
 def hash_password(password: str) -> str:
     """
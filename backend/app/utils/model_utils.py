@@ -17,6 +17,11 @@ def to_object_id(value: Union[str, ObjectId]) -> Optional[ObjectId]:
     return None
 
 
+def ref_id(value):
+    """ObjectId behind a reference field value (Document, DBRef or ObjectId) without dereferencing"""
+    return getattr(value, 'id', value)
+
+
 def get_user_by_id(user_id: Union[str, ObjectId]) -> Optional[User]:
     """Get user by ID with proper error handling"""
     obj_id = to_object_id(user_id)
@@ -0,0 +1,79 @@
+"""Keyset (cursor) pagination for list endpoints"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from mongoengine.queryset.visitor import Q
+
+from app.config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.exceptions.api_exceptions import ValidationError
+
+
+def encode_cursor(value: Optional[datetime], doc_id: ObjectId) -> str:
+    """Opaque token for the position just after (value, doc_id)"""
+    payload = {'t': value.isoformat() if value else None, 'id': str(doc_id)}
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str) -> Tuple[Optional[datetime], ObjectId]:
+    """Inverse of encode_cursor; raises ValidationError for tokens we did not issue"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        value = datetime.fromisoformat(payload['t']) if payload['t'] else None
+        return value, ObjectId(payload['id'])
+    except (binascii.Error, ValueError, TypeError, KeyError, InvalidId):
+        raise ValidationError('Invalid cursor')
+
+
+def page_size(limit: Optional[int], default: int = DEFAULT_PAGE_SIZE) -> int:
+    """Requested page size (default when absent) clamped to 1..MAX_PAGE_SIZE, or to default if larger"""
+    if not limit:
+        return default
+    return max(1, min(int(limit), max(MAX_PAGE_SIZE, default)))
+
+
+def paginate(queryset, cursor: Optional[str] = None, limit: Optional[int] = None,
+             field: str = 'created_at', default_limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[Any], Optional[str]]:
+    """
+    One page of queryset, newest first, ordered by (field, _id).
+
+    Each page is a range query starting after the cursor, so it is served from a
+    (..., -field, -_id) index at the same cost however deep it is. Documents without
+    `field` (legacy rows) come last.
+
+    Args:
+        queryset: Filtered MongoEngine queryset (its own ordering is replaced)
+        cursor: next_cursor from the previous page, or None for the first page
+        limit: Requested page size
+        field: Date field to order by
+        default_limit: Page size without ?limit=; endpoints whose clients do not follow
+            next_cursor keep the size they returned before pagination
+
+    Returns:
+        (items, next_cursor); next_cursor is None on the last page
+    """
+    size = page_size(limit, default_limit)
+    if cursor:
+        value, doc_id = decode_cursor(cursor)
+        if value is None:
+            after = Q(**{field: None, 'id__lt': doc_id})
+        else:
+            after = (
+                Q(**{f'{field}__lt': value})
+                | Q(**{field: value, 'id__lt': doc_id})
+                | Q(**{field: None})
+            )
+        queryset = queryset.filter(after)
+
+    items = list(queryset.order_by(f'-{field}', '-id').limit(size + 1))
+    if len(items) <= size:
+        return items, None
+    items = items[:size]
+    last = items[-1]
+    return items, encode_cursor(getattr(last, field), last.id)
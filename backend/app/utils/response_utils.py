@@ -1,6 +1,6 @@
 """Response utility functions"""
 from flask import jsonify
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 
 def success_response(data: Any = None, message: Optional[str] = None) -> Dict:
@@ -16,6 +16,16 @@ def success_response(data: Any = None, message: Optional[str] = None) -> Dict:
     return jsonify(response)
 
 
+def paginated_response(items: List[Any], next_cursor: Optional[str]) -> Dict:
+    """Success response for one page of a cursor-paginated list"""
+    return jsonify({
+        'success': True,
+        'data': items,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+    })
+
+
 def error_response(message: str, status_code: int = 400, errors: Optional[Dict] = None) -> tuple:
     """Create a standardized error response"""
     response = {'success': False, 'error': message}
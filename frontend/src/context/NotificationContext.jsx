@@ -20,10 +20,6 @@ export const NotificationProvider = ({ children }) => {
   const currentReconnectDelayRef = useRef(INITIAL_RECONNECT_DELAY_MS)
   const backendAvailableRef = useRef(false)
 
-  const syncUnreadCount = (list) => {
-    setUnreadCount(list.filter((n) => !n.is_read).length)
-  }
-
   const closeEventSource = () => {
     if (eventSourceRef.current) {
       eventSourceRef.current.close()
@@ -42,10 +38,14 @@ export const NotificationProvider = ({ children }) => {
 
   const loadNotifications = async () => {
     try {
-      const data = await api.get('/v1/notifications')
+      const [data, counts] = await Promise.all([
+        api.get('/v1/notifications'),
+        api.get('/v1/notifications/unread-count'),
+      ])
       const normalized = Array.isArray(data) ? data : data?.data || []
       setNotifications(normalized)
-      syncUnreadCount(normalized)
+      // The list is only the newest page; the server-side counter covers everything
+      setUnreadCount(counts?.unread_count ?? normalized.filter((n) => !n.is_read).length)
       backendAvailableRef.current = true
       resetReconnectState()
       return true
@@ -110,6 +110,11 @@ export const NotificationProvider = ({ children }) => {
         }
       })
 
+      source.addEventListener('resync', () => {
+        // The server dropped pushes for this connection; reload the list instead
+        loadNotifications()
+      })
+
       source.addEventListener('error', () => {
         setConnectionStatus('disconnected')
         closeEventSource()
@@ -1,7 +1,7 @@
 /**
  * Submissions feature API calls
  */
-import api from '../../services/api';
+import api, { API_URL } from '../../services/api';
 
 export const submitAssignment = (submissionData) => {
   return api.post('/v1/submit', submissionData);
@@ -19,6 +19,51 @@ export const generateFeedback = (submissionId) => {
   return api.post('/v1/generate-feedback', { submission_id: submissionId });
 };
 
+/**
+ * Stream AI feedback over Server-Sent Events.
+ * Calls onChunk with each formatted text chunk and resolves with the final 'done' payload.
+ */
+export const streamFeedback = async (submissionId, onChunk) => {
+  const response = await fetch(`${API_URL}/v1/generate-feedback/stream`, {
+    method: 'POST',
+    credentials: 'include',
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+    body: JSON.stringify({ submission_id: submissionId }),
+  });
+  if (!response.ok || !response.body) {
+    const data = await response.json().catch(() => ({}));
+    throw { status: response.status, error: data.error || 'Error generating feedback' };
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const message = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      const event = (message.match(/^event: (.*)$/m) || [])[1];
+      const data = (message.match(/^data: (.*)$/m) || [])[1];
+      if (!event || !data) continue;
+      const payload = JSON.parse(data);
+      if (event === 'chunk') onChunk(payload.text);
+      else if (event === 'done') return payload;
+      else if (event === 'error') throw { error: payload.error };
+    }
+  }
+  throw { error: 'Feedback stream ended unexpectedly' };
+};
+
+export const getFeedbackJob = (jobId) => {
+  return api.get(`/v1/jobs/${jobId}`);
+};
+
 export const getPeerReviews = () => {
   return api.get('/v1/peer-reviews');
 };
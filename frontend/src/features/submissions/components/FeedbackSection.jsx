@@ -2,6 +2,21 @@ import React, { useState, useEffect } from 'react'
 import api from '../../../services/api'
 import FeedbackVisualization from './FeedbackVisualization'
 import FeedbackReactions from './FeedbackReactions'
+import { streamFeedback } from '../api'
+
+const JOB_POLL_INTERVAL_MS = 2000
+const JOB_POLL_TIMEOUT_MS = 120000
+
+// Feedback generation runs in a background job; wait until it finishes
+const waitForJob = async (jobId) => {
+  const deadline = Date.now() + JOB_POLL_TIMEOUT_MS
+  while (Date.now() < deadline) {
+    const { job } = await api.get(`/v1/jobs/${jobId}`)
+    if (job.status === 'completed' || job.status === 'failed') return job
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS))
+  }
+  return null
+}
 
 const FeedbackSection = ({ submissions, onRefresh }) => {
   // Handle missing props
@@ -19,6 +34,7 @@ const FeedbackSection = ({ submissions, onRefresh }) => {
   const [submissionDetails, setSubmissionDetails] = useState(null)
   const [loading, setLoading] = useState(false)
   const [generating, setGenerating] = useState(false)
+  const [streamingText, setStreamingText] = useState('')
   const [error, setError] = useState('')
 
   // Load submission details when selection changes
@@ -49,6 +65,25 @@ const FeedbackSection = ({ submissions, onRefresh }) => {
 
     setGenerating(true)
     setError('')
+    setStreamingText('')
+
+    try {
+      // Prefer streaming so feedback appears as it is written
+      await streamFeedback(selectedSubmissionId, (text) => setStreamingText((prev) => prev + text))
+      setGenerating(false)
+      await loadSubmissionDetails(selectedSubmissionId)
+      onRefresh()
+      return
+    } catch (err) {
+      if (err.status === 429 || err.status === 403) {
+        setError(err.error || 'Error generating feedback')
+        setGenerating(false)
+        return
+      }
+      // Fall back to the queued job flow below
+    } finally {
+      setStreamingText('')
+    }
 
     try {
       const response = await api.post('/v1/generate-feedback', {
@@ -57,6 +92,14 @@ const FeedbackSection = ({ submissions, onRefresh }) => {
       })
 
       if (response.success) {
+        if (response.job_id) {
+          const job = await waitForJob(response.job_id)
+          if (!job) {
+            setError('Feedback is still being generated. Check back shortly.')
+          } else if (job.status === 'failed') {
+            setError(job.error || 'Error generating feedback')
+          }
+        }
         // Reload submission details to show new feedback
         await loadSubmissionDetails(selectedSubmissionId)
         onRefresh()
@@ -129,6 +172,12 @@ const FeedbackSection = ({ submissions, onRefresh }) => {
             </div>
           )}
 
+          {generating && streamingText && (
+            <div className="card" style={{ marginTop: '1rem', background: 'var(--bg-color)' }}>
+              {formatFeedbackText(streamingText)}
+            </div>
+          )}
+
           {loading && selectedSubmissionId && (
             <div style={{ textAlign: 'center', padding: '2rem' }}>
               <div className="spinner"></div>
@@ -352,6 +352,7 @@ const SubmissionDetailModal = ({ submissionId, onClose, onRefresh }) => {
     setCheckingPlagiarism(true)
     try {
       const result = await api.post('/v1/plagiarism-check', {
+        submission_id: submission.submission.id,
         content: submission.submission.content
       })
       setPlagiarismResult(result)
@@ -454,6 +455,13 @@ const SubmissionDetailModal = ({ submissionId, onClose, onRefresh }) => {
             {plagiarismResult.matches && plagiarismResult.matches.length > 0 && (
               <div style={{ marginTop: '0.5rem', fontSize: '0.9rem' }}>
                 Found {plagiarismResult.matches.length} potential matches
+                <ul style={{ margin: '0.5rem 0 0 1.25rem' }}>
+                  {plagiarismResult.matches.map((match) => (
+                    <li key={match.submission_id}>
+                      {match.user_name || 'Unknown'} - {match.assignment_title}: {(match.similarity * 100).toFixed(1)}%
+                    </li>
+                  ))}
+                </ul>
               </div>
             )}
           </div>
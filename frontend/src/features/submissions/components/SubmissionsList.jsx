@@ -16,7 +16,7 @@ const SubmissionsList = ({ submissions, onRefresh }) => {
     const matchesSearch =
       !searchTerm ||
       (sub.title && sub.title.toLowerCase().includes(searchTerm.toLowerCase())) ||
-      (sub.content && sub.content.toLowerCase().includes(searchTerm.toLowerCase()))
+      (sub.user_name && sub.user_name.toLowerCase().includes(searchTerm.toLowerCase()))
     const matchesFilter =
       filterType === 'all' || formatLabel(sub.type || 'other').toLowerCase() === formatLabel(filterType).toLowerCase()
     return matchesSearch && matchesFilter
@@ -62,6 +62,7 @@ const Submissions = () => {
 
       // For teachers, filter by department. For students, get their own submissions
       // Use the role variable instead of userRole state to avoid race condition
+      // The list carries no submission text; the detail view fetches it per submission
       const params = role === 'teacher' && currentDepartment ? { department: currentDepartment } : {}
       const submissionsResponse = await api.get('/v1/submissions', { params })
       const submissionsData = normalizeToArray(submissionsResponse)
@@ -2,7 +2,7 @@ import axios from 'axios'
 
 // Get API URL from environment variable or use relative path for same-domain
 // In production, this should be set to the backend URL
-const API_URL = import.meta.env.VITE_API_URL || import.meta.env.REACT_APP_API_URL || '/api'
+export const API_URL = import.meta.env.VITE_API_URL || import.meta.env.REACT_APP_API_URL || '/api'
 
 const api = axios.create({
   baseURL: API_URL,
@@ -1,10 +1,13 @@
 """
 Comprehensive tests for API endpoints
 """
+import io
+import sys
 import pytest
 import json
+import numpy as np
 from bson import ObjectId
-from app.models import Course, Submission, Feedback, PeerReview, User
+from app.models import Course, Submission, Feedback, PeerReview, User, Flashcard
 
 
 class TestPeerReviews:
@@ -337,6 +340,251 @@ class TestFlashcards:
             data = json.loads(response.data)
             assert data.get('success', True) is True
 
+    def test_bulk_import_skips_duplicates(self, authenticated_client, test_user):
+        """Test importing a CSV deck skips cards the user already has"""
+        response = authenticated_client.post('/api/v1/flashcards', json={
+            'front': 'What is Python?',
+            'back': 'A programming language'
+        })
+        assert response.status_code == 200
+
+        deck = (
+            'front,back,category\n'
+            'what is  python,A snake,biology\n'
+            'What is Flask?,A web framework,\n'
+            'WHAT IS FLASK,Repeated in the same deck,\n'
+            'Missing back,,\n'
+        )
+        response = authenticated_client.post('/api/v1/flashcards/bulk', data={
+            'file': (io.BytesIO(deck.encode('utf-8')), 'deck.csv'),
+            'category': 'web',
+        }, content_type='multipart/form-data')
+        assert response.status_code == 200
+        result = json.loads(response.data)
+        assert result['created'] == 1
+        assert result['duplicates'] == 2
+        assert result['invalid'] == 1
+
+        response = authenticated_client.post('/api/v1/flashcards/bulk', json={'cards': [
+            {'front': 'What is Flask?', 'back': 'Again'},
+            {'front': 'What is Django?', 'back': 'Another web framework'},
+        ]})
+        assert json.loads(response.data)['created'] == 1
+
+        with authenticated_client.application.app_context():
+            cards = Flashcard.objects(user_id=ObjectId(test_user))
+            assert cards.count() == 3
+            assert cards.filter(front='What is Flask?').first().category == 'web'
+
+    def test_bulk_import_matches_legacy_cards_and_limits_json(self, authenticated_client, test_user, monkeypatch):
+        """Cards saved before front_hash existed still count as duplicates; oversized JSON decks are rejected"""
+        import app.api.v1.flashcards as flashcard_routes
+        with authenticated_client.application.app_context():
+            Flashcard._get_collection().insert_one({
+                'user_id': ObjectId(test_user), 'front': 'Legacy term', 'back': 'Old', 'category': 'general'
+            })
+
+        response = authenticated_client.post('/api/v1/flashcards/bulk', json={'cards': [
+            {'front': 'legacy term?', 'back': 'Again'},
+        ]})
+        result = json.loads(response.data)
+        assert result['created'] == 0 and result['duplicates'] == 1
+
+        monkeypatch.setattr(flashcard_routes, 'FLASHCARD_IMPORT_MAX_JSON_BYTES', 64)
+        deck = json.dumps([{'front': f'Term {i}', 'back': 'Definition'} for i in range(10)])
+        response = authenticated_client.post('/api/v1/flashcards/bulk', data={
+            'file': (io.BytesIO(deck.encode('utf-8')), 'deck.json'),
+        }, content_type='multipart/form-data')
+        assert response.status_code == 400
+        assert '.jsonl' in json.loads(response.data)['error']
+        response = authenticated_client.post('/api/v1/flashcards/bulk', json={'cards': json.loads(deck)})
+        assert response.status_code == 400
+
+    def test_due_queue_follows_reviews(self, authenticated_client, test_user):
+        """Test reviewed cards leave the due queue until their SM-2 interval passes"""
+        ids = []
+        for front in ('Term A', 'Term B', 'Term C'):
+            response = authenticated_client.post('/api/v1/flashcards', json={'front': front, 'back': 'Definition'})
+            ids.append(json.loads(response.data)['id'])
+
+        response = authenticated_client.get('/api/v1/flashcards/due?limit=2')
+        assert response.status_code == 200
+        assert len(json.loads(response.data)['data']) == 2
+
+        response = authenticated_client.post(f'/api/v1/flashcard/{ids[0]}/review', json={'quality': 5})
+        assert response.status_code == 200
+        result = json.loads(response.data)
+        assert result['interval'] == 1
+        assert result['ease'] > 2.5
+
+        response = authenticated_client.post(f'/api/v1/flashcard/{ids[1]}/review', json={'correct': False})
+        assert json.loads(response.data)['ease'] < 2.5
+
+        response = authenticated_client.post(f'/api/v1/flashcard/{ids[2]}/review', json={'quality': 9})
+        assert response.status_code == 400
+
+        response = authenticated_client.get('/api/v1/flashcards/due')
+        due = [card['id'] for card in json.loads(response.data)['data']]
+        assert due == [ids[2]]
+
+    def test_verify_answer_tiers(self, authenticated_client, tmp_path, monkeypatch):
+        """Test exact matches and clear misses are graded locally and everything else reaches Gemini"""
+        from app.services import embedding_service
+        from app.services.ai_service import ai_service
+
+        vectors = {
+            'Powerhouse of the cell': [1.0, 0.0],
+            'It makes energy for the cell': [0.9, 0.43589],
+            'Not the powerhouse of the cell': [0.97, 0.24310],  # Negation: embeds almost like the answer
+            'Something about plants': [0.6, 0.8],
+            'A kind of rock': [0.0, 1.0],
+            '1945': [0.0, 1.0],
+            '1946': [0.0, 1.0],  # Near-miss number: same vector as the answer
+        }
+        encoded = []
+
+        def fake_encode(texts):
+            encoded.append(list(texts))
+            return np.array([vectors[t] for t in texts], dtype=np.float32)
+
+        monkeypatch.setattr(ai_service, 'encode', fake_encode)
+        monkeypatch.setattr(embedding_service, 'enabled', True)
+        monkeypatch.setattr(embedding_service, 'store_dir', str(tmp_path))
+        monkeypatch.setattr(embedding_service, '_stores', {})
+        monkeypatch.setattr(embedding_service, '_indexes', {})
+        ai_calls = []
+
+        def fake_verify(correct_answer, user_answer, question):
+            ai_calls.append(user_answer)
+            return {'is_correct': False, 'confidence': 0.6, 'similarity_score': 0.6, 'feedback': 'Partly right'}
+
+        monkeypatch.setattr(ai_service, 'verify_flashcard_answer', fake_verify)
+
+        response = authenticated_client.post('/api/v1/flashcards', json={
+            'front': 'Mitochondria', 'back': 'Powerhouse of the cell'
+        })
+        card_id = json.loads(response.data)['id']
+        assert encoded == []  # Creating a card does not embed it
+
+        def verify(answer, card_id=card_id):
+            response = authenticated_client.post(f'/api/v1/flashcard/{card_id}/verify-answer', json={'answer': answer})
+            assert response.status_code == 200
+            return json.loads(response.data)
+
+        result = verify('the powerhouse of the cell!')
+        assert result['is_correct'] is True and result['method'] == 'exact'
+        # Not in the embedding store yet: the back is encoded alongside the answer
+        result = verify('A kind of rock')
+        assert result['is_correct'] is False and result['method'] == 'embedding'
+        assert encoded == [['Powerhouse of the cell', 'A kind of rock']]
+
+        with authenticated_client.application.app_context():
+            assert embedding_service.run_pending() == 1
+        assert encoded[1:] == [['Powerhouse of the cell']]
+        del encoded[:]
+        for answer in ('It makes energy for the cell', 'Not the powerhouse of the cell', 'Something about plants'):
+            assert verify(answer)['method'] == 'ai'
+        assert ai_calls == ['It makes energy for the cell', 'Not the powerhouse of the cell', 'Something about plants']
+        assert encoded == [[answer] for answer in ai_calls]  # The stored vector of the back is reused
+
+        response = authenticated_client.post('/api/v1/flashcards', json={'front': 'End of WWII', 'back': '1945'})
+        assert verify('1946', json.loads(response.data)['id'])['method'] == 'ai'
+        with authenticated_client.application.app_context():
+            from app.models import PendingEmbedding
+            PendingEmbedding.objects.delete()
+
+
+class TestSearch:
+    """Test search endpoints"""
+
+    def test_similar_submissions_are_scoped(self, authenticated_client, test_user, test_course, tmp_path, monkeypatch):
+        """Students only get their own submissions back, ranked by similarity"""
+        from app.services import embedding_service
+        from app.services.ai_service import ai_service
+
+        topics = {'sorting': [1.0, 0.0, 0.0], 'graphs': [0.0, 1.0, 0.0], 'parsing': [0.0, 0.0, 1.0]}
+
+        def fake_encode(texts):
+            rows = [next((vector for word, vector in topics.items() if word in text), [0.6, 0.8, 0.0]) for text in texts]
+            return np.array(rows, dtype=np.float32)
+
+        monkeypatch.setattr(embedding_service, 'enabled', True)
+        monkeypatch.setattr(embedding_service, 'store_dir', str(tmp_path))
+        monkeypatch.setattr(embedding_service, '_stores', {})
+        monkeypatch.setattr(embedding_service, '_indexes', {})
+        monkeypatch.setattr(ai_service, 'encode', fake_encode)
+
+        with authenticated_client.application.app_context():
+            from app.models import PendingEmbedding
+            user = User.objects(id=ObjectId(test_user)).first()
+            other = User(email='other@metropolia.fi', password_hash='x', name='Other', role='student')
+            other.save()
+            course = Course.objects(id=ObjectId(test_course)).first()
+            mine = {}
+            for title in ('sorting', 'graphs', 'sorting again'):
+                submission = Submission(user_id=user, course_id=course, assignment_title=title,
+                                        content=f'{title} homework', submission_type='code')
+                submission.save()
+                mine[title] = str(submission.id)
+            theirs = Submission(user_id=other, course_id=course, assignment_title='sorting',
+                                content='sorting homework', submission_type='code')
+            theirs.save()
+            assert embedding_service.run_pending() == 4
+
+        response = authenticated_client.get('/api/v1/search/similar?type=submissions&q=sorting&limit=2')
+        assert response.status_code == 200
+        results = json.loads(response.data)['data']
+        assert {r['id'] for r in results} == {mine['sorting'], mine['sorting again']}
+        assert results[0]['score'] == pytest.approx(1.0, abs=1e-3)
+
+        # Scopes too large to scan exactly are filtered by query, round by round
+        monkeypatch.setattr(sys.modules['app.services.embedding_service'], 'ANN_EXACT_FILTER_MAX', 0)
+        response = authenticated_client.get('/api/v1/search/similar?type=submissions&q=sorting&limit=2')
+        assert {r['id'] for r in json.loads(response.data)['data']} == {mine['sorting'], mine['sorting again']}
+        response = authenticated_client.get('/api/v1/search/similar?type=submissions&q=essay&limit=1')
+        assert [r['id'] for r in json.loads(response.data)['data']] == [mine['graphs']]
+
+        response = authenticated_client.get(f"/api/v1/search/similar?type=submissions&id={mine['sorting']}")
+        results = json.loads(response.data)['data']
+        assert [r['id'] for r in results][0] == mine['sorting again']
+        assert mine['sorting'] not in [r['id'] for r in results]
+
+        response = authenticated_client.get(f'/api/v1/search/similar?type=submissions&id={theirs.id}')
+        assert response.status_code == 404
+        response = authenticated_client.get('/api/v1/search/similar?type=quizzes&q=x')
+        assert response.status_code == 400
+
+        with authenticated_client.application.app_context():
+            PendingEmbedding.objects.delete()
+            other.delete()
+
+    def test_text_search_validates_and_scopes(self, authenticated_client, test_user, monkeypatch):
+        """/search rejects bad input and searches only the requested types for the current user"""
+        from app.services import search_service
+
+        calls = []
+
+        def fake_ranked(source, query, scope, after, limit):
+            calls.append((source, scope))
+            return []
+
+        monkeypatch.setattr(search_service, '_ranked', fake_ranked)
+        response = authenticated_client.get(
+            '/api/v1/search?q=sorting&type=flashcards,resources&department=Business %26 Economics'
+        )
+        assert response.status_code == 200
+        body = json.loads(response.data)
+        assert body['data'] == [] and body['has_more'] is False
+        assert calls == [
+            ('resources', {'department': {'$in': ['Business & Economics', 'All Departments']}}),
+            ('flashcards', {'user_id': ObjectId(test_user)}),
+        ]
+
+        assert authenticated_client.get('/api/v1/search?q=').status_code == 400
+        assert authenticated_client.get('/api/v1/search?q=x&type=quizzes').status_code == 400
+        assert authenticated_client.get('/api/v1/search?q=x&department=Nowhere').status_code == 400
+        assert authenticated_client.get('/api/v1/search?q=x&cursor=nope').status_code == 400
+
 
 class TestBookmarks:
     """Test bookmark endpoints"""
@@ -376,6 +624,36 @@ class TestBookmarks:
         if response.status_code in [200, 201]:
             data = json.loads(response.data)
             assert data.get('success', True) is True
+    
+    def test_list_bookmarks_resolves_references(self, authenticated_client, test_user, test_course):
+        """Prefetched references fill in titles; deleted targets are reported as such"""
+        from app.models import Bookmark, Flashcard, Resource
+        with authenticated_client.application.app_context():
+            user = User.objects(id=ObjectId(test_user)).first()
+            course = Course.objects(id=ObjectId(test_course)).first()
+            submission = Submission(
+                user_id=user, course_id=course, assignment_title='Bookmarked Work',
+                content='x', submission_type='code', status='reviewed'
+            ).save()
+            resource = Resource(title='Guide', url='https://example.com', category='python').save()
+            kept = Flashcard(user_id=user, front='Front side', back='Back side').save()
+            gone = Flashcard(user_id=user, front='Gone', back='Gone').save()
+            Bookmark(user_id=user, submission_id=submission, bookmark_type='submission').save()
+            Bookmark(user_id=user, resource_id=resource, bookmark_type='resource').save()
+            Bookmark(user_id=user, flashcard_id=kept, bookmark_type='flashcard').save()
+            Bookmark(user_id=user, flashcard_id=gone, bookmark_type='flashcard').save()
+            gone.delete()
+        
+        response = authenticated_client.get('/api/v1/bookmarks')
+        assert response.status_code == 200
+        items = {(b['type'], b['title']): b for b in json.loads(response.data)['data']}
+        
+        submission_item = items[('submission', 'Bookmarked Work')]
+        assert submission_item['subtitle'] == 'Test Course'
+        assert submission_item['metadata'] == {'status': 'reviewed', 'submission_type': 'code'}
+        assert items[('resource', 'Guide')]['link'] == 'https://example.com'
+        assert items[('flashcard', 'Front side')]['metadata'] == {'front': 'Front side', 'back': 'Back side'}
+        assert items[('flashcard', 'Deleted Flashcard')]['flashcard_id'] is None
 
 
 class TestNotifications:
@@ -402,3 +680,199 @@ class TestNotifications:
         """Test marking all notifications as read"""
         response = authenticated_client.post('/api/v1/notifications/read-all')
         assert response.status_code in [200, 204]
+    
+    def test_unread_count_tracks_writes(self, authenticated_client, test_user):
+        """The unread counter follows inserts, single reads and read-all without recounting"""
+        from app.models import Notification, NotificationCounter
+        with authenticated_client.application.app_context():
+            # Written before counters existed: the first read recounts
+            Notification._get_collection().insert_one({
+                'user_id': ObjectId(test_user), 'title': 'Legacy', 'message': 'm', 'is_read': False
+            })
+            first = Notification(user_id=ObjectId(test_user), title='One', message='m').save()
+            Notification.objects.insert([
+                Notification(user_id=ObjectId(test_user), title='Two', message='m'),
+                Notification(user_id=ObjectId(test_user), title='Read', message='m', is_read=True),
+            ], load_bulk=False)
+        
+        def unread():
+            return json.loads(authenticated_client.get('/api/v1/notifications/unread-count').data)['unread_count']
+        
+        assert unread() == 3
+        assert authenticated_client.post(f'/api/v1/notification/{first.id}/read').status_code == 200
+        assert authenticated_client.post(f'/api/v1/notification/{first.id}/read').status_code == 200
+        assert unread() == 2
+        with authenticated_client.application.app_context():
+            assert Notification.objects(id=first.id).first().read_at is not None
+        
+        authenticated_client.post('/api/v1/notifications/read-all')
+        assert unread() == 0
+        with authenticated_client.application.app_context():
+            NotificationCounter.objects.delete()
+    
+    def test_notify_many_deduplicates(self, client, test_user):
+        """Repeating a fan-out for the same related item notifies nobody twice"""
+        from app.models import Notification, NotificationCounter
+        from app.services import notification_inbox
+        with client.application.app_context():
+            other = User(email='other@metropolia.fi', name='Other', role='student', password_hash='x').save()
+            users = [test_user, other.id, test_user]
+            assert notification_inbox.notify_many(users, 'Title', 'Message', 'announcement', related_id='a1') == 2
+            assert notification_inbox.notify_many(users, 'Title', 'Message', 'announcement', related_id='a1') == 0
+            assert notification_inbox.notify_many(users, 'Title', 'Message', 'deadline', related_id='a1') == 2
+            assert Notification.objects(user_id=test_user).count() == 2
+            assert notification_inbox.unread_count(test_user) == 2
+            NotificationCounter.objects.delete()
+    
+    def test_announcement_broadcast(self, authenticated_teacher_client, test_user):
+        """Announcements notify every student of the department in one fan-out"""
+        from app.models import Announcement, Deadline, Notification, NotificationCounter
+        response = authenticated_teacher_client.post('/api/v1/teacher/announcements', json={
+            'title': 'Exam moved', 'content': 'The exam is now on Friday.', 'department': 'General Studies'
+        })
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['notified'] == 1
+        
+        response = authenticated_teacher_client.post('/api/v1/teacher/deadlines', json={
+            'title': 'Essay', 'due_date': '2030-05-01T12:00:00Z', 'department': 'General Studies'
+        })
+        assert json.loads(response.data)['notified'] == 1
+        
+        with authenticated_teacher_client.application.app_context():
+            types = sorted(n.notification_type for n in Notification.objects(user_id=test_user))
+            assert types == ['announcement', 'deadline']
+            Announcement.objects.delete()
+            Deadline.objects.delete()
+            NotificationCounter.objects.delete()
+        
+        response = authenticated_teacher_client.post('/api/v1/teacher/announcements', json={
+            'title': 'x', 'content': 'y', 'department': 'Nowhere'
+        })
+        assert response.status_code == 400
+    
+    def test_archive_notifications(self, client, test_user):
+        """Old notifications move to the archive and leave the unread count"""
+        from datetime import datetime, timedelta
+        from app.models import Notification, NotificationCounter
+        from app.services import notification_inbox
+        from app.services.notification_inbox import ARCHIVE_COLLECTION
+        with client.application.app_context():
+            old = datetime.utcnow() - timedelta(days=400)
+            Notification(user_id=ObjectId(test_user), title='Old', message='m', created_at=old).save()
+            Notification(user_id=ObjectId(test_user), title='New', message='m').save()
+            assert notification_inbox.unread_count(test_user) == 2
+            
+            assert notification_inbox.archive(older_than_days=180) == 1
+            archive = Notification._get_collection().database[ARCHIVE_COLLECTION]
+            assert [doc['title'] for doc in archive.find()] == ['Old']
+            assert [n.title for n in Notification.objects(user_id=test_user)] == ['New']
+            assert notification_inbox.unread_count(test_user) == 1
+            
+            archive.drop()
+            NotificationCounter.objects.delete()
+    
+    def test_stream_pushes_new_notifications(self, authenticated_client, test_user):
+        """A notification saved while the stream is open is pushed without waiting for a heartbeat"""
+        from app.models import Notification
+        from app.services import notification_hub
+        response = authenticated_client.get('/api/v1/notifications/stream')
+        assert response.mimetype == 'text/event-stream'
+        events = iter(response.response)
+        assert next(events).startswith(b'retry:')
+        assert notification_hub.connection_count() == 1
+        
+        with authenticated_client.application.app_context():
+            Notification(user_id=ObjectId(test_user), title='Hello', message='Pushed').save()
+            Notification.objects.insert([
+                Notification(user_id=ObjectId(test_user), title='Bulk', message='Inserted'),
+                Notification(user_id=ObjectId(), title='Other', message='Someone else'),
+            ], load_bulk=False)
+        
+        pushed = next(events).decode()
+        assert 'event: notification' in pushed and '"title": "Hello"' in pushed
+        assert '"title": "Bulk"' in next(events).decode()
+        response.close()
+        assert notification_hub.connection_count() == 0
+    
+    def test_subscription_buffer_is_bounded(self):
+        """Slow connections keep only the newest pushes and report what was dropped"""
+        from app.services.notification_hub import Subscription
+        subscription = Subscription('user', max_pending=2)
+        for value in range(5):
+            subscription.put(value)
+        assert subscription.get(timeout=0) == [3, 4]
+        assert subscription.take_dropped() == 3
+        assert subscription.get(timeout=0.01) == []
+
+
+class TestPeerAssignmentAPI:
+    """Test teacher bulk peer assignment"""
+    
+    def test_assign_requires_teacher(self, authenticated_client, test_course):
+        """Students cannot run bulk assignment"""
+        response = authenticated_client.post('/api/v1/teacher/peer-reviews/assign', json={'course_id': test_course})
+        assert response.status_code == 403
+    
+    def test_assign_course(self, authenticated_teacher_client, test_user, test_course):
+        """Teachers can assign reviewers for a whole course"""
+        with authenticated_teacher_client.application.app_context():
+            course = Course.objects(id=ObjectId(test_course)).first()
+            for i in range(3):
+                user = User(email=f'assign{i}@metropolia.fi', password_hash='x', name=f'Assign {i}', role='student')
+                user.save()
+                Submission(user_id=user, course_id=course, assignment_title='Lab 1',
+                           content='print(1)', submission_type='code').save()
+        
+        response = authenticated_teacher_client.post('/api/v1/teacher/peer-reviews/assign', json={
+            'course_id': test_course,
+            'peers_per_submission': 2
+        })
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['submissions'] == 3
+        assert data['assigned'] == 6
+
+
+class TestAvatarAPI:
+    """Test avatar upload and content-addressed serving"""
+    
+    def test_upload_and_serve(self, authenticated_client):
+        """Uploaded avatars are served by hash with immutable caching and ETags"""
+        from io import BytesIO
+        from app.models import Blob, BlobChunk
+        image = b'\x89PNG\r\n\x1a\n' + b'avatar' * 100
+        response = authenticated_client.post('/api/v1/user/avatar', data={
+            'avatar': (BytesIO(image), 'me.png')
+        }, content_type='multipart/form-data')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        avatar_hash = data['avatar_hash']
+        assert data['avatar_url'] == f'http://localhost/api/v1/avatars/{avatar_hash}'
+        
+        profile = json.loads(authenticated_client.get('/api/v1/user/profile').data)
+        assert profile['avatar_url'] == data['avatar_url']
+        
+        response = authenticated_client.get(data['avatar_url'])
+        assert response.status_code == 200
+        assert response.data == image
+        assert response.mimetype == 'image/png'
+        assert 'immutable' in response.headers['Cache-Control']
+        etag = response.headers['ETag']
+        
+        response = authenticated_client.get(data['avatar_url'], headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        
+        assert authenticated_client.get('/api/v1/avatars/' + '0' * 64).status_code == 404
+        assert authenticated_client.get('/api/v1/avatars/not-a-hash').status_code == 404
+        with authenticated_client.application.app_context():
+            Blob.objects.delete()
+            BlobChunk.objects.delete()
+    
+    def test_upload_rejects_other_types(self, authenticated_client):
+        """Only image extensions are accepted"""
+        from io import BytesIO
+        response = authenticated_client.post('/api/v1/user/avatar', data={
+            'avatar': (BytesIO(b'<html></html>'), 'page.html')
+        }, content_type='multipart/form-data')
+        assert response.status_code == 400
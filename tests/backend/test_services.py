@@ -0,0 +1,899 @@
+"""
+Tests for backend services
+"""
+import sys
+import pytest
+from datetime import datetime, timedelta
+from app.models import AIResponseCache
+from app.services.ai_cache import AIResponseCacheService
+
+
+class TestAIResponseCache:
+    """Test the two-tier AI response cache"""
+
+    def test_key_depends_on_prompt_model_and_config(self):
+        """Cache keys change with every input that changes the model output"""
+        key = AIResponseCacheService.make_key('prompt', 'model-a', {'temperature': 0.2})
+        assert key == AIResponseCacheService.make_key('prompt', 'model-a', {'temperature': 0.2})
+        assert key != AIResponseCacheService.make_key('prompt!', 'model-a', {'temperature': 0.2})
+        assert key != AIResponseCacheService.make_key('prompt', 'model-b', {'temperature': 0.2})
+        assert key != AIResponseCacheService.make_key('prompt', 'model-a', {'temperature': 0.7})
+
+    def test_set_and_get_round_trip(self, client):
+        """Stored responses are served from memory and then from MongoDB"""
+        with client.application.app_context():
+            AIResponseCache.objects.delete()
+            cache = AIResponseCacheService(ttl_seconds=60, max_entries=100, memory_entries=8, enabled=True)
+            key = cache.make_key('round trip', 'model-a')
+
+            cache.set(key, 'cached feedback', model_name='model-a')
+            assert cache.get(key) == 'cached feedback'
+
+            cache.clear_memory()
+            assert cache.get(key) == 'cached feedback'
+            assert AIResponseCache.objects(cache_key=key).first().hit_count == 1
+
+    def test_expired_entries_are_ignored(self, client):
+        """Entries past expires_at are not returned even before the TTL index removes them"""
+        with client.application.app_context():
+            AIResponseCache.objects.delete()
+            cache = AIResponseCacheService(ttl_seconds=60, max_entries=100, memory_entries=0, enabled=True)
+            key = cache.make_key('expired', 'model-a')
+            cache.set(key, 'stale feedback')
+            AIResponseCache.objects(cache_key=key).update_one(
+                set__expires_at=datetime.utcnow() - timedelta(seconds=1)
+            )
+
+            assert cache.get(key) is None
+
+    def test_persistent_tier_is_bounded(self, client):
+        """The MongoDB tier evicts least recently used entries beyond max_entries"""
+        with client.application.app_context():
+            AIResponseCache.objects.delete()
+            cache = AIResponseCacheService(ttl_seconds=60, max_entries=2, memory_entries=0, enabled=True)
+            keys = [cache.make_key(f'prompt {i}', 'model-a') for i in range(3)]
+            for i, key in enumerate(keys):
+                cache.set(key, f'feedback {i}')
+
+            assert AIResponseCache.objects.count() == 2
+            assert cache.get(keys[0]) is None
+            assert cache.get(keys[2]) == 'feedback 2'
+
+
+class TestFeedbackJobService:
+    """Test the MongoDB-backed feedback job queue"""
+
+    def _submission(self):
+        from app.models import Submission, User, Course
+        user = User(email='jobs@metropolia.fi', password_hash='x', name='Job User', role='student')
+        user.save()
+        course = Course(name='Jobs', code='JOB101', department='General Studies')
+        course.save()
+        submission = Submission(
+            user_id=user,
+            course_id=course,
+            assignment_title='Job Test',
+            content='x = 1',
+            submission_type='code'
+        )
+        submission.save()
+        return submission
+
+    def test_failed_jobs_retry_then_fail(self, client, monkeypatch):
+        """Failures are requeued with backoff until max_attempts is reached"""
+        from app.models import FeedbackJob
+        from app.services import ai_service
+        from app.services.feedback_job_service import FeedbackJobService
+
+        def explode(**kwargs):
+            raise RuntimeError('model unavailable')
+        monkeypatch.setattr(ai_service, 'generate_feedback', explode)
+
+        with client.application.app_context():
+            FeedbackJob.objects.delete()
+            service = FeedbackJobService(workers=0, max_attempts=2)
+            job = service.enqueue(self._submission())
+
+            assert service.run_pending() == 1
+            job.reload()
+            assert job.status == 'queued'
+            assert job.run_after > datetime.utcnow()
+            assert service.run_pending() == 0  # Still backing off
+
+            job.update(set__run_after=datetime.utcnow())
+            assert service.run_pending() == 1
+            job.reload()
+            assert job.status == 'failed'
+            assert job.attempts == 2
+            assert 'model unavailable' in job.error
+
+    def test_expired_lease_is_reclaimed(self, client):
+        """A job held by a dead worker becomes claimable once its lease expires"""
+        from app.models import FeedbackJob
+        from app.services.feedback_job_service import FeedbackJobService
+
+        with client.application.app_context():
+            FeedbackJob.objects.delete()
+            service = FeedbackJobService(workers=0, lease_seconds=60)
+            job = service.enqueue(self._submission())
+            assert service.enqueue(job.submission_id).id == job.id  # Active job is reused
+
+            assert service.claim('worker-a').id == job.id
+            assert service.claim('worker-b') is None
+
+            FeedbackJob.objects(id=job.id).update_one(
+                set__lease_expires_at=datetime.utcnow() - timedelta(seconds=1)
+            )
+            reclaimed = service.claim('worker-b')
+            assert reclaimed.id == job.id
+            assert reclaimed.worker_id == 'worker-b'
+            assert reclaimed.attempts == 2
+
+
+class TestFeedbackStreamFormatting:
+    """Test incremental bullet formatting of streamed feedback"""
+
+    def test_stream_matches_full_formatting(self):
+        """Any chunking of the response formats the same as the whole text"""
+        from app.services import ai_service
+        text = "\n  **Summary**\n- first point\n* second point\nplain - text\n-dash\n- last"
+        expected = ai_service._format_feedback(text.strip())
+        for size in (1, 2, 3, 7, len(text)):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            streamed = ''.join(ai_service._format_feedback_stream(chunks)).strip()
+            assert streamed == expected, size
+
+    def test_settled_prefix_is_emitted_before_newline(self):
+        """A partial line is forwarded once its bullet prefix is known"""
+        from app.services import ai_service
+        pieces = list(ai_service._format_feedback_stream(['- ', 'partial', ' line', '\n']))
+        assert pieces[0] == '• partial'
+
+
+class TestPlagiarismService:
+    """Test winnowing fingerprints and the MinHash LSH index"""
+
+    ORIGINAL = '''
+def total_price(items, tax_rate):
+    # Sum the prices and apply tax
+    subtotal = 0
+    for item in items:
+        subtotal += item["price"] * item["qty"]
+    if subtotal > 100:
+        subtotal = subtotal * 0.9
+    return subtotal * (1 + tax_rate)
+'''
+    RENAMED = '''
+def compute(cart, rate):
+    s = 0
+    for entry in cart:
+        s += entry["cost"] * entry["amount"]  # accumulate
+    if s > 250:
+        s = s * 0.8
+    return s * (1 + rate)
+'''
+    UNRELATED = '''
+class Stack:
+    def __init__(self):
+        self.data = []
+
+    def push(self, value):
+        self.data.append(value)
+
+    def pop(self):
+        return self.data.pop() if self.data else None
+'''
+
+    def test_renaming_does_not_change_fingerprint(self):
+        """Identifier, literal and comment changes normalise to the same tokens"""
+        from app.services import plagiarism_service
+        original = plagiarism_service.normalize(self.ORIGINAL, 'code')
+        assert original == plagiarism_service.normalize(self.RENAMED, 'code')
+        assert plagiarism_service.fingerprint(original) == plagiarism_service.fingerprint(original)
+
+    def test_minhash_estimates_jaccard(self):
+        """Signature agreement tracks the exact Jaccard similarity"""
+        from app.services import plagiarism_service
+        a = list(range(0, 1000))
+        b = list(range(500, 1500))
+        sig_a, sig_b = plagiarism_service.minhash(a), plagiarism_service.minhash(b)
+        estimate = float((sig_a == sig_b).mean())
+        assert abs(estimate - 1 / 3) < 0.12
+        assert len(plagiarism_service.lsh_buckets(sig_a)) == plagiarism_service.bands
+
+    def test_saved_submissions_are_indexed_and_matched(self, client):
+        """Submission.save() updates the index and checks find prior copies in the same assignment"""
+        from app.models import User, Course, Submission, PlagiarismFingerprint
+        from app.services import ai_service
+
+        with client.application.app_context():
+            PlagiarismFingerprint.objects.delete()
+            course = Course(name='Plagiarism', code='PLG101', department='General Studies')
+            course.save()
+
+            def submit(email, content):
+                user = User(email=email, password_hash='x', name=email.split('@')[0], role='student')
+                user.save()
+                submission = Submission(
+                    user_id=user, course_id=course, assignment_title='Prices',
+                    content=content, submission_type='code'
+                )
+                submission.save()
+                return submission
+
+            original = submit('first@metropolia.fi', self.ORIGINAL)
+            submit('other@metropolia.fi', self.UNRELATED)
+            copy = submit('copier@metropolia.fi', self.RENAMED)
+            assert PlagiarismFingerprint.objects.count() == 3
+
+            result = ai_service.check_plagiarism(submission=copy)
+            assert result['is_plagiarized'] is True
+            assert result['matches'][0]['submission_id'] == str(original.id)
+            assert result['matches'][0]['user_name'] == 'first'
+            assert all(m['submission_id'] != str(copy.id) for m in result['matches'])
+
+            # The original has no earlier submissions to have copied from
+            assert ai_service.check_plagiarism(submission=original)['matches'] == []
+
+            copy.delete()
+            assert PlagiarismFingerprint.objects.count() == 2
+
+
+class TestPlagiarismMatrix:
+    """Test the cohort-wide pairwise similarity matrix"""
+
+    def test_pairwise_jaccard_matches_python_sets(self):
+        """Chunked sparse scoring gives exact Jaccard for every overlapping pair"""
+        from app.core.similarity import pairwise_jaccard
+        sets = [[1, 2, 3, 4], [3, 4, 5, 6], [1, 2, 3, 4, 5], [100, 200], []]
+        pairs = pairwise_jaccard(sets, threshold=0.0, chunk_rows=2)
+
+        expected = {}
+        for a in range(len(sets)):
+            for b in range(a + 1, len(sets)):
+                shared = set(sets[a]) & set(sets[b])
+                if shared:
+                    expected[(a, b)] = len(shared) / len(set(sets[a]) | set(sets[b]))
+        assert {(a, b): pytest.approx(sim) for a, b, sim in pairs} == expected
+        assert pairs[0][:2] == (0, 2)  # Most similar first
+        assert pairwise_jaccard(sets, threshold=0.6) == [(0, 2, 0.8)]
+
+    def test_build_report_ranks_cross_student_pairs(self, client):
+        """Reports skip same-student pairs and flag copies above the threshold"""
+        from app.models import User, Course, Submission, PlagiarismReport
+        from app.services import plagiarism_service
+
+        with client.application.app_context():
+            course = Course(name='Matrix', code='MTX101', department='General Studies')
+            course.save()
+            users = []
+            for name in ('ann', 'ben', 'cat'):
+                user = User(email=f'{name}@metropolia.fi', password_hash='x', name=name, role='student')
+                user.save()
+                users.append(user)
+
+            contents = [
+                (users[0], TestPlagiarismService.ORIGINAL),
+                (users[0], TestPlagiarismService.ORIGINAL + '\nprint(total_price([], 0))\n'),
+                (users[1], TestPlagiarismService.RENAMED),
+                (users[2], TestPlagiarismService.UNRELATED),
+            ]
+            for user, content in contents:
+                Submission(user_id=user, course_id=course, assignment_title='Prices',
+                           content=content, submission_type='code').save()
+
+            report = plagiarism_service.build_report(course=course, threshold=0.5, min_similarity=0.1)
+            assert report.status == 'completed'
+            assert report.submission_count == 4
+            top = report.pairs[0]
+            assert {top['submission_a']['user_name'], top['submission_b']['user_name']} == {'ann', 'ben'}
+            assert top['suspicious'] is True
+            assert all(
+                p['submission_a']['user_id'] != p['submission_b']['user_id'] for p in report.pairs
+            )
+            assert PlagiarismReport.objects(id=report.id).first().suspicious_count >= 1
+
+            queued = plagiarism_service.enqueue_report(course=course, threshold=0.5, min_similarity=0.1)
+            assert queued.status == 'queued'
+            assert plagiarism_service.run_pending_reports() == 1
+            built = PlagiarismReport.objects(id=queued.id).first()
+            assert built.status == 'completed' and built.attempts == 1
+            assert built.pairs == report.pairs
+            assert plagiarism_service.run_pending_reports() == 0
+
+
+class TestPeerAssignment:
+    """Test balanced, capacity-limited reviewer assignment"""
+
+    def _cohort(self, size, department='General Studies'):
+        from app.models import User, Course, Submission
+        course = Course(name='Peers', code='PEER101', department=department)
+        course.save()
+        submissions = []
+        for i in range(size):
+            user = User(email=f'peer{i}@metropolia.fi', password_hash='x', name=f'peer{i}',
+                        role='student', department=department, skill_level=i / size)
+            user.save()
+            submission = Submission(user_id=user, course_id=course, assignment_title='Essay',
+                                    content=f'Essay {i}', submission_type='essay')
+            submission.save()
+            submissions.append(submission)
+        return submissions
+
+    def test_batch_assignment_is_balanced(self, client):
+        """Every reviewer gets the same load, nobody reviews themselves"""
+        from collections import Counter
+        from app.models import PeerReview, Notification
+        from app.services import peer_matching_service
+
+        with client.application.app_context():
+            submissions = self._cohort(6)
+            plan = peer_matching_service.assign_reviewers(
+                submissions, peers_per_submission=2, max_reviews_per_reviewer=2
+            )
+
+            owners = {str(s.id): str(s.user_id.id) for s in submissions}
+            assert all(len(reviewers) == 2 for reviewers in plan.values())
+            assert all(owners[sid] not in reviewers for sid, reviewers in plan.items())
+            load = Counter(r for reviewers in plan.values() for r in reviewers)
+            assert set(load.values()) == {2}
+            assert PeerReview.objects.count() == 12
+            assert Notification.objects(notification_type='review').count() == 12
+
+    def test_capacity_and_existing_reviews_are_respected(self, client):
+        """Reviewers at capacity are skipped and existing pairs are topped up, not duplicated"""
+        from app.models import PeerReview
+        from app.services import peer_matching_service
+
+        with client.application.app_context():
+            submissions = self._cohort(3)
+            first = peer_matching_service.assign_reviewers(
+                submissions[:1], peers_per_submission=1, max_reviews_per_reviewer=1
+            )
+            busy = first[str(submissions[0].id)][0]
+
+            second = peer_matching_service.assign_reviewers(
+                submissions, peers_per_submission=2, max_reviews_per_reviewer=1
+            )
+            assert busy not in [r for reviewers in second.values() for r in reviewers]
+            assert PeerReview.objects(submission_id=submissions[0].id).count() <= 2
+            pairs = [(str(r.submission_id.id), str(r.reviewer_id.id)) for r in PeerReview.objects]
+            assert len(pairs) == len(set(pairs))
+
+
+class TestPerformancePredictor:
+    """Test the incremental student feature store and predictions read from it"""
+
+    def _history(self):
+        from app.models import User, Course, Submission, Feedback
+        course = Course(name='Predict', code='PRED101')
+        course.save()
+        improving = User(email='improving@metropolia.fi', password_hash='x', name='Improving',
+                         role='student', skill_level=0.6)
+        idle = User(email='idle@metropolia.fi', password_hash='x', name='Idle', role='student')
+        improving.save()
+        idle.save()
+
+        start = datetime.utcnow() - timedelta(days=10)
+        for day, score in enumerate([0.2, 0.4, 0.8, 1.0]):
+            submission = Submission(user_id=improving, course_id=course, assignment_title=f'Lab {day}',
+                                    content='x', submission_type='code',
+                                    created_at=start + timedelta(days=day))
+            submission.save()
+            Feedback(submission_id=submission, feedback_text='ok', feedback_type='ai',
+                     scores={'correctness': score, 'quality': score}).save()
+            if day == 3:
+                Feedback(submission_id=submission, reviewer_id=idle, feedback_text='great',
+                         feedback_type='peer', scores={'overall': 0.9}).save()
+        Submission(user_id=improving, course_id=course, assignment_title='Unreviewed',
+                   content='x', submission_type='code').save()
+        return improving, idle
+
+    def test_features_follow_writes(self, client):
+        """Saves and deletes keep the stored aggregates equal to a full rebuild"""
+        from app.models import Course, Submission, Feedback, StudentFeatures
+        from app.services import student_feature_service, performance_predictor_service
+
+        with client.application.app_context():
+            StudentFeatures.objects.delete()
+            improving, idle = self._history()
+            students = [improving.to_mongo().to_dict(), idle.to_mongo().to_dict()]
+
+            features = performance_predictor_service._feature_matrix(students)
+            assert features['submission_count'].tolist() == [5, 0]
+            assert features['avg_score'][0] == pytest.approx((0.2 + 0.4 + 0.8 + 1.0 + 0.9) / 5)
+            assert features['improvement_trend'][0] > 0.3
+            assert features['peer_feedback_quality'][0] == pytest.approx(0.9)
+            assert features['completion_rate'][0] == pytest.approx(0.8)
+            unset = performance_predictor_service._feature_matrix([{'_id': idle.id, 'skill_level': None}])
+            assert unset['skill_level'].tolist() == [0.5]
+
+            Feedback.objects(feedback_type='peer').delete()
+            incremental = performance_predictor_service._feature_matrix(students)
+            assert incremental['peer_feedback_quality'][0] == 0
+
+            StudentFeatures.objects.delete()
+            student_feature_service.rebuild()
+            rebuilt = performance_predictor_service._feature_matrix(students)
+            for name, values in incremental.items():
+                assert values == pytest.approx(rebuilt[name]), name
+
+            # An empty store (existing deployment) is filled in on read and on the next write
+            StudentFeatures.objects.delete()
+            on_read = performance_predictor_service._feature_matrix(students)
+            for name, values in incremental.items():
+                assert values == pytest.approx(on_read[name]), name
+            StudentFeatures.objects.delete()
+            Submission(user_id=improving, course_id=Course.objects.first(), assignment_title='Late',
+                       content='x', submission_type='code').save()
+            assert StudentFeatures.objects(user_id=improving.id).first().submission_count == 6
+            StudentFeatures.objects.delete()
+
+    def test_predictions(self, client):
+        """Predictions are read from the feature store"""
+        from app.models import StudentFeatures
+        from app.services import performance_predictor_service
+
+        with client.application.app_context():
+            StudentFeatures.objects.delete()
+            improving, idle = self._history()
+
+            predictions = {p['student_id']: p for p in performance_predictor_service.predict_all_students()}
+            assert predictions[str(idle.id)]['factors'] == ['No submissions yet']
+            assert predictions[str(improving.id)]['risk_level'] == 'low'
+            assert performance_predictor_service.predict_student(str(improving.id)) == {
+                k: v for k, v in predictions[str(improving.id)].items() if k not in ('student_id', 'student_name')
+            }
+            StudentFeatures.objects.delete()
+
+
+class TestDepartmentProgress:
+    """Test server-side department progress aggregation and daily rollups"""
+
+    DEPARTMENT = 'Business & Economics'
+
+    def _activity(self):
+        from app.models import User, Course, Submission, Feedback, PeerReview
+        course = Course(name='Accounting', code='ACC101', department=self.DEPARTMENT)
+        course.save()
+        alice = User(email='alice@metropolia.fi', password_hash='x', name='Alice', role='student', department=self.DEPARTMENT)
+        bob = User(email='bob@metropolia.fi', password_hash='x', name='Bob', role='student', department=self.DEPARTMENT)
+        outsider = User(email='out@metropolia.fi', password_hash='x', name='Out', role='student')
+        for user in (alice, bob, outsider):
+            user.save()
+
+        now = datetime.utcnow()
+        old = Submission(user_id=alice, course_id=course, assignment_title='Ledger', content='x',
+                         submission_type='essay', status='reviewed', created_at=now - timedelta(days=30))
+        new = Submission(user_id=bob, course_id=course, assignment_title='Ledger', content='y',
+                         submission_type='essay', created_at=now)
+        again = Submission(user_id=alice, course_id=course, assignment_title='Budget', content='z',
+                           submission_type='essay', created_at=now)
+        ignored = Submission(user_id=outsider, course_id=course, assignment_title='Ledger', content='w',
+                             submission_type='essay', created_at=now)
+        for submission in (old, new, again, ignored):
+            submission.save()
+
+        Feedback(submission_id=old, feedback_text='ok', feedback_type='ai', scores={'a': 0.6, 'b': 0.8}).save()
+        Feedback(submission_id=new, feedback_text='ok', feedback_type='ai', scores={'a': 0.4}).save()
+        Feedback(submission_id=new, reviewer_id=alice, feedback_text='unscored', feedback_type='peer').save()
+        PeerReview(submission_id=new, reviewer_id=alice, status='completed').save()
+        PeerReview(submission_id=old, reviewer_id=bob, status='pending').save()
+        return new
+
+    def test_live_progress(self, client):
+        """Counts and averages come back from aggregations, excluding other departments"""
+        from app.services import department_progress_service
+
+        with client.application.app_context():
+            self._activity()
+            progress = department_progress_service.live_progress(self.DEPARTMENT)
+            assert progress['total_submissions'] == 3
+            assert progress['unique_students'] == 2
+            assert progress['total_feedbacks'] == 3
+            assert progress['average_score'] == pytest.approx((0.7 + 0.4) / 2 * 100)
+            assert progress['total_peer_reviews'] == 2
+            assert progress['completed_peer_reviews'] == 1
+            assert progress['pending_peer_reviews'] == 1
+            assert progress['status_breakdown'] == {'reviewed': 1, 'submitted': 2}
+            assert progress['recent_submissions'] == 2
+
+    def test_rollups_match_live_and_refresh_dirty_days(self, client):
+        """Rollups equal the live figures and pick up writes once their dirty days are refreshed"""
+        from app.models import User, Course, Submission, Feedback, DepartmentDailyRollup
+        from app.services import department_progress_service, peer_matching_service
+
+        with client.application.app_context():
+            DepartmentDailyRollup.objects.delete()
+            department_progress_service.rollups_enabled = True
+            try:
+                new = self._activity()
+                department_progress_service.refresh(self.DEPARTMENT, full=True)
+                assert DepartmentDailyRollup.objects(department=self.DEPARTMENT, dirty=True).count() == 0
+                assert department_progress_service.progress(self.DEPARTMENT) == \
+                    department_progress_service.live_progress(self.DEPARTMENT)
+
+                Feedback(submission_id=new, feedback_text='more', feedback_type='ai', scores={'a': 1.0}).save()
+                assert DepartmentDailyRollup.objects(department=self.DEPARTMENT, dirty=True).count() == 1
+                assert department_progress_service.progress(self.DEPARTMENT)['total_feedbacks'] == 3  # Read only sums
+                assert department_progress_service.refresh(self.DEPARTMENT) == 1
+                progress = department_progress_service.progress(self.DEPARTMENT)
+                assert progress['total_feedbacks'] == 4
+                assert progress == department_progress_service.live_progress(self.DEPARTMENT)
+
+                # Bulk-assigned reviews are inserted without post_save
+                peer_matching_service.assign_reviewers([new], peers_per_submission=2, notify=False)
+                assert DepartmentDailyRollup.objects(department=self.DEPARTMENT, dirty=True).count() == 1
+                department_progress_service.refresh(self.DEPARTMENT)
+                assert department_progress_service.progress(self.DEPARTMENT) == \
+                    department_progress_service.live_progress(self.DEPARTMENT)
+
+                # New students count as soon as they submit; backdated and deleted submissions move their day
+                course = Course.objects(code='ACC101').first()
+                alice = User.objects(email='alice@metropolia.fi').first()
+                carol = User(email='carol@metropolia.fi', password_hash='x', name='Carol', role='student',
+                             department=self.DEPARTMENT)
+                carol.save()
+                first = Submission(user_id=carol, course_id=course, assignment_title='Ledger', content='c',
+                                   submission_type='essay')
+                first.save()
+                assert department_progress_service.progress(self.DEPARTMENT)['unique_students'] == 3
+                earliest = Submission(user_id=alice, course_id=course, assignment_title='Audit', content='a',
+                                      submission_type='essay', created_at=datetime.utcnow() - timedelta(days=60))
+                earliest.save()
+                earliest.delete()
+                Submission(user_id=carol, course_id=course, assignment_title='Budget', content='d',
+                           submission_type='essay', created_at=datetime.utcnow() - timedelta(days=3)).save()
+                first.delete()
+                department_progress_service.refresh(self.DEPARTMENT)
+                assert department_progress_service.progress(self.DEPARTMENT) == \
+                    department_progress_service.live_progress(self.DEPARTMENT)
+            finally:
+                department_progress_service.rollups_enabled = False
+                DepartmentDailyRollup.objects.delete()
+
+    def test_unbuilt_rollups_are_served_live_until_refreshed(self, client):
+        """A department without rollups is aggregated live; the first refresh builds its whole history"""
+        from app.models import DepartmentDailyRollup
+        from app.services import department_progress_service
+
+        with client.application.app_context():
+            DepartmentDailyRollup.objects.delete()
+            self._activity()
+            department_progress_service.rollups_enabled = True
+            try:
+                assert department_progress_service.progress(self.DEPARTMENT) == \
+                    department_progress_service.live_progress(self.DEPARTMENT)
+                department_progress_service.refresh(self.DEPARTMENT)
+                assert DepartmentDailyRollup.objects(department=self.DEPARTMENT, refreshed_at=None).count() == 0
+                assert department_progress_service.progress(self.DEPARTMENT) == \
+                    department_progress_service.live_progress(self.DEPARTMENT)
+            finally:
+                department_progress_service.rollups_enabled = False
+                DepartmentDailyRollup.objects.delete()
+
+
+class TestUserIdentityCache:
+    """Test the cached Flask-Login user loader"""
+
+    def test_load_is_cached_and_invalidated_on_save(self, client):
+        """Repeat loads skip MongoDB until the user document is saved"""
+        from app.models import User
+        from app.services import user_cache as cache
+
+        with client.application.app_context():
+            user = User(email='cached@metropolia.fi', password_hash='x', name='Before', role='student')
+            user.save()
+            # Legacy inline avatar, not yet moved by migrate-avatars
+            User._get_collection().update_one({'_id': user.id}, {'$set': {'avatar_url': 'data:image/png;base64,' + 'A' * 1000}})
+
+            loaded = cache.load(str(user.id))
+            assert loaded.name == 'Before'
+            assert 'avatar_url' not in loaded.to_mongo()
+
+            # A write that bypasses signals is not seen while the entry is fresh
+            User._get_collection().update_one({'_id': user.id}, {'$set': {'name': 'Raw'}})
+            assert cache.load(user.id).name == 'Before'
+
+            # Saving through the model (as the profile endpoints do) invalidates it
+            loaded.name = 'After'
+            loaded.save()
+            assert cache.load(user.id).name == 'After'
+            # Excluded fields are untouched by saves of the projected document
+            assert User._get_collection().find_one({'_id': user.id})['avatar_url'].endswith('A' * 10)
+
+    def test_racing_load_is_not_cached(self, client, monkeypatch):
+        """A load that overlaps an invalidation does not store the stale document"""
+        from app.models import User
+        from app.services.user_cache import UserIdentityCache
+
+        with client.application.app_context():
+            cache = UserIdentityCache(ttl_seconds=60, max_entries=10)
+            user = User(email='race@metropolia.fi', password_hash='x', name='Race', role='student')
+            user.save()
+
+            collection = User._get_collection()
+
+            class Racing:
+                def find_one(self, *args, **kwargs):
+                    son = collection.find_one(*args, **kwargs)
+                    cache.invalidate(user.id)
+                    return son
+
+            monkeypatch.setattr(User, '_get_collection', classmethod(lambda cls: Racing()))
+            assert cache.load(user.id).email == 'race@metropolia.fi'
+            assert str(user.id) not in cache._entries
+            # Write tracking only lives as long as the load
+            assert cache._loading == {}
+
+
+class TestBlobStore:
+    """Test the content-addressed blob store and avatar migration"""
+
+    def test_chunked_round_trip_and_dedupe(self, client):
+        """Blobs are split into chunks, reassembled exactly and stored once"""
+        from app.models import Blob, BlobChunk
+        from app.services.blob_store import BlobStore
+
+        with client.application.app_context():
+            store = BlobStore(chunk_size=1000)
+            data = bytes(range(256)) * 10
+            blob_hash = store.put(data, 'application/octet-stream')
+            assert store.put(data) == blob_hash
+            assert Blob.objects(hash=blob_hash).count() == 1
+            assert BlobChunk.objects(blob_hash=blob_hash).count() == 3
+            assert store.get(blob_hash) == data
+            assert store.get('0' * 64) is None
+            Blob.objects.delete()
+            BlobChunk.objects.delete()
+
+    def test_migrate_inline_avatars(self, client):
+        """Inline data URLs move to the blob store and only the hash stays on the user"""
+        import base64
+        from app.models import User, Blob, BlobChunk
+        from app.services import avatar_service, blob_store
+
+        with client.application.app_context():
+            image = b'\x89PNG\r\n\x1a\n' + b'pixels' * 50
+            user = User(email='legacy@metropolia.fi', password_hash='x', name='Legacy', role='student')
+            user.save()
+            User._get_collection().update_one({'_id': user.id}, {'$set': {
+                'avatar_url': 'data:image/png;base64,' + base64.b64encode(image).decode()
+            }})
+
+            assert avatar_service.migrate_inline() == (1, 0)
+            raw = User._get_collection().find_one({'_id': user.id})
+            assert 'avatar_url' not in raw
+            assert raw['avatar_hash'] == blob_store.hash_bytes(image)
+            assert blob_store.get(raw['avatar_hash']) == image
+            Blob.objects.delete()
+            BlobChunk.objects.delete()
+
+
+class TestEmbeddings:
+    """Test the memory-mapped vector store and the embedding worker"""
+
+    def test_vector_store_round_trip(self, tmp_path):
+        """Vectors survive growth, are visible to a second reader and removals are reclaimed"""
+        import os
+        import numpy as np
+        from app.services.vector_store import VectorStore
+
+        rng = np.random.default_rng(7)
+        vectors = rng.normal(size=(1500, 8)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = [f'{i:024x}' for i in range(1500)]
+
+        writer = VectorStore(str(tmp_path))
+        writer.upsert(ids[:1000], vectors[:1000])
+        writer.upsert(ids[900:], vectors[900:])  # Overlap updates in place, the rest grows the files
+        reader = VectorStore(str(tmp_path))
+        assert len(reader) == 1500
+        assert reader.search(vectors[1200], k=1)[0][0] == ids[1200]
+        assert [doc_id for doc_id, _ in reader.search(vectors[5], k=1, doc_ids=ids[:10])] == [ids[5]]
+
+        assert writer.remove(ids[:500]) == 500
+        assert ids[0] not in reader and len(reader) == 1000
+        assert writer.compact() == 500
+        found, matrix = reader.get([ids[1499]])
+        assert found == [ids[1499]]
+        assert np.allclose(matrix[0], vectors[1499], atol=1e-3)
+        # Each rewrite is a new generation; only the current one and its predecessor are kept
+        generations = sorted(name for name in os.listdir(tmp_path) if name.startswith('gen-'))
+        assert generations == [f'gen-{writer.generation - 1:06d}', f'gen-{writer.generation:06d}']
+
+    def test_worker_encodes_queued_documents(self, client, tmp_path, monkeypatch):
+        """Writes are queued, encoded once per batch, skipped when unchanged and dropped on delete"""
+        import numpy as np
+        from app.models import Resource, PendingEmbedding
+        from app.services import embedding_service
+        from app.services.ai_service import ai_service
+
+        encoded = []
+
+        def fake_encode(texts):
+            encoded.append(len(texts))
+            return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+        monkeypatch.setattr(embedding_service, 'enabled', True)
+        monkeypatch.setattr(embedding_service, 'store_dir', str(tmp_path))
+        monkeypatch.setattr(embedding_service, '_stores', {})
+        monkeypatch.setattr(ai_service, 'encode', fake_encode)
+
+        with client.application.app_context():
+            resources = [Resource(title=f'Guide {i}', description='Recursion basics') for i in range(3)]
+            for resource in resources:
+                resource.save()
+            assert PendingEmbedding.objects(source='resources').count() == 3
+
+            assert embedding_service.run_pending() == 3
+            assert encoded == [3]
+            store = embedding_service.store('resources')
+            assert len(store) == 3 and store.dim == 2
+
+            resources[0].view_count = 5
+            resources[0].save()  # Text unchanged: queued, but not re-encoded
+            resources[1].delete()
+            assert embedding_service.run_pending() == 2
+            assert encoded == [3]
+            assert len(store) == 2 and str(resources[1].id) not in store
+            assert PendingEmbedding.objects.count() == 0
+
+    def test_worker_builds_index_once_and_searches_through_it(self, client, tmp_path, monkeypatch):
+        """Past ANN_MIN_VECTORS the index is trained once, then saved incrementally and used for search"""
+        import numpy as np
+        from app.models import Resource, PendingEmbedding
+        from app.services import embedding_service
+        from app.services.ai_service import ai_service
+        from app.services.ann_index import IVFIndex
+
+        def fake_encode(texts):
+            rows = [np.random.default_rng(sum(map(ord, text))).normal(size=8) for text in texts]
+            return np.array([row / np.linalg.norm(row) for row in rows], dtype=np.float32)
+
+        calls = {'build': 0, 'save': 0, 'search': 0}
+
+        def counting(name, method):
+            def wrapper(*args, **kwargs):
+                calls[name] += 1
+                return method(*args, **kwargs)
+            return wrapper
+
+        monkeypatch.setattr(sys.modules['app.services.embedding_service'], 'ANN_MIN_VECTORS', 20)
+        monkeypatch.setattr(embedding_service, 'enabled', True)
+        monkeypatch.setattr(embedding_service, 'store_dir', str(tmp_path))
+        monkeypatch.setattr(embedding_service, '_stores', {})
+        monkeypatch.setattr(embedding_service, '_indexes', {})
+        monkeypatch.setattr(embedding_service, 'build_index', counting('build', embedding_service.build_index))
+        monkeypatch.setattr(IVFIndex, 'save', counting('save', IVFIndex.save))
+        monkeypatch.setattr(IVFIndex, 'search', counting('search', IVFIndex.search))
+        monkeypatch.setattr(ai_service, 'encode', fake_encode)
+
+        with client.application.app_context():
+            for i in range(25):
+                Resource(title=f'Topic {i}', description=f'Notes on topic {i}').save()
+            embedding_service.run_pending()
+            assert calls['build'] == 1
+            assert IVFIndex(str(tmp_path / 'resources')).exists()
+
+            extra = Resource(title='Topic 99', description='Notes on topic 99')
+            extra.save()
+            embedding_service.run_pending()
+            assert calls['build'] == 1 and calls['save'] >= 1
+
+            query = embedding_service.vector_for('resources', extra.id)
+            assert embedding_service.search('resources', query, 1)[0][0] == str(extra.id)
+            assert calls['search'] == 1
+            PendingEmbedding.objects.delete()
+            Resource.objects.delete()
+
+    def test_ivf_index_matches_exact_search_and_updates(self, tmp_path):
+        """The IVF index finds exact neighbours, takes inserts and deletes, and survives a reopen"""
+        import numpy as np
+        from app.services.ann_index import IVFIndex, synthetic_vectors
+
+        vectors = synthetic_vectors(3200, 16, seed=3)
+        ids = [f'{i:024x}' for i in range(3200)]
+        index = IVFIndex(str(tmp_path), nprobe=8, delta_max_rows=150)
+        index.build(ids[:3000], vectors[:3000], nlist=30)
+        assert len(index) == 3000
+
+        hits = 0
+        for query in vectors[:50]:
+            exact = set(np.asarray(ids[:3000])[np.argsort(-(vectors[:3000] @ query))[:10]])
+            hits += len(exact.intersection(doc_id for doc_id, _ in index.search(query, 10)))
+        assert hits / 500 >= 0.9
+
+        index.add(ids[3000:3100], vectors[3000:3100])  # Held in the delta
+        index.remove([ids[0]])
+        index.save()
+        reader = IVFIndex(str(tmp_path))
+        assert len(reader) == 3099
+        assert reader.search(vectors[3050], 1)[0][0] == ids[3050]
+        assert ids[0] not in [doc_id for doc_id, _ in reader.search(vectors[0], 5)]
+        assert reader.exists() and not IVFIndex(str(tmp_path / 'missing')).exists()
+
+        index.add(ids[3100:], vectors[3100:])  # Delta passes delta_max_rows: lists are rebuilt
+        assert len(index._delta_ids) == 0 and len(index) == 3199
+        assert IVFIndex(str(tmp_path)).search(vectors[3150], 1)[0][0] == ids[3150]
+
+
+class TestTextSearch:
+    """Test full-text search snippets and result paging"""
+
+    def test_highlight_marks_stemmed_terms_and_phrases(self):
+        """Snippets mark word forms and phrases, skip excluded words and escape the text"""
+        from app.services.search_service import search_terms, highlight
+
+        terms = search_terms('Sorting "merge step" -heap')
+        assert terms == ['sorting', 'merge step']
+        text = 'Intro. ' + 'x ' * 200 + 'A <b>sorted</b> list comes out of the merge   step; heaps are not sorts.'
+        snippet = highlight(text, terms, width=80)
+        assert snippet.startswith('…')
+        assert '&lt;b&gt;<mark>sorted</mark>&lt;/b&gt;' in snippet
+        assert '<mark>merge step</mark>' in snippet
+        assert '<mark>heap' not in snippet
+        assert highlight('nothing relevant', terms) is None
+
+    def test_pages_merge_sources_in_score_order(self, monkeypatch):
+        """Cursor pages across sources, ties included, add up to the full ranking without repeats"""
+        from bson import ObjectId
+        from app.services import search_service
+        from app.services.search_service import encode_cursor
+        from app.exceptions.api_exceptions import ValidationError
+
+        docs = {
+            'resources': [{'_id': ObjectId(), 'score': score, 'title': f'r{score}'} for score in (3.0, 2.0, 2.0, 1.0)],
+            'flashcards': [{'_id': ObjectId(), 'score': score, 'front': f'f{score}'} for score in (2.0, 2.0, 0.5)],
+            'submissions': [{'_id': ObjectId(), 'score': 2.0, 'assignment_title': 's', 'content': 'sorting'}],
+        }
+
+        def applies(condition, doc):
+            # The subset of MongoDB filters SearchService._after builds
+            if '$or' in condition:
+                return any(applies(branch, doc) for branch in condition['$or'])
+            for field, value in condition.items():
+                if isinstance(value, dict):
+                    bound = value.get('$lt', value.get('$lte'))
+                    if not (doc[field] < bound or ('$lte' in value and doc[field] == bound)):
+                        return False
+                elif doc[field] != value:
+                    return False
+            return True
+
+        def fake_ranked(source, query, scope, after, limit):
+            rows = [doc for doc in docs[source] if after is None or applies(after, doc)]
+            rows.sort(key=lambda doc: doc['_id'], reverse=True)
+            rows.sort(key=lambda doc: -doc['score'])
+            return rows[:limit]
+
+        monkeypatch.setattr(search_service, '_ranked', fake_ranked)
+        user = type('User', (), {'id': ObjectId()})()
+
+        everything, _ = search_service.search(user, 'sorting', limit=100)
+        assert [r['score'] for r in everything] == [3.0, 2.0, 2.0, 2.0, 2.0, 2.0, 1.0, 0.5]
+        assert [r['type'] for r in everything[1:6]] == ['resource', 'resource', 'flashcard', 'flashcard', 'submission']
+        assert everything[5]['snippet'] == '<mark>sorting</mark>'
+
+        paged, cursor = [], None
+        while True:
+            page, cursor = search_service.search(user, 'sorting', cursor=cursor, limit=2)
+            paged += page
+            if not cursor:
+                break
+        assert [r['id'] for r in paged] == [r['id'] for r in everything]
+
+        # Paging stops at SEARCH_MAX_RESULTS, with a short last page
+        monkeypatch.setattr(sys.modules['app.services.search_service'], 'SEARCH_MAX_RESULTS', 5)
+        page, cursor = search_service.search(user, 'sorting', limit=3)
+        page, cursor = search_service.search(user, 'sorting', cursor=cursor, limit=3)
+        assert [r['id'] for r in page] == [r['id'] for r in everything[3:5]] and cursor is None
+
+        only, _ = search_service.search(user, 'sorting', sources=['flashcards'])
+        assert {r['type'] for r in only} == {'flashcard'}
+        with pytest.raises(ValidationError):
+            search_service.search(user, '   ')
+        with pytest.raises(ValidationError):
+            search_service.search(user, 'sorting', cursor='garbage')
+        with pytest.raises(ValidationError):  # A forged position would lift SEARCH_MAX_RESULTS
+            search_service.search(user, 'sorting', cursor=encode_cursor(2.0, 'resources', ObjectId(), -10 ** 6))
@@ -123,6 +123,64 @@ class TestSubmissionAPI:
         titles = [s.get('title') or s.get('assignment_title') for s in submissions]
         assert 'Test Assignment 1' in titles or any('Test Assignment 1' in str(s) for s in submissions)
     
+    def test_get_submissions_cursor_pages(self, authenticated_client, test_user, test_course):
+        """Cursor pages walk every submission exactly once, newest first, including same-timestamp ties"""
+        from datetime import datetime, timedelta
+        with authenticated_client.application.app_context():
+            user = User.objects(id=ObjectId(test_user)).first()
+            course = Course.objects(id=ObjectId(test_course)).first()
+            start = datetime(2024, 1, 1)
+            for i in range(7):
+                Submission(
+                    user_id=user,
+                    course_id=course,
+                    assignment_title=f'Paged {i}',
+                    content='x',
+                    submission_type='code',
+                    created_at=start + timedelta(minutes=i // 2)  # Pairs share a timestamp
+                ).save()
+        
+        seen, cursor = [], None
+        while True:
+            url = '/api/v1/submissions?limit=3' + (f'&cursor={cursor}' if cursor else '')
+            data = json.loads(authenticated_client.get(url).data)
+            assert len(data['data']) <= 3
+            seen.extend(s['title'] for s in data['data'])
+            cursor = data['next_cursor']
+            assert data['has_more'] is (cursor is not None)
+            if not cursor:
+                break
+        
+        assert sorted(seen) == sorted(f'Paged {i}' for i in range(7))
+        assert seen[0] == 'Paged 6' and set(seen[-2:]) == {'Paged 0', 'Paged 1'}
+        
+        response = authenticated_client.get('/api/v1/submissions?cursor=not-a-cursor')
+        assert response.status_code == 400
+        
+        # Without ?limit= the list keeps its pre-pagination size, so clients that ignore next_cursor see everything
+        with authenticated_client.application.app_context():
+            for i in range(7, 25):
+                Submission(user_id=user, course_id=course, assignment_title=f'Paged {i}',
+                           content='x', submission_type='code').save()
+        data = json.loads(authenticated_client.get('/api/v1/submissions').data)
+        assert len(data['data']) == 25 and data['has_more'] is False
+    
+    def test_get_submissions_projection(self, authenticated_teacher_client, test_submission):
+        """List rows omit content unless asked for and can be narrowed with fields="""
+        url = '/api/v1/submissions?department=General Studies'
+        rows = json.loads(authenticated_teacher_client.get(url).data)['data']
+        assert rows[0]['user_name'] == 'Test User'
+        assert rows[0]['department'] == 'General Studies'
+        assert 'content' not in rows[0]
+        
+        rows = json.loads(authenticated_teacher_client.get(url + '&include_content=true').data)['data']
+        assert rows[0]['content'] == 'Test submission content'
+        
+        rows = json.loads(authenticated_teacher_client.get(url + '&fields=title,status').data)['data']
+        assert set(rows[0]) == {'id', 'title', 'status'}
+        
+        assert authenticated_teacher_client.get(url + '&fields=password_hash').status_code == 400
+    
     def test_get_submissions_empty(self, authenticated_client):
         """Test getting submissions when user has none"""
         response = authenticated_client.get('/api/v1/submissions')
@@ -250,3 +308,133 @@ class TestSubmissionAPI:
         if response.status_code in [200, 201]:
             data = json.loads(response.data)
             assert data.get('success', True) is True
+    
+    def test_submit_files_stored_as_blobs(self, authenticated_client, test_user, test_course):
+        """File bodies live in the blob store once; the submission keeps only metadata"""
+        from app.models import Blob, BlobChunk
+        files = [
+            {'filename': 'main.py', 'content': 'print("hello")'},
+            {'filename': 'copy.py', 'content': 'print("hello")'},
+        ]
+        response = authenticated_client.post('/api/v1/submit', json={
+            'title': 'Files Assignment',
+            'files': files,
+            'course_id': test_course
+        })
+        assert response.status_code == 200
+        submission_id = json.loads(response.data)['submission_id']
+        
+        with authenticated_client.application.app_context():
+            raw = Submission._get_collection().find_one({'_id': ObjectId(submission_id)})
+            assert 'content' not in raw
+            assert all('file_content' not in f and f['size'] == 14 for f in raw['files'])
+            assert raw['files'][0]['content_hash'] == raw['files'][1]['content_hash']
+            assert Blob.objects.count() == 1
+        
+        data = json.loads(authenticated_client.get(f'/api/v1/submission/{submission_id}').data)
+        assert [f['content'] for f in data['submission']['files']] == ['print("hello")'] * 2
+        assert data['submission']['content'] == '=== FILE: main.py ===\nprint("hello")\n\n=== FILE: copy.py ===\nprint("hello")'
+        
+        response = authenticated_client.get(f'/api/v1/submission/{submission_id}/files/1')
+        assert response.status_code == 200
+        assert response.data == b'print("hello")'
+        response = authenticated_client.get(
+            f'/api/v1/submission/{submission_id}/files/1', headers={'If-None-Match': response.headers['ETag']}
+        )
+        assert response.status_code == 304
+        assert authenticated_client.get(f'/api/v1/submission/{submission_id}/files/2').status_code == 404
+        
+        with authenticated_client.application.app_context():
+            Blob.objects.delete()
+            BlobChunk.objects.delete()
+    
+    def test_migrate_inline_files(self, authenticated_client, test_user, test_course):
+        """Embedded file bodies move to the blob store and the duplicated content is dropped"""
+        from app.models import Blob, BlobChunk
+        from app.services.submission_storage import migrate_inline_files, submission_content
+        with authenticated_client.application.app_context():
+            combined = '=== FILE: a.py ===\nx = 1'
+            submission_id = Submission._get_collection().insert_one({
+                'user_id': ObjectId(test_user),
+                'course_id': ObjectId(test_course),
+                'assignment_title': 'Legacy',
+                'content': combined,
+                'files': [{'filename': 'a.py', 'file_content': 'x = 1', 'file_type': 'py'}],
+            }).inserted_id
+            
+            assert migrate_inline_files() == 1
+            assert migrate_inline_files() == 0
+            
+            raw = Submission._get_collection().find_one({'_id': submission_id})
+            assert 'content' not in raw
+            assert raw['files'][0]['content_hash'] == Blob.objects.first().hash
+            assert submission_content(Submission.objects(id=submission_id).first()) == combined
+            
+            Blob.objects.delete()
+            BlobChunk.objects.delete()
+
+
+class TestFeedbackJobAPI:
+    """Test queued AI feedback generation"""
+    
+    def test_submit_enqueues_feedback_job(self, authenticated_client, test_user, test_course):
+        """Submitting with generate_feedback returns a job id instead of blocking"""
+        from app.models import Feedback, FeedbackJob
+        from app.services import feedback_job_service
+        
+        response = authenticated_client.post('/api/v1/submit', json={
+            'title': 'Queued Feedback',
+            'content': 'print("hello")',
+            'type': 'code',
+            'course_id': test_course,
+            'generate_feedback': True
+        })
+        data = json.loads(response.data)
+        assert data['success'] is True
+        assert data['job_id']
+        assert data['feedback'] is None
+        
+        with authenticated_client.application.app_context():
+            FeedbackJob.objects(id__ne=ObjectId(data['job_id'])).delete()
+            job = FeedbackJob.objects(id=ObjectId(data['job_id'])).first()
+            assert job.status == 'queued'
+            
+            assert feedback_job_service.run_pending() == 1
+            assert Feedback.objects(
+                submission_id=ObjectId(data['submission_id']), feedback_type='ai'
+            ).count() == 1
+        
+        response = authenticated_client.get(f"/api/v1/jobs/{data['job_id']}")
+        assert response.status_code == 200
+        job_data = json.loads(response.data)['job']
+        assert job_data['status'] == 'completed'
+        assert job_data['feedback']
+    
+    def test_get_unknown_job(self, authenticated_client):
+        """Unknown job ids return 404"""
+        response = authenticated_client.get(f'/api/v1/jobs/{ObjectId()}')
+        assert response.status_code == 404
+    
+    def test_generate_feedback_stream(self, authenticated_client, test_user, test_course):
+        """The streaming endpoint sends chunk events and stores the final feedback"""
+        from app.models import Feedback
+        
+        response = authenticated_client.post('/api/v1/submit', json={
+            'title': 'Streamed Feedback',
+            'content': 'print("hello")',
+            'type': 'code',
+            'course_id': test_course
+        })
+        submission_id = json.loads(response.data)['submission_id']
+        
+        response = authenticated_client.get(f'/api/v1/generate-feedback/stream?submission_id={submission_id}')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        body = response.get_data(as_text=True)
+        assert 'event: chunk' in body
+        assert 'event: done' in body
+        
+        with authenticated_client.application.app_context():
+            feedback = Feedback.objects(submission_id=ObjectId(submission_id), feedback_type='ai').first()
+            assert feedback is not None
+            assert feedback.feedback_text in body.replace('\\n', '\n')